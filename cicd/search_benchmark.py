@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+
+"""
+Benchmarks scoring search candidates with :class:`sublime_music.adapters.fuzzy.top_k`
+against scoring them one at a time with ``fuzz.partial_ratio`` (which is what
+``SearchResult`` used to do through ``thefuzz``, a thin wrapper around RapidFuzz).
+
+Each query in a simulated type-ahead session is scored against 10k, 100k, and 500k
+candidates made up of a title and an artist name.
+"""
+
+import random
+import string
+import sys
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from rapidfuzz import fuzz
+
+from sublime_music.adapters import fuzzy
+
+QUERIES = ("r", "ra", "rad", "radi", "radio", "radioh", "radiohe", "radiohead")
+SIZES = (10_000, 100_000, 500_000)
+
+
+def make_choices(n: int) -> List[Tuple[str, str]]:
+    rng = random.Random(n)
+
+    def word() -> str:
+        return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+
+    artists = [" ".join(word() for _ in range(rng.randint(1, 3))) for _ in range(n // 20)]
+    artists.append("Radiohead")
+    return [
+        (" ".join(word() for _ in range(rng.randint(1, 5))).title(), rng.choice(artists))
+        for _ in range(n)
+    ]
+
+
+def one_at_a_time(query: str, choices: Sequence[Sequence[Optional[str]]]):
+    query = query.lower()
+    results = []
+    for i, choice in enumerate(choices):
+        score = max(fuzz.partial_ratio(query, s.lower()) for s in choice if s)
+        if score >= 60:
+            results.append((score, i))
+    results.sort(key=lambda r: r[0], reverse=True)
+    return results[:20]
+
+
+def batch(query: str, fields: Sequence[Sequence[Optional[str]]]):
+    return fuzzy.top_k(query, fields, 20)
+
+
+def time_session(
+    score: Callable[[str, Sequence[Sequence[Optional[str]]]], object],
+    choices: Sequence[Sequence[Optional[str]]],
+) -> float:
+    start = time.perf_counter()
+    for query in QUERIES:
+        score(query, choices)
+    return (time.perf_counter() - start) / len(QUERIES)
+
+
+sizes = [int(s) for s in sys.argv[1:]] or SIZES
+print(f"{'candidates':>10}  {'one at a time':>14}  {'batch':>10}  {'speedup':>7}")
+for size in sizes:
+    choices = make_choices(size)
+    slow = time_session(one_at_a_time, choices)
+    fast = time_session(batch, list(zip(*choices)))
+    print(f"{size:>10}  {slow * 1000:>11.1f} ms  {fast * 1000:>7.1f} ms  {slow / fast:>6.1f}x")
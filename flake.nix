@@ -35,7 +35,6 @@
 
             propagatedBuildInputs = with pkgs.python3Packages; [
               bleach
-              bottle
               dataclasses-json
               deepdiff
               keyring
@@ -45,9 +44,9 @@
               pygobject3
               python-dateutil
               python-Levenshtein
+              rapidfuzz
               requests
               semver
-              thefuzz
             ];
 
             # hook for gobject-introspection doesn't like strictDeps
@@ -5,6 +5,7 @@ from .adapter_base import (
     CachingAdapter,
     ConfigurationStore,
     SongCacheStatus,
+    SongFileVariant,
     UIInfo,
 )
 from .configure_server_form import ConfigParamDescriptor, ConfigureServerForm
@@ -23,5 +24,6 @@ __all__ = (
     "Result",
     "SearchResult",
     "SongCacheStatus",
+    "SongFileVariant",
     "UIInfo",
 )
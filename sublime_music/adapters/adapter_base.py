@@ -21,7 +21,20 @@ except Exception:
     keyring_imported = False
 
 from ..util import this_decade
-from .api_objects import Album, Artist, Directory, Genre, Playlist, PlayQueue, SearchResult, Song
+from .api_objects import (
+    Album,
+    AlbumRecord,
+    AlbumRecordPage,
+    Artist,
+    ArtistRecord,
+    Directory,
+    Genre,
+    Playlist,
+    PlaylistRecord,
+    PlayQueue,
+    SearchResult,
+    Song,
+)
 
 
 class SongCacheStatus(Enum):
@@ -46,6 +59,43 @@ class SongCacheStatus(Enum):
     CACHED_STALE = 4
 
 
+@dataclass(frozen=True)
+class SongFileVariant:
+    """
+    A version of a song file. By default, this is the original file. Other variants are
+    transcoded by the server to the given format and/or bit rate.
+
+    **Fields:**
+
+    * :class:`SongFileVariant.format` -- the format to transcode to (for example,
+      ``mp3`` or ``opus``), or ``None`` to keep the original format
+    * :class:`SongFileVariant.max_bit_rate` -- the maximum bit rate in kbps, or ``None``
+      to keep the original bit rate
+    """
+
+    format: Optional[str] = None
+    max_bit_rate: Optional[int] = None
+
+    @property
+    def is_original(self) -> bool:
+        return self.format is None and self.max_bit_rate is None
+
+    def is_better_than(self, other: "SongFileVariant") -> bool:
+        """
+        Whether this variant has a higher quality than ``other``. The original is better
+        than any transcoded variant, and otherwise a higher bit rate is better.
+        """
+        if self.is_original or other.is_original:
+            return self.is_original and not other.is_original
+        return (self.max_bit_rate or float("inf")) > (other.max_bit_rate or float("inf"))
+
+    def __str__(self) -> str:
+        if self.is_original:
+            return "original"
+        bit_rate = f"{self.max_bit_rate} kbps" if self.max_bit_rate else "original bit rate"
+        return f"{self.format or 'original format'} at {bit_rate}"
+
+
 @dataclass
 class AlbumSearchQuery:
     """
@@ -560,6 +610,13 @@ class Adapter(abc.ABC):
         """
         return False
 
+    @property
+    def can_search_page(self) -> bool:
+        """
+        Whether or not the adapter supports :class:`search_page`.
+        """
+        return False
+
     # Data Retrieval Methods
     # These properties determine if what things the adapter can be used to do
     # at the current moment.
@@ -645,7 +702,12 @@ class Adapter(abc.ABC):
         """
         raise self._check_can_error("get_cover_art_uri")
 
-    def get_song_file_uri(self, song_id: str, schemes: Iterable[str]) -> str:
+    def get_song_file_uri(
+        self,
+        song_id: str,
+        schemes: Iterable[str],
+        variant: Optional[SongFileVariant] = None,
+    ) -> str:
         """
         Get a URI for a given song. This URI must give the full file.
 
@@ -653,19 +715,40 @@ class Adapter(abc.ABC):
         :param schemes: A set of URI schemes that can be returned. It is guaranteed that
             all of the items in ``schemes`` will be one of the schemes returned by
             :class:`supported_schemes`.
+        :param variant: The variant of the song file to get (see
+            :class:`preferred_song_file_variant`). ``None`` means the original. Caching
+            adapters return the variant that they have, but raise a
+            :class:`CacheMissError` (with the URI as the partial data) if it's worse than
+            ``variant``. If ``variant`` is ``None``, any cached variant is returned.
         :returns: The URI for the given song.
         """
         raise self._check_can_error("get_song_file_uri")
 
-    def get_song_stream_uri(self, song_id: str) -> str:
+    def get_song_stream_uri(
+        self,
+        song_id: str,
+        variant: Optional[SongFileVariant] = None,
+    ) -> str:
         """
         Get a URI for streaming the given song.
 
         :param song_id: The ID of the song to get the stream URI for.
+        :param variant: The variant of the song file to stream (see
+            :class:`preferred_song_file_variant`). ``None`` means the original.
         :returns: the stream URI for the given song.
         """
         raise self._check_can_error("get_song_stream_uri")
 
+    def preferred_song_file_variant(self) -> SongFileVariant:
+        """
+        The variant in which songs should be streamed and downloaded under the current
+        network conditions. For example, an adapter may prefer a lower bit rate when the
+        network connection is metered.
+
+        By default, this is the original.
+        """
+        return SongFileVariant()
+
     def get_song_details(self, song_id: str) -> Song:
         """
         Get the details for a given song ID.
@@ -697,7 +780,8 @@ class Adapter(abc.ABC):
         Get a list of all of the artists known to the adapter.
 
         :returns: A list of all of the :class:`sublime_music.adapter.api_objects.Artist`
-            objects known to the adapter.
+            objects known to the adapter. Caching adapters must return them sorted by
+            name, ignoring the ignored articles (see :class:`get_ignored_articles`).
         """
         raise self._check_can_error("get_artists")
 
@@ -758,7 +842,8 @@ class Adapter(abc.ABC):
             filesystem tree.
         :returns: A list of the :class:`sublime_music.adapter.api_objects.Directory` and
             :class:`sublime_music.adapter.api_objects.Song` objects in the given
-            directory.
+            directory. Caching adapters must return the children sorted by name,
+            ignoring the ignored articles (see :class:`get_ignored_articles`).
         """
         raise self._check_can_error("get_directory")
 
@@ -806,6 +891,26 @@ class Adapter(abc.ABC):
         """
         raise self._check_can_error("search")
 
+    def search_page(
+        self,
+        query: str,
+        result_type: str,
+        offset: int,
+        count: int,
+    ) -> SearchResult:
+        """
+        Return one page of the search results of a single type for the given query.
+
+        :param query: The query string.
+        :param result_type: The type of results to return. One of ``"artists"``,
+            ``"albums"``, or ``"songs"``.
+        :param offset: The number of results of the type to skip.
+        :param count: The maximum number of results to return.
+        :returns: A :class:`sublime_music.adapters.api_objects.SearchResult` object
+            containing only results of the given type.
+        """
+        raise self._check_can_error("search_page")
+
     @staticmethod
     def _check_can_error(method_name: str) -> NotImplementedError:
         return NotImplementedError(
@@ -931,3 +1036,161 @@ class CachingAdapter(Adapter):
         :returns: A dictionary of song ID to :class:`SongCacheStatus` objects for each
             of the songs.
         """
+
+    # Record Retrieval Methods
+    # ==================================================================================
+    # These return lightweight projections of the corresponding list retrieval methods.
+    # The default implementations project the full objects, but caching adapters should
+    # override them to only read the necessary fields. They must raise a
+    # ``CacheMissError`` in the same situations as the corresponding full methods.
+    @property
+    def can_get_artist_records(self) -> bool:
+        return self.can_get_artists
+
+    @property
+    def can_get_album_records(self) -> bool:
+        return self.can_get_albums
+
+    @property
+    def can_get_album_records_page(self) -> bool:
+        return self.can_get_albums
+
+    @property
+    def can_get_album_index(self) -> bool:
+        return self.can_get_albums
+
+    @property
+    def can_get_playlist_records(self) -> bool:
+        return self.can_get_playlists
+
+    def get_artist_records(self) -> Sequence[ArtistRecord]:
+        """
+        :returns: the same artists as :class:`get_artists` as
+            :class:`sublime_music.adapters.api_objects.ArtistRecord` objects.
+        """
+        return [ArtistRecord.from_object(a) for a in self.get_artists()]
+
+    def get_album_records(
+        self, query: AlbumSearchQuery, sort_direction: str = "ascending"
+    ) -> Sequence[AlbumRecord]:
+        """
+        :returns: the same albums as :class:`get_albums` as
+            :class:`sublime_music.adapters.api_objects.AlbumRecord` objects.
+        """
+        return [AlbumRecord.from_object(a) for a in self.get_albums(query, sort_direction)]
+
+    def get_album_records_page(
+        self,
+        query: AlbumSearchQuery,
+        offset: int,
+        limit: int,
+        sort_direction: str = "ascending",
+    ) -> AlbumRecordPage:
+        """
+        Get a page of the albums of :class:`get_album_records`. Caching adapters should
+        override this to only read the albums on the page.
+
+        :param query: the query to get the albums of.
+        :param offset: the index of the first album of the page.
+        :param limit: the maximum number of albums on the page.
+        :param sort_direction: the direction to sort the albums.
+        :returns: the page of albums along with the total number of albums matching the
+            query.
+        """
+
+        def to_page(albums: Sequence[AlbumRecord]) -> AlbumRecordPage:
+            return AlbumRecordPage(albums[offset : offset + limit], len(albums))
+
+        try:
+            return to_page(self.get_album_records(query, sort_direction))
+        except CacheMissError as e:
+            raise CacheMissError(
+                partial_data=to_page(e.partial_data) if e.partial_data is not None else None
+            )
+
+    def get_album_index(
+        self,
+        query: AlbumSearchQuery,
+        album_id: str,
+        sort_direction: str = "ascending",
+    ) -> Optional[int]:
+        """
+        Get the position of an album in the albums of :class:`get_album_records`, so that
+        the page which contains it can be retrieved. Caching adapters should override
+        this to avoid reading all of the albums.
+
+        :param query: the query to find the album in.
+        :param album_id: the ID of the album to find.
+        :param sort_direction: the direction to sort the albums.
+        :returns: the index of the album, or ``None`` if the query doesn't return it.
+        """
+
+        def index_of(albums: Sequence[AlbumRecord]) -> Optional[int]:
+            return next((i for i, a in enumerate(albums) if a.id == album_id), None)
+
+        try:
+            return index_of(self.get_album_records(query, sort_direction))
+        except CacheMissError as e:
+            raise CacheMissError(
+                partial_data=index_of(e.partial_data) if e.partial_data is not None else None
+            )
+
+    def get_playlist_records(self) -> Sequence[PlaylistRecord]:
+        """
+        :returns: the same playlists as :class:`get_playlists` as
+            :class:`sublime_music.adapters.api_objects.PlaylistRecord` objects.
+        """
+        return [PlaylistRecord.from_object(p) for p in self.get_playlists()]
+
+    # Play History Methods
+    # ==================================================================================
+    def record_song_play(self, song_id: str, source: Optional[str] = None):
+        """
+        Record that the given song was played. Caching adapters can use the play history
+        to decide which songs are worth persisting (see :class:`should_admit_song_file`)
+        and which songs are likely to be played next (see :class:`predict_song_plays`).
+
+        :param song_id: the ID of the song that was played.
+        :param source: where the song was played from, for example ``playlist:<id>`` or
+            ``album:<id>``.
+        """
+
+    def predict_song_plays(self, song_id: Optional[str], count: int) -> Sequence[str]:
+        """
+        Predict which songs are likely to be played next based on the play history.
+
+        By default, nothing is predicted.
+
+        :param song_id: the ID of the song that is playing, or ``None`` to predict which
+            songs are likely to be played first if playback is started now.
+        :param count: the maximum number of songs to return.
+        :returns: the IDs of the predicted songs, most likely first.
+        """
+        return []
+
+    def get_cached_song_file_variant(self, song_id: str) -> Optional[SongFileVariant]:
+        """
+        Get the variant of the cached song file. Song files are ingested with the
+        variant that they were downloaded in (the optional fourth item of the
+        ``SONG_FILE`` data), and a cached file is only replaced by a better variant (see
+        :class:`SongFileVariant.is_better_than`).
+
+        By default, this is ``None``.
+
+        :param song_id: the ID of the song.
+        :returns: the variant of the cached song file, or ``None`` if the song file is
+            not cached.
+        """
+        return None
+
+    def should_admit_song_file(self, song_id: str) -> bool:
+        """
+        Returns whether or not a song file that was only downloaded because it was
+        streamed (or prefetched) should be persisted to the cache. If this returns
+        ``False``, the file will only be kept in a short-lived download buffer.
+
+        By default, every song file is admitted.
+
+        :param song_id: the ID of the song to check.
+        """
+        return True
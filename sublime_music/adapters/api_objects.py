@@ -2,15 +2,14 @@
 Defines the objects that are returned by adapter methods.
 """
 import abc
-import logging
 from datetime import datetime, timedelta
-from functools import lru_cache, partial
 from typing import (
     Any,
     Callable,
     Dict,
     Iterable,
     List,
+    NamedTuple,
     Optional,
     Sequence,
     Tuple,
@@ -19,7 +18,7 @@ from typing import (
     cast,
 )
 
-from thefuzz import fuzz
+from . import fuzzy
 
 
 class Genre(abc.ABC):
@@ -124,19 +123,101 @@ class PlayQueue(abc.ABC):
     current_index: Optional[int]
 
 
-@lru_cache(maxsize=8192)
-def similarity_ratio(query: str, string: str) -> int:
-    """
-    Return the :class:`thefuzz.fuzz.partial_ratio` between the ``query`` and
-    the given ``string``.
+# Records
+# =============================================================================
+# Records are lightweight, read-only projections of the objects above which only contain
+# the fields that list views need. They can be read much more cheaply than the full
+# objects, and are compatible with them for the fields that they do contain.
+class RelatedRecord(NamedTuple):
+    """A reference to a related object (for example, the artist of an album)."""
 
-    This ends up being called quite a lot, so the result is cached in an LRU
-    cache using :class:`functools.lru_cache`.
+    id: Optional[str]
+    name: Optional[str]
+
+    @staticmethod
+    def from_object(obj: Optional[Union[Album, Artist, Genre]]) -> Optional["RelatedRecord"]:
+        if obj is None:
+            return None
+        # Genres don't have IDs.
+        return RelatedRecord(getattr(obj, "id", None), obj.name)
+
+
+class ArtistRecord(NamedTuple):
+    id: Optional[str]
+    name: str
+    album_count: Optional[int]
+    artist_image_url: Optional[str]
+
+    @staticmethod
+    def from_object(artist: Artist) -> "ArtistRecord":
+        return ArtistRecord(artist.id, artist.name, artist.album_count, artist.artist_image_url)
 
-    :param query: the query string
-    :param string: the string to compare to the query string
-    """
-    return fuzz.partial_ratio(query, string)
+
+class AlbumRecord(NamedTuple):
+    id: Optional[str]
+    name: str
+    cover_art: Optional[str]
+    year: Optional[int]
+    duration: Optional[timedelta]
+    artist: Optional[RelatedRecord]
+    genre: Optional[RelatedRecord]
+
+    @staticmethod
+    def from_object(album: Album) -> "AlbumRecord":
+        return AlbumRecord(
+            album.id,
+            album.name,
+            album.cover_art,
+            album.year,
+            album.duration,
+            RelatedRecord.from_object(album.artist),
+            RelatedRecord.from_object(album.genre),
+        )
+
+
+class AlbumRecordPage(NamedTuple):
+    """A page of the albums of an album query."""
+
+    albums: Sequence[AlbumRecord]
+    total: int
+
+
+class SongRecord(NamedTuple):
+    id: str
+    title: str
+    cover_art: Optional[str]
+    duration: Optional[timedelta]
+    artist: Optional[RelatedRecord]
+    album: Optional[RelatedRecord]
+
+    @staticmethod
+    def from_object(song: Song) -> "SongRecord":
+        return SongRecord(
+            song.id,
+            song.title,
+            song.cover_art,
+            song.duration,
+            RelatedRecord.from_object(song.artist),
+            RelatedRecord.from_object(song.album),
+        )
+
+
+class PlaylistRecord(NamedTuple):
+    id: str
+    name: str
+    song_count: Optional[int]
+    duration: Optional[timedelta]
+    cover_art: Optional[str]
+
+    @staticmethod
+    def from_object(playlist: Playlist) -> "PlaylistRecord":
+        return PlaylistRecord(
+            playlist.id,
+            playlist.name,
+            playlist.song_count,
+            playlist.duration,
+            playlist.cover_art,
+        )
 
 
 class SearchResult:
@@ -147,9 +228,8 @@ class SearchResult:
 
     def __init__(self, query: Optional[str] = None):
         self.query = query
-        self.similiarity_partial = partial(
-            similarity_ratio, self.query.lower() if self.query else ""
-        )
+        # The maximum number of results of each type to return.
+        self.result_limit = 20
         self._artists: Dict[str, Artist] = {}
         self._albums: Dict[str, Album] = {}
         self._songs: Dict[str, Song] = {}
@@ -177,42 +257,54 @@ class SearchResult:
 
     _S = TypeVar("_S")
 
+    def _fields(self) -> Dict[str, Tuple[Callable[[Any], Optional[str]], ...]]:
+        """The fields that each type of result is matched by."""
+        return {
+            "artists": (lambda a: a.name,),
+            "albums": (lambda a: a.name, self._try_get_artist_name),
+            "songs": (lambda s: s.title, self._try_get_artist_name),
+            "playlists": (lambda p: p.name,),
+        }
+
     def _to_result(
         self,
         it: Dict[str, _S],
-        transform: Callable[[_S], Tuple[Optional[str], ...]],
+        result_type: str,
+        limit: Optional[int] = 20,
     ) -> List[_S]:
         assert self.query
-        all_results = []
-        for value in it.values():
-            transformed = transform(value)
-            if any(t is None for t in transformed):
-                continue
-
-            max_similarity = max(
-                self.similiarity_partial(t.lower()) for t in transformed if t is not None
+        values = list(it.values())
+        if not values:
+            return []
+        columns = [list(map(field, values)) for field in self._fields()[result_type]]
+
+        # Results with missing fields are never matched.
+        missing = {i for column in columns for i, s in enumerate(column) if s is None}
+        for column in columns:
+            for i in missing:
+                column[i] = None
+
+        top = fuzzy.top_k(self.query, columns, limit or len(values), score_cutoff=60)
+        return [values[i] for i, _ in top]
+
+    def narrow(self, query: str, is_candidate: Callable[[Optional[str]], bool]) -> "SearchResult":
+        """
+        Returns a new :class:`SearchResult` for ``query`` which only contains the results
+        of this search that are candidates for it. This is used to refine a search as the
+        user keeps typing without searching everything again.
+
+        :param query: the query to narrow the results to.
+        :param is_candidate: whether a value of one of the fields that the results are
+            matched by makes the result a candidate for ``query``.
+        """
+        narrowed = SearchResult(query)
+        for result_type, fields in self._fields().items():
+            it: Dict[str, Any] = getattr(self, f"_{result_type}")
+            narrowed.add_results(
+                result_type,
+                [r for r in it.values() if any(is_candidate(field(r)) for field in fields)],
             )
-            if max_similarity < 60:
-                continue
-
-            all_results.append((max_similarity, value))
-
-        all_results.sort(key=lambda rx: rx[0], reverse=True)
-
-        result: List[SearchResult._S] = []
-        for ratio, x in all_results:
-            if ratio >= 60 and len(result) < 20:
-                result.append(x)
-            else:
-                # No use going on, all the rest are less.
-                break
-
-        logging.debug(similarity_ratio.cache_info())
-        return result
-
-    @property
-    def artists(self) -> List[Artist]:
-        return self._to_result(self._artists, lambda a: (a.name,))
+        return narrowed
 
     def _try_get_artist_name(self, obj: Union[Album, Song]) -> Optional[str]:
         try:
@@ -221,14 +313,18 @@ class SearchResult:
         except Exception:
             return None
 
+    @property
+    def artists(self) -> List[Artist]:
+        return self._to_result(self._artists, "artists", self.result_limit)
+
     @property
     def albums(self) -> List[Album]:
-        return self._to_result(self._albums, lambda a: (a.name, self._try_get_artist_name(a)))
+        return self._to_result(self._albums, "albums", self.result_limit)
 
     @property
     def songs(self) -> List[Song]:
-        return self._to_result(self._songs, lambda s: (s.title, self._try_get_artist_name(s)))
+        return self._to_result(self._songs, "songs", self.result_limit)
 
     @property
     def playlists(self) -> List[Playlist]:
-        return self._to_result(self._playlists, lambda p: (p.name,))
+        return self._to_result(self._playlists, "playlists", self.result_limit)
@@ -1,16 +1,21 @@
 import hashlib
 import logging
+import random
 import shutil
 import threading
-from datetime import datetime
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, Iterable, Optional, Sequence, Set, Tuple, cast
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple, cast
 
 import peewee
 from gi.repository import Gtk
-from peewee import fn, prefetch
+from peewee import fn
+from playhouse.migrate import SqliteMigrator
 
 from sublime_music.adapters import api_objects as API
+from sublime_music.util import sort_key
 
 from .. import (
     AlbumSearchQuery,
@@ -20,9 +25,10 @@ from .. import (
     ConfigurationStore,
     ConfigureServerForm,
     SongCacheStatus,
+    SongFileVariant,
     UIInfo,
 )
-from . import models
+from . import integrity, migrations, models
 
 KEYS = CachingAdapter.CachedDataKey
 
@@ -70,6 +76,18 @@ class FilesystemAdapter(CachingAdapter):
         self.music_dir.mkdir(parents=True, exist_ok=True)
 
         self.is_cache = is_cache
+        # Used to order the albums of random album queries which aren't cached.
+        self._shuffle_seed = random.getrandbits(32)
+        # The case-folded ignored articles used to compute the sort keys.
+        self._ignored_articles: Optional[Set[str]] = None
+        # Whether the search indexes have been created (see models.create_search_indexes).
+        self._search_index_exists = False
+        # The candidates of recent searches, and whether they include every candidate (if
+        # they do, they can be narrowed down for queries which extend that search).
+        self._search_history: OrderedDict[str, Tuple[API.SearchResult, bool]] = OrderedDict()
+        self._search_history_generation = 0
+        self._search_lock = threading.Lock()
+        self.search_stats: Counter = Counter()
 
         self.db_write_lock: threading.Lock = threading.Lock()
         database_filename = data_directory.joinpath("cache.db")
@@ -77,20 +95,119 @@ class FilesystemAdapter(CachingAdapter):
         models.database.connect()
 
         with self.db_write_lock, models.database.atomic():
-            models.database.create_tables(models.ALL_TABLES)
-            self._migrate_db()
+            is_new_database = not models.CacheInfo.table_exists()
+            models.database.create_tables(
+                [table for table in models.ALL_TABLES if not table.table_exists()]
+            )
+            if is_new_database:
+                # The tables were created from the current models, so they are already
+                # up-to-date.
+                models.create_search_indexes()
+                models.Version.update_version(migrations.SCHEMA_VERSION)
+            else:
+                self._migrate_db(background=False)
+
+        # Run the rest of the migrations without blocking startup.
+        self._migration_thread = threading.Thread(
+            target=self._migrate_db, kwargs={"background": True}, daemon=True
+        )
+        self._migration_thread.start()
+
+        # The set of cache keys which have at least one CacheInfo row. This is what the
+        # can_get_* properties depend on, and it only changes when data is ingested or
+        # deleted, so it is kept up-to-date by those events instead of being queried.
+        self.capability_snapshot_stats: Counter = Counter()
+        self._cached_keys: Set[CachingAdapter.CachedDataKey] = set()
+        self._refresh_capability_snapshot()
+
+        # Periodically verify the cached files in the background.
+        self._stop_event = threading.Event()
+        self._verifier = integrity.CacheVerifier(
+            self.music_dir,
+            self.cover_art_dir,
+            self.data_directory.joinpath("quarantine"),
+            self._compute_song_filename,
+            self.db_write_lock,
+            self._stop_event,
+        )
+        self.last_verification_report: Optional[integrity.VerificationReport] = None
+        if self.is_cache:
+            self._verifier_thread = threading.Thread(
+                target=self._run_verifier, name="CacheVerifier", daemon=True
+            )
+            self._verifier_thread.start()
 
     def initial_sync(self):
         # TODO (#188) this is where scanning the fs should potentially happen?
         pass
 
     def shutdown(self):
+        self._stop_event.set()
         logging.info("Shutdown complete")
 
     # Database Migration
     # ==================================================================================
-    def _migrate_db(self):
-        pass
+    def _migrate_db(self, background: bool):
+        """
+        Run all of the pending migrations.
+
+        :param background: if ``False``, only run the migrations which must be finished
+            before the cache can be used. Otherwise, run all pending migrations in order
+            and record the new schema version after each of them.
+        """
+        migrator = SqliteMigrator(models.database)
+        for migration in migrations.MIGRATIONS:
+            if not models.Version.is_less_than(migration.version):
+                continue
+
+            if not background:
+                if not migration.background:
+                    migration.migrate(migrator)
+                continue
+
+            logging.info(f"Migrating the cache database to {migration.version}")
+            try:
+                with self.db_write_lock, models.database.atomic():
+                    migration.migrate(migrator)
+                    models.Version.update_version(migration.version)
+            except Exception:
+                logging.exception(f"Failed to migrate cache database to {migration.version}")
+                return
+
+    # Cache Verification
+    # ==================================================================================
+    # The cached files are first verified this long after startup (so that verifying
+    # doesn't slow down startup), and then this often.
+    verify_cache_delay = timedelta(minutes=5)
+    verify_cache_interval = timedelta(hours=12)
+
+    def verify_cache(self, full: bool = False) -> integrity.VerificationReport:
+        """
+        Reconcile the cached song and cover art files with the database. See
+        :class:`integrity.CacheVerifier`.
+
+        :param full: whether to re-hash every file instead of only the suspect ones.
+        """
+        assert self.is_cache, "FilesystemAdapter is not in cache mode!"
+        # Wait for the migrations so that the database isn't changed underneath them.
+        self._migration_thread.join()
+        report = self._verifier.verify(full=full)
+        logging.info(f"Verified the cache: {report}")
+        self.last_verification_report = report
+        return report
+
+    def _run_verifier(self):
+        delay = self.verify_cache_delay
+        while not self._stop_event.wait(delay.total_seconds()):
+            try:
+                self.verify_cache()
+            except Exception:
+                logging.exception("Failed to verify the cache")
+            try:
+                self.prune_song_plays()
+            except Exception:
+                logging.exception("Failed to prune the play history")
+            delay = self.verify_cache_interval
 
     # Usage and Availability Properties
     # ==================================================================================
@@ -113,14 +230,20 @@ class FilesystemAdapter(CachingAdapter):
     can_get_directory = True
     can_search = True
 
+    def _refresh_capability_snapshot(self):
+        query = models.CacheInfo.select(models.CacheInfo.cache_key).distinct()
+        self._cached_keys = {cache_key for (cache_key,) in query.tuples()}
+        self.capability_snapshot_stats["refreshes"] += 1
+
     def _can_get_key(self, cache_key: CachingAdapter.CachedDataKey) -> bool:
         if not self.is_cache:
             return True
 
         # As long as there's something in the cache (even if it's not valid) it may be
-        # returned in a cache miss error.
-        query = models.CacheInfo.select().where(models.CacheInfo.cache_key == cache_key)
-        return query.count() > 0
+        # returned in a cache miss error. Invalidating data only marks it as invalid, so
+        # the snapshot only has to be updated on ingestion and deletion.
+        self.capability_snapshot_stats["checks"] += 1
+        return cache_key in self._cached_keys
 
     @property
     def can_get_playlists(self) -> bool:
@@ -165,14 +288,19 @@ class FilesystemAdapter(CachingAdapter):
         where_clauses: Tuple[Any, ...] | None = None,
         order_by: Any = None,
     ) -> Sequence:
-        result = model.select()
+        result = model.select_joined()
         if where_clauses is not None:
             result = result.where(*where_clauses)
 
         if order_by:
             result = result.order_by(order_by)
 
-        if self.is_cache and not ignore_cache_miss:
+        if not ignore_cache_miss:
+            self._check_list_cached(cache_key, result)
+        return result
+
+    def _check_list_cached(self, cache_key: CachingAdapter.CachedDataKey, result: Any):
+        if self.is_cache:
             # Determine if the adapter has ingested data for this key before, and if
             # not, cache miss.
             if not models.CacheInfo.get_or_none(
@@ -180,12 +308,11 @@ class FilesystemAdapter(CachingAdapter):
                 models.CacheInfo.cache_key == cache_key,
             ):
                 raise CacheMissError(partial_data=result)
-        return result
 
     def _get_object_details(
         self, model: Any, id: str, cache_key: CachingAdapter.CachedDataKey
     ) -> Any:
-        obj = model.get_or_none(model.id == id)
+        obj = model.select_joined().where(model.id == id).get_or_none()
 
         # Handle the case that this is the ground truth adapter.
         if not self.is_cache:
@@ -206,6 +333,9 @@ class FilesystemAdapter(CachingAdapter):
         return obj
 
     def _compute_song_filename(self, cache_info: models.CacheInfo) -> Path:
+        # Fall back to using the song file hash as the filename. This shouldn't happen
+        # with good servers, but just to be safe.
+        filename = self.music_dir.joinpath(str(cache_info.file_hash))
         try:
             if path_str := cache_info.path:
                 # Make sure that the path is somewhere in the cache directory and a
@@ -213,13 +343,21 @@ class FilesystemAdapter(CachingAdapter):
                 # other parts of the system.
                 path = self.music_dir.joinpath(str(path_str))
                 if self.music_dir in path.parents:
-                    return path
+                    filename = path
         except Exception:
             pass
 
-        # Fall back to using the song file hash as the filename. This shouldn't happen
-        # with good servers, but just to be safe.
-        return self.music_dir.joinpath(str(cache_info.file_hash))
+        variant = self._song_file_variant(cache_info)
+        if not variant.is_original:
+            # Transcoded variants get their own filename so that they are never confused
+            # with the original.
+            bit_rate = f".{variant.max_bit_rate}k" if variant.max_bit_rate else ""
+            suffix = f".{variant.format}" if variant.format else filename.suffix
+            filename = filename.with_name(f"{filename.stem}{bit_rate}{suffix}")
+        return filename
+
+    def _song_file_variant(self, cache_info: models.CacheInfo) -> SongFileVariant:
+        return SongFileVariant(cache_info.variant_format, cache_info.variant_max_bit_rate)
 
     # Data Retrieval Methods
     # ==================================================================================
@@ -242,13 +380,17 @@ class FilesystemAdapter(CachingAdapter):
 
         cached_statuses = {song_id: SongCacheStatus.NOT_CACHED for song_id in song_ids}
         try:
-            file_models = models.CacheInfo.select().where(
-                models.CacheInfo.cache_key == KEYS.SONG_FILE
-            )
-            song_models = models.Song.select().where(models.Song.id.in_(song_ids))
-            cached_statuses.update(
-                {s.id: compute_song_cache_status(s) for s in prefetch(song_models, file_models)}
+            song_models = (
+                models.Song.select(models.Song, models.CacheInfo)
+                .join(
+                    models.CacheInfo,
+                    peewee.JOIN.LEFT_OUTER,
+                    on=(models.Song.file == models.CacheInfo.id),
+                    attr="file",
+                )
+                .where(models.Song.id.in_(song_ids))
             )
+            cached_statuses.update({s.id: compute_song_cache_status(s) for s in song_models})
         except Exception:
             pass
 
@@ -288,7 +430,12 @@ class FilesystemAdapter(CachingAdapter):
 
         raise CacheMissError()
 
-    def get_song_file_uri(self, song_id: str, schemes: Iterable[str]) -> str:
+    def get_song_file_uri(
+        self,
+        song_id: str,
+        schemes: Iterable[str],
+        variant: Optional[SongFileVariant] = None,
+    ) -> str:
         song = models.Song.get_or_none(models.Song.id == song_id)
         if not song:
             if self.is_cache:
@@ -300,15 +447,32 @@ class FilesystemAdapter(CachingAdapter):
             if (song_file := song.file) and (filename := self._compute_song_filename(song_file)):
                 if filename.exists():
                     file_uri = f"file://{filename}"
-                    if song_file.valid:
-                        return file_uri
-                    else:
+                    if not song_file.valid:
                         raise CacheMissError(partial_data=file_uri)
+                    if variant and variant.is_better_than(self._song_file_variant(song_file)):
+                        # The cached file can still be played if the requested variant
+                        # can't be downloaded.
+                        raise CacheMissError(partial_data=file_uri)
+                    return file_uri
         except peewee.DoesNotExist:
             pass
 
         raise CacheMissError()
 
+    def get_cached_song_file_variant(self, song_id: str) -> Optional[SongFileVariant]:
+        cache_info = models.CacheInfo.get_or_none(
+            models.CacheInfo.cache_key == KEYS.SONG_FILE,
+            models.CacheInfo.parameter == song_id,
+            models.CacheInfo.valid == True,  # noqa: 712
+        )
+        if (
+            not cache_info
+            or not cache_info.file_hash
+            or not self._compute_song_filename(cache_info).exists()
+        ):
+            return None
+        return self._song_file_variant(cache_info)
+
     def get_song_details(self, song_id: str) -> API.Song:
         return self._get_object_details(
             models.Song,
@@ -322,6 +486,7 @@ class FilesystemAdapter(CachingAdapter):
             CachingAdapter.CachedDataKey.ARTISTS,
             ignore_cache_miss=ignore_cache_miss,
             where_clauses=(~(models.Artist.id.startswith("invalid:")),),
+            order_by=models.Artist.sort_key,
         )
 
     def get_artist(self, artist_id: str) -> API.Artist:
@@ -330,56 +495,101 @@ class FilesystemAdapter(CachingAdapter):
         )
 
     def get_albums(
-        self,
-        query: AlbumSearchQuery,
-        sort_direction: str = "ascending"
-        # TODO (#208) deal with sort dir here?
+        self, query: AlbumSearchQuery, sort_direction: str = "ascending"
     ) -> Sequence[API.Album]:
-        strhash = query.strhash()
-        query_result = models.AlbumQueryResult.get_or_none(
-            models.AlbumQueryResult.query_hash == strhash
-        )
+        albums_query, valid = self._get_albums_query(query, sort_direction)
+        albums = list(models.Album.join_relations(albums_query))
+        if not valid:
+            raise CacheMissError(partial_data=albums)
+        return albums
+
+    def _get_albums_query(
+        self, query: AlbumSearchQuery, sort_direction: str = "ascending"
+    ) -> Tuple[Any, bool]:
+        """
+        Plan the SQL query for the albums matching the given ``query``. If the result of
+        the query has been cached, then the cached albums are returned in the cached
+        order. Otherwise, the query is answered from all of the cached albums.
+
+        :returns: a tuple of the query (without the album relations joined) and whether
+            or not it is a valid cached result.
+        """
+        Album = models.Album
+        albums = Album.select()
+        order_by: List[Any]
+
         # If we've cached the query result, then just return it. If it's stale, then
         # return the old value as a cache miss error.
-        if query_result and (
+        strhash = query.strhash()
+        if models.AlbumQueryResult.get_or_none(models.AlbumQueryResult.query_hash == strhash) and (
             cache_info := models.CacheInfo.get_or_none(
                 models.CacheInfo.cache_key == CachingAdapter.CachedDataKey.ALBUMS,
                 models.CacheInfo.parameter == strhash,
             )
         ):
-            if cache_info.valid:
-                return query_result.albums
-            else:
-                raise CacheMissError(partial_data=query_result.albums)
-
-        # If we haven't ever cached the query result, try to construct one, and return
-        # it as a CacheMissError result.
+            through = models.AlbumQueryResult.albums.get_through_model()
+            albums = albums.join(through, on=(through.album == Album.id)).where(
+                through.albumqueryresult == strhash
+            )
+            albums = self._order_albums(albums, [through.position], sort_direction)
+            return albums, cache_info.valid
 
-        sql_query = models.Album.select().where(~(models.Album.id.startswith("invalid:")))
+        # If we haven't ever cached the query result, answer it from the cached albums,
+        # and return it as a CacheMissError result.
+        albums = albums.where(~(Album.id.startswith("invalid:")))
 
         Type = AlbumSearchQuery.Type
-        if query.type == Type.GENRE:
+        if query.type == Type.RANDOM:
+            order_by = [fn.shuffle_key(self._shuffle_seed, Album.id)]
+        elif query.type == Type.NEWEST:
+            order_by = [Album.created.desc()]
+        elif query.type == Type.FREQUENT:
+            order_by = [Album.play_count.desc()]
+        elif query.type == Type.RECENT:
+            # Order by the last time that any of the album's songs were played.
+            last_played = (
+                models.Song.select(
+                    models.Song.album,
+                    fn.MAX(models.SongPlay.played_at).alias("played_at"),
+                )
+                .join(models.SongPlay, on=(models.SongPlay.song_id == models.Song.id))
+                .group_by(models.Song.album)
+            )
+            albums = albums.join(last_played, on=(Album.id == last_played.c.album_id))
+            order_by = [last_played.c.played_at.desc()]
+        elif query.type == Type.STARRED:
+            albums = albums.where(Album.starred.is_null(False))
+            order_by = [Album.sort_key]
+        elif query.type == Type.ALPHABETICAL_BY_NAME:
+            order_by = [Album.sort_key]
+        elif query.type == Type.ALPHABETICAL_BY_ARTIST:
+            albums = albums.join(
+                models.Artist,
+                peewee.JOIN.LEFT_OUTER,
+                on=(Album.artist == models.Artist.id),
+            )
+            order_by = [models.Artist.sort_key]
+        elif query.type == Type.YEAR_RANGE:
+            albums = albums.where(Album.year.between(*query.year_range))
+            order_by = [Album.year, Album.sort_key]
+        elif query.type == Type.GENRE:
             assert query.genre
-        genre_name = genre.name if (genre := query.genre) else None
-
-        sql_query = {
-            Type.RANDOM: sql_query.order_by(fn.Random()),
-            Type.NEWEST: sql_query.order_by(models.Album.created.desc()),
-            Type.FREQUENT: sql_query.order_by(models.Album.play_count.desc()),
-            Type.STARRED: sql_query.where(models.Album.starred.is_null(False)).order_by(
-                models.Album.name
-            ),
-            Type.ALPHABETICAL_BY_NAME: sql_query.order_by(models.Album.name),
-            Type.ALPHABETICAL_BY_ARTIST: sql_query.order_by(models.Album.artist.name),
-            Type.YEAR_RANGE: sql_query.where(
-                models.Album.year.between(*query.year_range)
-            ).order_by(models.Album.year, models.Album.name),
-            Type.GENRE: sql_query.where(models.Album.genre == genre_name).order_by(
-                models.Album.name
-            ),
-        }.get(query.type)
+            albums = albums.where(Album.genre == query.genre.name)
+            order_by = [Album.sort_key]
 
-        raise CacheMissError(partial_data=sql_query)
+        # Break ties by ID so that the order (and therefore paging) is deterministic.
+        order_by.append(Album.id)
+        return self._order_albums(albums, order_by, sort_direction), False
+
+    @staticmethod
+    def _order_albums(albums: Any, order_by: List[Any], sort_direction: str) -> Any:
+        orderings = [o if isinstance(o, peewee.Ordering) else o.asc() for o in order_by]
+        if sort_direction == "descending":
+            orderings = [
+                peewee.Ordering(o.node, "ASC" if o.direction == "DESC" else "DESC")
+                for o in orderings
+            ]
+        return albums.order_by(*orderings)
 
     def get_all_albums(self) -> Sequence[API.Album]:
         return self._get_list(
@@ -411,30 +621,401 @@ class FilesystemAdapter(CachingAdapter):
     def get_genres(self) -> Sequence[API.Genre]:
         return self._get_list(models.Genre, CachingAdapter.CachedDataKey.GENRES)
 
+    # The maximum number of candidates per field that are retrieved from the search index
+    # to be scored by the fuzzy matcher.
+    search_candidate_limit = 100
+    # The number of recent searches that are kept to answer or refine later searches.
+    search_history_size = 32
+
     def search(self, query: str) -> API.SearchResult:
+        with self._search_lock:
+            generation = self._search_history_generation
+            if query in self._search_history:
+                self._search_history.move_to_end(query)
+                self.search_stats["history_hits"] += 1
+                return self._search_history[query][0]
+
+            # As the user types, each query usually extends the previous one. If all of
+            # the candidates of a previous query are known, and they include all of this
+            # query's candidates, then the previous results only have to be narrowed down.
+            previous = max(
+                (
+                    (q, result)
+                    for q, (result, complete) in self._search_history.items()
+                    if complete and models.search_candidates_include(q, query)
+                ),
+                key=lambda p: len(p[0]),
+                default=None,
+            )
+
+        if previous:
+            # The narrowed result has all of the candidates of this query, so it can be
+            # narrowed down further as well.
+            search_result = previous[1].narrow(query, partial(models.is_search_candidate, query))
+            complete = True
+            self.search_stats["narrowed"] += 1
+        else:
+            search_result, complete = self._search_index(query)
+            self.search_stats["index_searches"] += 1
+
+        with self._search_lock:
+            # Don't keep the result if the cache changed while searching.
+            if generation != self._search_history_generation:
+                return search_result
+
+            self._search_history[query] = (search_result, complete)
+            while len(self._search_history) > self.search_history_size:
+                self._search_history.popitem(last=False)
+        return search_result
+
+    def _clear_search_history(self):
+        with self._search_lock:
+            self._search_history.clear()
+            self._search_history_generation += 1
+
+    def _search_index(self, query: str) -> Tuple[API.SearchResult, bool]:
+        """
+        Search the cache for all of the candidates for ``query``.
+
+        :returns: the candidates, and whether they are all of the candidates (if none of
+            the candidate queries hit their limit).
+        """
+        if not self._search_index_exists:
+            self._search_index_exists = models.search_index_exists()
+
+        def candidates(field: peewee.Field, limit: int) -> peewee.SQL:
+            return models.search_candidates(field, query, limit, self._search_index_exists)
+
+        limit = self.search_candidate_limit
+        artist_ids = candidates(models.Artist.name, limit)
+
+        # Albums and songs are also matched by the name of their artist, but only the
+        # best artist candidates are used so that common substrings don't pull in most
+        # of the library.
+        top_artists = 10
+        top_artist_ids = candidates(models.Artist.name, top_artists)
+
+        def matching_ids(model: Any, field: peewee.Field) -> Any:
+            return model.select(model.id).where(model.id.in_(candidates(field, limit))) | (
+                model.select(model.id).where(model.artist.in_(top_artist_ids)).limit(limit)
+            )
+
+        albums = models.Album.select().where(
+            ~(models.Album.id.startswith("invalid:")),
+            models.Album.artist.is_null(False),
+            models.Album.id.in_(matching_ids(models.Album, models.Album.name)),
+        )
+        artists = models.Artist.select().where(
+            ~(models.Artist.id.startswith("invalid:")),
+            models.Artist.id.in_(artist_ids),
+        )
+        songs = models.Song.select().where(
+            models.Song.artist.is_null(False),
+            models.Song.id.in_(matching_ids(models.Song, models.Song.title)),
+        )
+        playlists = models.Playlist.select().where(
+            models.Playlist.id.in_(candidates(models.Playlist.name, limit))
+        )
+
+        results: Dict[str, Sequence[Any]] = {
+            "albums": self._get_album_records(albums),
+            "artists": self._get_artist_records(artists),
+            "songs": self._get_song_records(songs),
+            "playlists": self._get_playlist_records(playlists),
+        }
         search_result = API.SearchResult(query)
-        search_result.add_results("albums", self.get_all_albums())
-        search_result.add_results("artists", self.get_artists(ignore_cache_miss=True))
-        search_result.add_results(
-            "songs",
-            self._get_list(
-                models.Song,
-                CachingAdapter.CachedDataKey.SONG,
-                ignore_cache_miss=True,
-                where_clauses=(models.Song.artist.is_null(False),),
-            ),
+        for result_type, records in results.items():
+            search_result.add_results(result_type, records)
+
+        complete = len(results["artists"]) < top_artists and all(
+            len(r) < limit for r in results.values()
         )
-        search_result.add_results(
-            "playlists",
-            self.get_playlists(ignore_cache_miss=True),
+        return search_result, complete
+
+    # Record Retrieval Methods
+    # ==================================================================================
+    def get_artist_records(self, ignore_cache_miss: bool = False) -> Sequence[API.ArtistRecord]:
+        records = self._get_artist_records(
+            models.Artist.select().where(~(models.Artist.id.startswith("invalid:")))
+        )
+        if not ignore_cache_miss:
+            self._check_list_cached(KEYS.ARTISTS, records)
+        return records
+
+    def _get_artist_records(self, artists: Any) -> List[API.ArtistRecord]:
+        image = models.CacheInfo.alias()
+        query = (
+            artists.select(
+                models.Artist.id,
+                models.Artist.name,
+                models.Artist.album_count,
+                image.file_id,
+            )
+            .join(
+                image,
+                peewee.JOIN.LEFT_OUTER,
+                on=(models.Artist._artist_image_url == image.id),
+            )
+            .order_by(models.Artist.sort_key)
+        )
+        return [API.ArtistRecord(*row) for row in query.tuples()]
+
+    def get_album_records(
+        self, query: AlbumSearchQuery, sort_direction: str = "ascending"
+    ) -> Sequence[API.AlbumRecord]:
+        albums, valid = self._get_albums_query(query, sort_direction)
+        records = self._get_album_records(albums)
+        if not valid:
+            raise CacheMissError(partial_data=records)
+        return records
+
+    def get_album_records_page(
+        self,
+        query: AlbumSearchQuery,
+        offset: int,
+        limit: int,
+        sort_direction: str = "ascending",
+    ) -> API.AlbumRecordPage:
+        albums, valid = self._get_albums_query(query, sort_direction)
+        page = API.AlbumRecordPage(
+            self._get_album_records(albums.limit(limit).offset(offset)), albums.count()
+        )
+        if not valid:
+            raise CacheMissError(partial_data=page)
+        return page
+
+    def get_album_index(
+        self,
+        query: AlbumSearchQuery,
+        album_id: str,
+        sort_direction: str = "ascending",
+    ) -> Optional[int]:
+        albums, valid = self._get_albums_query(query, sort_direction)
+        # Number the albums in the order of the query, and only read the number of the
+        # requested album.
+        numbered = albums.select(
+            models.Album.id,
+            fn.ROW_NUMBER().over(order_by=albums._order_by).alias("position"),
+        ).order_by()
+        position = (
+            peewee.Select([numbered], [numbered.c.position])
+            .where(numbered.c.id == album_id)
+            .bind(models.database)
+            .scalar()
+        )
+        index = position - 1 if position is not None else None
+        if not valid:
+            raise CacheMissError(partial_data=index)
+        return index
+
+    def _get_album_records(self, albums: Any) -> List[API.AlbumRecord]:
+        cover_art, artist = models.CacheInfo.alias(), models.Artist.alias()
+        query = (
+            albums.select(
+                models.Album.id,
+                models.Album.name,
+                cover_art.file_id,
+                models.Album.year,
+                models.Album.duration,
+                artist.id,
+                artist.name,
+                models.Album.genre,
+            )
+            .switch(models.Album)
+            .join(
+                cover_art,
+                peewee.JOIN.LEFT_OUTER,
+                on=(models.Album._cover_art == cover_art.id),
+            )
+            .switch(models.Album)
+            .join(artist, peewee.JOIN.LEFT_OUTER, on=(models.Album.artist == artist.id))
+        )
+        return [
+            API.AlbumRecord(
+                id,
+                name,
+                cover_art_id,
+                year,
+                duration,
+                API.RelatedRecord(artist_id, artist_name) if artist_id else None,
+                API.RelatedRecord(None, genre) if genre else None,
+            )
+            for (
+                id,
+                name,
+                cover_art_id,
+                year,
+                duration,
+                artist_id,
+                artist_name,
+                genre,
+            ) in query.tuples()
+        ]
+
+    def _get_song_records(self, songs: Any) -> List[API.SongRecord]:
+        cover_art, artist, album = (
+            models.CacheInfo.alias(),
+            models.Artist.alias(),
+            models.Album.alias(),
+        )
+        query = (
+            songs.select(
+                models.Song.id,
+                models.Song.title,
+                cover_art.file_id,
+                models.Song.duration,
+                artist.id,
+                artist.name,
+                album.id,
+                album.name,
+            )
+            .join(
+                cover_art,
+                peewee.JOIN.LEFT_OUTER,
+                on=(models.Song._cover_art == cover_art.id),
+            )
+            .switch(models.Song)
+            .join(artist, peewee.JOIN.LEFT_OUTER, on=(models.Song.artist == artist.id))
+            .switch(models.Song)
+            .join(album, peewee.JOIN.LEFT_OUTER, on=(models.Song.album == album.id))
+        )
+        return [
+            API.SongRecord(
+                id,
+                title,
+                cover_art_id,
+                duration,
+                API.RelatedRecord(artist_id, artist_name) if artist_id else None,
+                API.RelatedRecord(album_id, album_name) if album_id else None,
+            )
+            for (
+                id,
+                title,
+                cover_art_id,
+                duration,
+                artist_id,
+                artist_name,
+                album_id,
+                album_name,
+            ) in query.tuples()
+        ]
+
+    def get_playlist_records(
+        self, ignore_cache_miss: bool = False
+    ) -> Sequence[API.PlaylistRecord]:
+        records = self._get_playlist_records(models.Playlist.select())
+        if not ignore_cache_miss:
+            self._check_list_cached(KEYS.PLAYLISTS, records)
+        return records
+
+    def _get_playlist_records(self, playlists: Any) -> List[API.PlaylistRecord]:
+        cover_art = models.CacheInfo.alias()
+        query = (
+            playlists.select(
+                models.Playlist.id,
+                models.Playlist.name,
+                models.Playlist.song_count,
+                models.Playlist.duration,
+                cover_art.file_id,
+            )
+            .join(
+                cover_art,
+                peewee.JOIN.LEFT_OUTER,
+                on=(models.Playlist._cover_art == cover_art.id),
+            )
+            .order_by(fn.LOWER(models.Playlist.name))
+        )
+        return [API.PlaylistRecord(*row) for row in query.tuples()]
+
+    # Play History Methods
+    # ==================================================================================
+    # Songs that are only downloaded because they were streamed (or prefetched) are
+    # persisted to the cache once they have been played at least this many times within
+    # the admission window. Everything else is kept in the download buffer only, so that
+    # one-off tracks don't fill up the cache.
+    admission_min_plays = 2
+    admission_window = timedelta(days=90)
+    # Plays which are further apart than this are in different listening sessions.
+    session_gap = timedelta(minutes=30)
+    # Songs that started sessions within this many hours of the current time of day are
+    # predicted to start the next session.
+    session_start_hours = 1
+    # Only the plays within this window are used for predictions.
+    prediction_window = timedelta(days=90)
+
+    def record_song_play(self, song_id: str, source: Optional[str] = None):
+        assert self.is_cache, "FilesystemAdapter is not in cache mode!"
+        with self.db_write_lock, models.database.atomic():
+            models.SongPlay.create(song_id=song_id, played_at=datetime.now(), source=source)
+
+    def predict_song_plays(self, song_id: Optional[str], count: int) -> Sequence[str]:
+        # A first-order Markov model over the play history: the songs that most often
+        # followed the given song within a session. If there is no song, then the songs
+        # that most often started a session at around this time of day.
+        now = datetime.now()
+        plays = (
+            models.SongPlay.select(models.SongPlay.song_id, models.SongPlay.played_at)
+            .where(models.SongPlay.played_at >= now - self.prediction_window)
+            .order_by(models.SongPlay.played_at)
+            .tuples()
         )
-        return search_result
+
+        def is_near_now(played_at: datetime) -> bool:
+            hours = abs(played_at.hour - now.hour)
+            return min(hours, 24 - hours) <= self.session_start_hours
+
+        counts: Counter = Counter()
+        previous_id, previous_played_at = None, None
+        for next_id, played_at in plays:
+            if previous_played_at is None or played_at - previous_played_at > self.session_gap:
+                if song_id is None and is_near_now(played_at):
+                    counts[next_id] += 1
+            elif song_id is not None and previous_id == song_id != next_id:
+                counts[next_id] += 1
+            previous_id, previous_played_at = next_id, played_at
+
+        return [s for s, _ in counts.most_common(count)]
+
+    def should_admit_song_file(self, song_id: str) -> bool:
+        # Starred songs are always worth keeping around.
+        if (song := models.Song.get_or_none(models.Song.id == song_id)) and song.starred:
+            return True
+
+        play_count = (
+            models.SongPlay.select()
+            .where(
+                models.SongPlay.song_id == song_id,
+                models.SongPlay.played_at >= datetime.now() - self.admission_window,
+            )
+            .count()
+        )
+        return play_count >= self.admission_min_plays
+
+    def prune_song_plays(self) -> int:
+        """
+        Delete the plays which are outside of both the admission and prediction windows,
+        since nothing reads them anymore. This runs along with the cache verification.
+
+        :returns: the number of plays that were deleted.
+        """
+        assert self.is_cache, "FilesystemAdapter is not in cache mode!"
+        cutoff = datetime.now() - max(self.admission_window, self.prediction_window)
+        with self.db_write_lock, models.database.atomic():
+            deleted = models.SongPlay.delete().where(models.SongPlay.played_at < cutoff).execute()
+        if deleted:
+            logging.info(f"Pruned {deleted} plays from the play history")
+        return deleted
 
     # Data Ingestion Methods
     # ==================================================================================
     def _strhash(self, string: str) -> str:
         return hashlib.sha1(bytes(string, "utf8")).hexdigest()
 
+    def _get_sort_key(self, string: Optional[str]) -> str:
+        if self._ignored_articles is None:
+            self._ignored_articles = {a.name.casefold() for a in models.IgnoredArticle.select()}
+        return sort_key(string, self._ignored_articles)
+
     def ingest_new_data(
         self,
         data_key: CachingAdapter.CachedDataKey,
@@ -447,6 +1028,7 @@ class FilesystemAdapter(CachingAdapter):
         # transaction.
         with self.db_write_lock, models.database.atomic():
             self._do_ingest_new_data(data_key, param, data)
+        self._clear_search_history()
 
     def invalidate_data(self, key: CachingAdapter.CachedDataKey, param: Optional[str]):
         assert self.is_cache, "FilesystemAdapter is not in cache mode!"
@@ -463,6 +1045,7 @@ class FilesystemAdapter(CachingAdapter):
         # transaction.
         with self.db_write_lock, models.database.atomic():
             self._do_delete_data(key, param)
+        self._clear_search_history()
 
     def _do_ingest_new_data(
         self,
@@ -484,14 +1067,6 @@ class FilesystemAdapter(CachingAdapter):
                 if v is not None:
                     setattr(obj, k, v)
 
-        def compute_file_hash(filename: str) -> str:
-            file_hash = hashlib.sha1()
-            with open(filename, "rb") as f:
-                while chunk := f.read(8192):
-                    file_hash.update(chunk)
-
-            return file_hash.hexdigest()
-
         return_val = None
 
         # Set the cache info.
@@ -515,10 +1090,14 @@ class FilesystemAdapter(CachingAdapter):
                 "valid": not partial,
             },
         )
+        was_valid = not cache_info_created and cache_info.valid
         if not cache_info_created:
             cache_info.valid = cache_info.valid or not partial
             cache_info.last_ingestion_time = now
             cache_info.save()
+        elif cache_info.cache_key not in self._cached_keys:
+            self._cached_keys.add(cache_info.cache_key)
+            self.capability_snapshot_stats["updates"] += 1
 
         if data_key == KEYS.ALBUM:
             album = cast(API.Album, data)
@@ -537,6 +1116,7 @@ class FilesystemAdapter(CachingAdapter):
                         "year",
                     ],
                 ),
+                "sort_key": self._get_sort_key(album.name),
                 "genre": (
                     self._do_ingest_new_data(KEYS.GENRE, None, g) if (g := album.genre) else None
                 ),
@@ -596,6 +1176,9 @@ class FilesystemAdapter(CachingAdapter):
                     ]
                 ).on_conflict_replace().execute()
 
+            for a in artist.albums or []:
+                self._do_ingest_new_data(KEYS.ALBUM, a.id, a, partial=True)
+
             artist_id = artist.id or f"invalid:{self._strhash(artist.name)}"
             artist_data = {
                 "id": artist_id,
@@ -610,10 +1193,7 @@ class FilesystemAdapter(CachingAdapter):
                         "last_fm_url",
                     ],
                 ),
-                "albums": [
-                    self._do_ingest_new_data(KEYS.ALBUM, a.id, a, partial=True)
-                    for a in artist.albums or []
-                ],
+                "sort_key": self._get_sort_key(artist.name),
                 "_artist_image_url": (
                     self._do_ingest_new_data(
                         KEYS.COVER_ART_FILE, artist.artist_image_url, data=None
@@ -643,7 +1223,7 @@ class FilesystemAdapter(CachingAdapter):
             cache_info.file_id = param
 
             if data is not None:
-                file_hash = compute_file_hash(data)
+                file_hash = integrity.compute_file_hash(data)
                 cache_info.file_hash = file_hash
 
                 # Copy the actual cover art file
@@ -652,6 +1232,7 @@ class FilesystemAdapter(CachingAdapter):
         elif data_key == KEYS.DIRECTORY:
             api_directory = cast(API.Directory, data)
             directory_data: Dict[str, Any] = getattrs(api_directory, ["id", "name", "parent_id"])
+            directory_data["sort_key"] = self._get_sort_key(api_directory.name)
 
             if not partial:
                 directory_data["directory_children"] = []
@@ -692,11 +1273,17 @@ class FilesystemAdapter(CachingAdapter):
             return_val = genre
 
         elif data_key == KEYS.IGNORED_ARTICLES:
+            old_ignored_articles = {a.name for a in models.IgnoredArticle.select()}
             models.IgnoredArticle.insert_many(
                 {"name": s} for s in data
             ).on_conflict_replace().execute()
             models.IgnoredArticle.delete().where(models.IgnoredArticle.name.not_in(data)).execute()
 
+            # The sort keys only need to be recomputed if the ignored articles changed.
+            if old_ignored_articles != set(data):
+                self._ignored_articles = None
+                models.update_sort_keys()
+
         elif data_key == KEYS.PLAYLIST_DETAILS:
             api_playlist = cast(API.Playlist, data)
             playlist_data: Dict[str, Any] = {
@@ -773,8 +1360,10 @@ class FilesystemAdapter(CachingAdapter):
                     "parent_id",
                     "disc_number",
                     "user_rating",
+                    "starred",
                 ],
             )
+            song_data["sort_key"] = self._get_sort_key(api_song.title)
             song_data["genre"] = (
                 self._do_ingest_new_data(KEYS.GENRE, None, g) if (g := api_song.genre) else None
             )
@@ -823,7 +1412,9 @@ class FilesystemAdapter(CachingAdapter):
 
         # Special handling for Song
         if data_key == KEYS.SONG_FILE and data:
-            path, buffer_filename, size = data
+            path, buffer_filename, size = data[:3]
+            # The variant is only given with a file, and defaults to the original.
+            variant = (data[3] if len(data) > 3 else None) or SongFileVariant()
 
             if path:
                 cache_info.path = path
@@ -831,8 +1422,21 @@ class FilesystemAdapter(CachingAdapter):
             if size:
                 cache_info.size = size
 
-            if buffer_filename:
-                cache_info.file_hash = compute_file_hash(buffer_filename)
+            old_filename = (
+                self._compute_song_filename(cache_info) if cache_info.file_hash else None
+            )
+            if (
+                buffer_filename
+                and was_valid
+                and old_filename
+                and old_filename.exists()
+                and self._song_file_variant(cache_info).is_better_than(variant)
+            ):
+                logging.info(f"Keeping the better cached variant of song file {param}.")
+            elif buffer_filename:
+                cache_info.file_hash = integrity.compute_file_hash(buffer_filename)
+                cache_info.variant_format = variant.format
+                cache_info.variant_max_bit_rate = variant.max_bit_rate
 
                 # Copy the actual song file from the download buffer dir to the cache
                 # dir.
@@ -840,6 +1444,10 @@ class FilesystemAdapter(CachingAdapter):
                 filename.parent.mkdir(parents=True, exist_ok=True)
                 shutil.copy(str(buffer_filename), str(filename))
 
+                # Remove the variant that this replaced.
+                if old_filename and old_filename != filename:
+                    old_filename.unlink(missing_ok=True)
+
         elif data_key == KEYS.SONG_RATING:
             song = models.Song.get_by_id(param)
             song.user_rating = data
@@ -920,6 +1528,7 @@ class FilesystemAdapter(CachingAdapter):
             self._do_delete_data(KEYS.ALL_SONGS, None)
             for table in models.ALL_TABLES:
                 table.truncate_table()
+            self._refresh_capability_snapshot()
 
         if cache_info:
             cache_info.valid = False
@@ -0,0 +1,294 @@
+"""
+Verification of the cached song and cover art files against the cache database.
+
+The :class:`CacheVerifier` reconciles the ``CacheInfo`` rows of the cached files with
+the files that are actually on disk:
+
+* rows whose file is missing are invalidated so that the file is downloaded again,
+* suspect files (see :class:`CacheVerifier.is_suspect`) are re-hashed, and the ones that
+  don't match their ``file_hash`` are moved to the quarantine directory and invalidated,
+* files that no row refers to (for example, files left behind by a crash or by a
+  deletion that partially failed) are deleted.
+"""
+
+import hashlib
+import logging
+import os
+import random
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Set, Tuple, cast
+
+from sublime_music.adapters.adapter_base import CachingAdapter
+
+from . import models
+
+KEYS = CachingAdapter.CachedDataKey
+
+
+def compute_file_hash(filename: str) -> str:
+    file_hash = hashlib.sha1()
+    with open(filename, "rb") as f:
+        while chunk := f.read(8192):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+@dataclass
+class VerificationReport:
+    started: datetime = field(default_factory=datetime.now)
+    finished: Optional[datetime] = None
+    checked_files: int = 0
+    hashed_files: int = 0
+    hashed_bytes: int = 0
+    # Files which were in the database, but not on disk.
+    missing_files: int = 0
+    # Files which didn't match their hash and have been moved to the quarantine directory.
+    quarantined_files: List[Path] = field(default_factory=list)
+    # Files which weren't in the database and have been deleted.
+    orphaned_files: int = 0
+    reclaimed_bytes: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"checked {self.checked_files} files, re-hashed {self.hashed_files} "
+            f"({self.hashed_bytes} bytes), invalidated {self.missing_files} missing files, "
+            f"quarantined {len(self.quarantined_files)} corrupt files, and deleted "
+            f"{self.orphaned_files} orphaned files ({self.reclaimed_bytes} bytes)"
+        )
+
+
+class Throttle:
+    """
+    Limits the rate at which bytes are read by any number of threads.
+    """
+
+    def __init__(self, bytes_per_second: float, stop_event: threading.Event):
+        self.bytes_per_second = bytes_per_second
+        self._stop_event = stop_event
+        self._lock = threading.Lock()
+        self._start = monotonic()
+        self._bytes = 0
+
+    def consume(self, num_bytes: int):
+        """
+        Record that ``num_bytes`` have been read, and wait until reading them is within
+        the rate limit (or until verification is stopped).
+        """
+        with self._lock:
+            self._bytes += num_bytes
+            wait = self._bytes / self.bytes_per_second - (monotonic() - self._start)
+        if wait > 0:
+            self._stop_event.wait(wait)
+
+
+class CacheVerifier:
+    # The number of threads which re-hash files.
+    workers = 2
+    # The maximum rate at which files are read for re-hashing.
+    max_bytes_per_second = 16 * 1024 * 1024
+    # The fraction of the files which aren't otherwise suspect that are re-hashed on each
+    # run, to catch files that have been corrupted without being modified.
+    sample_fraction = 0.02
+    # Files which have been modified more recently than this are never orphans, because
+    # they may be in the middle of being ingested.
+    orphan_grace_period = timedelta(minutes=10)
+    # Files are deleted from the quarantine directory after this long.
+    quarantine_retention = timedelta(days=7)
+
+    def __init__(
+        self,
+        music_dir: Path,
+        cover_art_dir: Path,
+        quarantine_dir: Path,
+        compute_song_filename: Callable[[models.CacheInfo], Path],
+        db_write_lock: threading.Lock,
+        stop_event: threading.Event,
+    ):
+        self.music_dir = music_dir
+        self.cover_art_dir = cover_art_dir
+        self.quarantine_dir = quarantine_dir
+        self.compute_song_filename = compute_song_filename
+        self.db_write_lock = db_write_lock
+        self.stop_event = stop_event
+
+    def verify(self, full: bool = False) -> VerificationReport:
+        """
+        Reconcile the database with the files on disk.
+
+        :param full: whether to re-hash every file instead of only the suspect ones.
+        :returns: a report of what was checked and what was fixed.
+        """
+        report = VerificationReport()
+
+        # Every file that's referenced by a row, and the rows that reference it.
+        files: Dict[Path, List[models.CacheInfo]] = {}
+        for cache_info in models.CacheInfo.select().where(
+            models.CacheInfo.cache_key.in_([KEYS.SONG_FILE, KEYS.COVER_ART_FILE]),
+            models.CacheInfo.file_hash.is_null(False),
+        ):
+            files.setdefault(self._filename(cache_info), []).append(cache_info)
+
+        self._delete_orphans(set(files), report)
+
+        to_hash: List[Tuple[Path, List[models.CacheInfo]]] = []
+        for filename, cache_infos in files.items():
+            if self.stop_event.is_set():
+                return report
+
+            report.checked_files += 1
+            try:
+                stat = filename.stat()
+            except FileNotFoundError:
+                valid = [c for c in cache_infos if c.valid]
+                if valid:
+                    report.missing_files += 1
+                    self._invalidate(valid)
+                continue
+
+            if full or self.is_suspect(filename, stat, cache_infos):
+                to_hash.append((filename, cache_infos))
+
+        throttle = Throttle(self.max_bytes_per_second, self.stop_event)
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="cache_verifier") as executor:
+            hashes = executor.map(lambda f: self._hash(f[0], throttle, report), to_hash)
+            for (filename, cache_infos), file_hash in zip(to_hash, hashes):
+                if file_hash is not None and file_hash != cache_infos[0].file_hash:
+                    self._quarantine(filename, cache_infos, report)
+
+        self._purge_quarantine()
+        report.finished = datetime.now()
+        return report
+
+    def is_suspect(
+        self,
+        filename: Path,
+        stat: os.stat_result,
+        cache_infos: List[models.CacheInfo],
+    ) -> bool:
+        """
+        Whether the file should be re-hashed. A file is suspect if it has been modified
+        since it was ingested (for example, by a download that was interrupted while it
+        was being copied over an older version of the file). Otherwise, a random sample of
+        the files are suspect.
+        """
+        modified = datetime.fromtimestamp(stat.st_mtime)
+        for cache_info in cache_infos:
+            ingested = cast(datetime, cache_info.last_ingestion_time)
+            if modified > ingested + timedelta(minutes=1):
+                return True
+        return random.random() < self.sample_fraction
+
+    def _filename(self, cache_info: models.CacheInfo) -> Path:
+        if cache_info.cache_key == KEYS.COVER_ART_FILE:
+            return self.cover_art_dir.joinpath(str(cache_info.file_hash))
+        return self.compute_song_filename(cache_info)
+
+    def _hash(
+        self,
+        filename: Path,
+        throttle: Throttle,
+        report: VerificationReport,
+    ) -> Optional[str]:
+        if self.stop_event.is_set():
+            return None
+
+        file_hash = hashlib.sha1()
+        size = 0
+        try:
+            with open(filename, "rb") as f:
+                while chunk := f.read(1024 * 1024):
+                    file_hash.update(chunk)
+                    size += len(chunk)
+                    throttle.consume(len(chunk))
+                    if self.stop_event.is_set():
+                        return None
+        except OSError:
+            logging.exception(f"Failed to verify {filename}")
+            return None
+
+        # Incrementing these isn't atomic, but they are only informational.
+        report.hashed_files += 1
+        report.hashed_bytes += size
+        return file_hash.hexdigest()
+
+    def _invalidate(self, cache_infos: List[models.CacheInfo]):
+        with self.db_write_lock, models.database.atomic():
+            models.CacheInfo.update({"valid": False}).where(
+                models.CacheInfo.id.in_([c.id for c in cache_infos])
+            ).execute()
+
+    def _quarantine(
+        self,
+        filename: Path,
+        cache_infos: List[models.CacheInfo],
+        report: VerificationReport,
+    ):
+        with self.db_write_lock, models.database.atomic():
+            # Make sure that the file wasn't re-downloaded while it was being hashed.
+            if any(
+                c.file_hash != cache_infos[0].file_hash
+                for c in models.CacheInfo.select().where(
+                    models.CacheInfo.id.in_([c.id for c in cache_infos])
+                )
+            ):
+                return
+
+            logging.warning(f"{filename} does not match its hash. Quarantining it.")
+            self.quarantine_dir.mkdir(parents=True, exist_ok=True)
+            destination = self.quarantine_dir.joinpath(
+                f"{datetime.now():%Y%m%d%H%M%S}-{filename.name}"
+            )
+            try:
+                shutil.move(str(filename), str(destination))
+                # The quarantine retention starts now, not when the file was modified.
+                os.utime(destination)
+            except OSError:
+                logging.exception(f"Failed to quarantine {filename}")
+                return
+
+            models.CacheInfo.update({"valid": False}).where(
+                models.CacheInfo.id.in_([c.id for c in cache_infos])
+            ).execute()
+            report.quarantined_files.append(destination)
+
+    def _delete_orphans(self, files: Set[Path], report: VerificationReport):
+        newest = (datetime.now() - self.orphan_grace_period).timestamp()
+        for directory in (self.music_dir, self.cover_art_dir):
+            for root, _, filenames in os.walk(directory):
+                for name in filenames:
+                    if self.stop_event.is_set():
+                        return
+
+                    path = Path(root, name)
+                    if path in files:
+                        continue
+                    try:
+                        stat = path.stat()
+                        if stat.st_mtime > newest:
+                            continue
+                        path.unlink()
+                    except OSError:
+                        logging.exception(f"Failed to delete orphaned file {path}")
+                        continue
+
+                    report.orphaned_files += 1
+                    report.reclaimed_bytes += stat.st_size
+
+    def _purge_quarantine(self):
+        if not self.quarantine_dir.exists():
+            return
+
+        oldest = (datetime.now() - self.quarantine_retention).timestamp()
+        for path in self.quarantine_dir.iterdir():
+            try:
+                if path.stat().st_mtime < oldest:
+                    path.unlink()
+            except OSError:
+                logging.exception(f"Failed to delete quarantined file {path}")
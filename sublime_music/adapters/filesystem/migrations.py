@@ -0,0 +1,105 @@
+"""
+Schema migrations for the cache database.
+
+Each :class:`Migration` is tagged with the schema version that it migrates the database
+to. The version of the database is stored in the :class:`models.Version` table, and on
+startup every migration that is newer than that version is run in order.
+
+A fresh database is created directly from the current models and stamped with
+:data:`SCHEMA_VERSION`, so it never runs any migrations. Because of that, migrations
+must be idempotent: they should only add the indexes, columns, and tables that the
+current models declare, and they should do nothing if those already exist.
+
+Migrations that the code does not depend on for correctness (for example, adding
+indexes) can be marked as ``background`` migrations. These are run on a separate thread
+after startup so that a large cache does not delay the application from starting.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Sequence, Type
+
+from peewee import Field, Model
+from playhouse.migrate import SqliteMigrator
+
+from . import models
+
+
+@dataclass
+class Migration:
+    version: str
+    migrate: Callable[[SqliteMigrator], None]
+    background: bool = False
+
+
+# Migration Helpers
+# =============================================================================
+def create_indexes(*tables: Type[Model]) -> Callable[[SqliteMigrator], None]:
+    """
+    Returns a migration function which creates all of the indexes declared on the given
+    models (if they don't already exist).
+    """
+
+    def do_create_indexes(_: SqliteMigrator):
+        # The tables already exist, so this only creates the missing indexes.
+        models.database.create_tables(tables, safe=True)
+
+    return do_create_indexes
+
+
+def add_columns(*fields: Field) -> Callable[[SqliteMigrator], None]:
+    """
+    Returns a migration function which adds the given model fields as columns (if they
+    don't already exist) along with any indexes declared on them.
+    """
+
+    def do_add_columns(migrator: SqliteMigrator):
+        for field in fields:
+            table = field.model._meta.table_name
+            columns = {c.name for c in migrator.database.get_columns(table)}
+            if field.column_name in columns:
+                continue
+
+            migrator.add_column(table, field.column_name, field).run()
+            if field.index or field.unique:
+                # The table already exists, so this only creates the missing indexes.
+                field.model.create_table(safe=True)
+
+    return do_add_columns
+
+
+# Migrations
+# =============================================================================
+MIGRATIONS: Sequence[Migration] = (
+    Migration(
+        "0.13.0",
+        create_indexes(
+            models.Album,
+            models.AlbumQueryResult.albums.get_through_model(),  # type: ignore[attr-defined]
+            models.CacheInfo,
+            models.Directory,
+            models.Playlist._songs.get_through_model(),  # type: ignore[attr-defined]
+            models.Song,
+        ),
+        background=True,
+    ),
+    Migration("0.13.1", create_indexes(models.Album, models.Artist), background=True),
+    Migration(
+        "0.13.2",
+        add_columns(
+            models.Album.sort_key,
+            models.Artist.sort_key,
+            models.Directory.sort_key,
+            models.Song.sort_key,
+        ),
+    ),
+    Migration("0.13.3", lambda _: models.update_sort_keys(), background=True),
+    Migration("0.13.4", create_indexes(models.Directory, models.Song), background=True),
+    Migration("0.13.5", lambda _: models.create_search_indexes(), background=True),
+    Migration("0.13.6", add_columns(models.SongPlay.source)),
+    Migration(
+        "0.13.7",
+        add_columns(models.CacheInfo.variant_format, models.CacheInfo.variant_max_bit_rate),
+    ),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
@@ -1,17 +1,26 @@
-from typing import List, Optional, Union
+import heapq
+import logging
+import zlib
+from typing import Any, List, Optional, Union
 
 from peewee import (
+    JOIN,
+    SQL,
     AutoField,
     BooleanField,
+    Field,
     ForeignKeyField,
     IntegerField,
     Model,
+    OperationalError,
     Query,
     SqliteDatabase,
     TextField,
-    prefetch,
+    fn,
 )
 
+from sublime_music.util import sort_key
+
 from .sqlite_extensions import (
     CacheConstantsField,
     DurationField,
@@ -22,12 +31,83 @@ from .sqlite_extensions import (
 database = SqliteDatabase(None)
 
 
+@database.func("shuffle_key", deterministic=True)
+def shuffle_key(seed: int, value: str) -> int:
+    """
+    A deterministic pseudo-random sort key for ``value``. Sorting by this gives a random
+    order which is stable for a given ``seed``, so it can be paged through.
+    """
+    return zlib.crc32(f"{seed}:{value}".encode())
+
+
+@database.func("sort_key", deterministic=True)
+def _sort_key(value: Optional[str], ignored_articles: str) -> str:
+    return sort_key(value, set(ignored_articles.split()))
+
+
 # Models
 # =============================================================================
 class BaseModel(Model):
     class Meta:
         database = database
 
+    @classmethod
+    def select_joined(cls) -> Query:
+        """
+        Select the rows of this model along with the related rows that are needed to
+        render them (see :class:`join_relations`).
+        """
+        return cls.join_relations(cls.select())
+
+    @classmethod
+    def join_relations(cls, query: Query) -> Query:
+        """
+        Eagerly join the related rows that are accessed when rendering this model onto
+        the given query of this model, so that accessing them doesn't cause an extra
+        query per row.
+        """
+        return query
+
+
+def _join_cache_info(query: Query, model: Any, field: ForeignKeyField) -> Query:
+    cache_info = CacheInfo.alias()
+    return (
+        query.select_extend(cache_info)  # type: ignore[attr-defined]
+        .switch(model)
+        .join(cache_info, JOIN.LEFT_OUTER, on=(field == cache_info.id), attr=field.name)
+    )
+
+
+def _load_songs(query: Query, album: Optional["Album"] = None) -> List["Song"]:
+    """
+    Load the songs of the given query along with their files, cover art, albums, and
+    artists. The files and cover art are joined onto each row, but rather than joining
+    the albums and artists onto every row, each distinct album and artist is loaded only
+    once and shared between the songs.
+
+    :param query: the query of songs to load.
+    :param album: the album of all of the songs (if known), so it doesn't need to be
+        loaded again.
+    """
+    songs = list(_join_cache_info(_join_cache_info(query, Song, Song.file), Song, Song._cover_art))
+    related_fields: List[Any] = [Song.artist]
+    if album is None:
+        related_fields.append(Song.album)
+    else:
+        for song in songs:
+            song.album = album
+
+    for field in related_fields:
+        model = field.rel_model
+        related_ids = query.select(field)  # type: ignore[attr-defined]
+        related = {
+            r.id: r for r in model.join_relations(model.select().where(model.id.in_(related_ids)))
+        }
+        for song in songs:
+            if (related_id := song.__data__.get(field.name)) in related:
+                setattr(song, field.name, related[related_id])
+    return songs
+
 
 class CacheInfo(BaseModel):
     id = AutoField()
@@ -46,6 +126,10 @@ class CacheInfo(BaseModel):
     size = IntegerField(null=True)
     path = TextField(null=True)
     cache_permanently = BooleanField(null=True)
+    # The variant of a cached song file (see SongFileVariant). Both are null for the
+    # original file.
+    variant_format = TextField(null=True)
+    variant_max_bit_rate = IntegerField(null=True)
 
 
 class Genre(BaseModel):
@@ -57,6 +141,8 @@ class Genre(BaseModel):
 class Artist(BaseModel):
     id = TextField(unique=True, primary_key=True)
     name = TextField(null=True)
+    # The name with the ignored articles stripped (see :class:`update_sort_keys`).
+    sort_key = TextField(null=True, index=True)
     album_count = IntegerField(null=True)
     starred = TzDateTimeField(null=True)
     biography = TextField(null=True)
@@ -65,6 +151,10 @@ class Artist(BaseModel):
 
     _artist_image_url = ForeignKeyField(CacheInfo, null=True)
 
+    @classmethod
+    def join_relations(cls, query: Query) -> Query:
+        return _join_cache_info(query, cls, cls._artist_image_url)
+
     @property
     def artist_image_url(self) -> Optional[str]:
         try:
@@ -72,9 +162,14 @@ class Artist(BaseModel):
         except Exception:
             return None
 
+    @property
+    def albums(self) -> Query:
+        # _albums is a backref from Album
+        return Album.join_relations(self._albums)  # type: ignore
+
     @property
     def similar_artists(self) -> Query:
-        return (
+        return Artist.join_relations(
             Artist.select()
             .join(SimilarArtist, on=(SimilarArtist.similar_artist == Artist.id))
             .where(SimilarArtist.artist == self.id)
@@ -94,19 +189,41 @@ class SimilarArtist(BaseModel):
 
 class Album(BaseModel):
     id = TextField(unique=True, primary_key=True)
-    created = TzDateTimeField(null=True)
+    created = TzDateTimeField(null=True, index=True)
     duration = DurationField(null=True)
     name = TextField(null=True)
-    play_count = IntegerField(null=True)
+    sort_key = TextField(null=True, index=True)
+    play_count = IntegerField(null=True, index=True)
     song_count = IntegerField(null=True)
-    starred = TzDateTimeField(null=True)
-    year = IntegerField(null=True)
+    starred = TzDateTimeField(null=True, index=True)
+    year = IntegerField(null=True, index=True)
 
-    artist = ForeignKeyField(Artist, null=True, backref="albums")
+    artist = ForeignKeyField(Artist, null=True, backref="_albums")
     genre = ForeignKeyField(Genre, null=True, backref="albums")
 
     _cover_art = ForeignKeyField(CacheInfo, null=True)
 
+    class Meta:
+        # Used for the album queries which filter by these and then sort by name.
+        indexes = (
+            (("genre", "sort_key"), False),
+            (("year", "sort_key"), False),
+        )
+
+    @classmethod
+    def join_relations(cls, query: Query) -> Query:
+        query = _join_cache_info(query, cls, cls._cover_art)
+        # Aliased so that the query can also join Artist itself (for example, to sort by
+        # the artist name).
+        artist, genre = Artist.alias(), Genre.alias()
+        return (
+            query.select_extend(artist, genre)  # type: ignore[attr-defined]
+            .switch(cls)
+            .join(artist, JOIN.LEFT_OUTER, on=(cls.artist == artist.id), attr="artist")
+            .switch(cls)
+            .join(genre, JOIN.LEFT_OUTER, on=(cls.genre == genre.name), attr="genre")
+        )
+
     @property
     def cover_art(self) -> Optional[str]:
         try:
@@ -116,17 +233,9 @@ class Album(BaseModel):
 
     @property
     def songs(self) -> List["Song"]:
-        albums = Album.select()
-        artists = Album.select()
-        return sorted(
-            prefetch(
-                # _songs is a backref from Song
-                self._songs,  # type: ignore
-                albums,
-                artists,
-            ),
-            key=lambda s: (s.disc_number or 1, s.track),
-        )
+        # _songs is a backref from Song
+        query = self._songs.order_by(fn.COALESCE(Song.disc_number, 1), Song.track)  # type: ignore
+        return _load_songs(query, album=self)
 
 
 class AlbumQueryResult(BaseModel):
@@ -141,16 +250,24 @@ class IgnoredArticle(BaseModel):
 class Directory(BaseModel):
     id = TextField(unique=True, primary_key=True)
     name = TextField(null=True)
-    parent_id = TextField(null=True)
+    sort_key = TextField(null=True)
+    parent_id = TextField(null=True, index=True)
+
+    class Meta:
+        indexes = ((("parent_id", "sort_key"), False),)
 
     _children: Optional[List[Union["Directory", "Song"]]] = None
 
     @property
     def children(self) -> List[Union["Directory", "Song"]]:
         if not self._children:
-            self._children = list(Directory.select().where(Directory.parent_id == self.id)) + list(
-                Song.select().where(Song.parent_id == self.id)
+            directories = (
+                Directory.select()
+                .where(Directory.parent_id == self.id)
+                .order_by(Directory.sort_key)
             )
+            songs = Song.select().where(Song.parent_id == self.id).order_by(Song.sort_key)
+            self._children = list(heapq.merge(directories, songs, key=lambda c: c.sort_key or ""))
         return self._children
 
     @children.setter
@@ -161,9 +278,11 @@ class Directory(BaseModel):
 class Song(BaseModel):
     id = TextField(unique=True, primary_key=True)
     title = TextField()
+    # Used to sort the songs in directories.
+    sort_key = TextField(null=True)
     duration = DurationField(null=True)
 
-    parent_id = TextField(null=True)
+    parent_id = TextField(null=True, index=True)
     album = ForeignKeyField(Album, null=True, backref="_songs")
     artist = ForeignKeyField(Artist, null=True)
     genre = ForeignKeyField(Genre, null=True, backref="songs")
@@ -171,6 +290,9 @@ class Song(BaseModel):
     # figure out how to deal with different transcodings, etc.
     file = ForeignKeyField(CacheInfo, null=True)
 
+    class Meta:
+        indexes = ((("parent_id", "sort_key"), False),)
+
     @property
     def size(self) -> Optional[int]:
         try:
@@ -200,6 +322,20 @@ class Song(BaseModel):
     user_rating = IntegerField(null=True)
     starred = TzDateTimeField(null=True)
 
+    @classmethod
+    def join_relations(cls, query: Query) -> Query:
+        query = _join_cache_info(query, cls, cls.file)
+        query = _join_cache_info(query, cls, cls._cover_art)
+        return (
+            query.select_extend(Album, Artist, Genre)  # type: ignore[attr-defined]
+            .switch(cls)
+            .join(Album, JOIN.LEFT_OUTER, on=(cls.album == Album.id), attr="album")
+            .switch(cls)
+            .join(Artist, JOIN.LEFT_OUTER, on=(cls.artist == Artist.id), attr="artist")
+            .switch(cls)
+            .join(Genre, JOIN.LEFT_OUTER, on=(cls.genre == Genre.name), attr="genre")
+        )
+
 
 class Playlist(BaseModel):
     id = TextField(unique=True, primary_key=True)
@@ -216,12 +352,15 @@ class Playlist(BaseModel):
 
     @property
     def songs(self) -> List[Song]:
-        albums = Album.select()
-        artists = Album.select()
-        return prefetch(self._songs, albums, artists)
+        # The _songs query is already ordered by the position in the playlist.
+        return _load_songs(self._songs)
 
     _cover_art = ForeignKeyField(CacheInfo, null=True)
 
+    @classmethod
+    def join_relations(cls, query: Query) -> Query:
+        return _join_cache_info(query, cls, cls._cover_art)
+
     @property
     def cover_art(self) -> Optional[str]:
         try:
@@ -230,6 +369,18 @@ class Playlist(BaseModel):
             return None
 
 
+class SongPlay(BaseModel):
+    # This is intentionally not a foreign key to Song so that the play history survives
+    # song invalidation and re-ingestion.
+    song_id = TextField()
+    played_at = TzDateTimeField()
+    # Where the song was played from, for example ``playlist:<id>`` or ``album:<id>``.
+    source = TextField(null=True)
+
+    class Meta:
+        indexes = ((("song_id", "played_at"), False),)
+
+
 class Version(BaseModel):
     id = IntegerField(unique=True, primary_key=True)
     major = IntegerField()
@@ -239,19 +390,178 @@ class Version(BaseModel):
     @staticmethod
     def is_less_than(semver: str) -> bool:
         major, minor, patch = map(int, semver.split("."))
-        version, created = Version.get_or_create(
-            id=0, defaults={"major": major, "minor": minor, "patch": patch}
-        )
-        if created:
+        version = Version.get_or_none(Version.id == 0)
+        if version is None:
             # There was no version before, definitely out-of-date
             return True
 
-        return version.major < major or version.minor < minor or version.patch < patch
+        return (version.major, version.minor, version.patch) < (major, minor, patch)
 
     @staticmethod
     def update_version(semver: str):
         major, minor, patch = map(int, semver.split("."))
-        Version.update(major=major, minor=minor, patch=patch)
+        Version.replace(id=0, major=major, minor=minor, patch=patch).execute()
+
+
+def update_sort_keys():
+    """
+    Recompute the sort keys of every artist, album, directory, and song from the current
+    ignored articles. This only needs to be done when the ignored articles change,
+    otherwise the sort key is computed when the row is ingested.
+    """
+    ignored_articles = " ".join(a.name.casefold() for a in IgnoredArticle.select())
+    for model, field in (
+        (Artist, Artist.name),
+        (Album, Album.name),
+        (Directory, Directory.name),
+        (Song, Song.title),
+    ):
+        model.update(sort_key=fn.sort_key(field, ignored_articles)).execute()
+
+
+# Search Index
+# =============================================================================
+# The fields which are searched. Each of them has an FTS5 trigram index which uses the
+# model's table as its external content, and is kept up-to-date by triggers so that every
+# way of writing to the table (including deleting everything) is reflected in it.
+SEARCH_FIELDS = (Album.name, Artist.name, Playlist.name, Song.title)
+
+
+def _search_index_name(field: Field) -> str:
+    return f"{field.model._meta.table_name}_search"
+
+
+def create_search_indexes():
+    """
+    Create the search indexes and the triggers that keep them up-to-date (if they don't
+    already exist), and populate any new index from the existing rows.
+
+    If the SQLite library doesn't support FTS5 with the trigram tokenizer, the indexes
+    are not created and searches fall back to scanning the tables.
+    """
+    for field in SEARCH_FIELDS:
+        table, column = field.model._meta.table_name, field.column_name
+        index = _search_index_name(field)
+        if database.table_exists(index):
+            continue
+
+        try:
+            database.execute_sql(
+                f"CREATE VIRTUAL TABLE {index} USING fts5("
+                f"{column}, content='{table}', content_rowid='rowid', tokenize='trigram')"
+            )
+        except OperationalError:
+            logging.warning("SQLite doesn't support FTS5 trigram indexes, not indexing")
+            return
+
+        insert = f"INSERT INTO {index}(rowid, {column}) VALUES (new.rowid, new.{column});"
+        delete = (
+            f"INSERT INTO {index}({index}, rowid, {column}) "
+            f"VALUES ('delete', old.rowid, old.{column});"
+        )
+        for name, event, body in (
+            ("insert", "INSERT", insert),
+            ("delete", "DELETE", delete),
+            ("update", f"UPDATE OF {column}", delete + insert),
+        ):
+            database.execute_sql(
+                f"CREATE TRIGGER IF NOT EXISTS {index}_{name} "
+                f"AFTER {event} ON {table} BEGIN {body} END"
+            )
+        database.execute_sql(f"INSERT INTO {index}({index}) VALUES ('rebuild')")
+
+
+def search_index_exists() -> bool:
+    return all(database.table_exists(_search_index_name(f)) for f in SEARCH_FIELDS)
+
+
+# The number of the n-grams of a query that a candidate for it can be missing. A single
+# typo changes at most three trigrams.
+SEARCH_MISSING_NGRAMS = 3
+
+
+def search_ngrams(query: str) -> List[str]:
+    """
+    The distinct trigrams of ``query`` (see :class:`search_candidates`). Queries of three
+    characters use their bigrams instead (a typo would leave no matching trigram), and
+    shorter queries are used as is.
+    """
+    query = query.casefold()
+    length = 2 if len(query) == 3 else min(len(query), 3)
+    return sorted({query[i : i + length] for i in range(len(query) - length + 1)})
+
+
+def _search_missing_ngrams(ngrams: List[str]) -> int:
+    # A candidate has to contain at least one of the n-grams.
+    return min(SEARCH_MISSING_NGRAMS, len(ngrams) - 1)
+
+
+def is_search_candidate(query: str, value: Optional[str]) -> bool:
+    """Whether ``value`` is a candidate for ``query`` (see :class:`search_candidates`)."""
+    if value is None:
+        return False
+    value = value.casefold()
+    ngrams = search_ngrams(query)
+    return sum(n not in value for n in ngrams) <= _search_missing_ngrams(ngrams)
+
+
+def search_candidates_include(previous_query: str, query: str) -> bool:
+    """
+    Whether every candidate for ``query`` is also a candidate for ``previous_query``.
+    This is the case if ``query`` has all of the n-grams of ``previous_query`` (for
+    example, because it extends it), and a candidate for it can't be missing more of
+    them. Since the number of n-grams that can be missing stops growing once a query has
+    more than :class:`SEARCH_MISSING_NGRAMS` of them, that holds for every extension of
+    such a query.
+    """
+    previous_ngrams, ngrams = search_ngrams(previous_query), search_ngrams(query)
+    return set(previous_ngrams) <= set(ngrams) and (
+        _search_missing_ngrams(ngrams) <= _search_missing_ngrams(previous_ngrams)
+    )
+
+
+def search_candidates(field: Field, query: str, limit: int, use_index: bool = True) -> SQL:
+    """
+    A subquery which selects the primary keys of at most ``limit`` rows whose ``field``
+    could be a fuzzy match for ``query``. The candidates still have to be scored.
+
+    A row is a candidate if its value contains at least one of the n-grams of ``query``
+    (see :class:`search_ngrams`), and all of them except for at most
+    :class:`SEARCH_MISSING_NGRAMS` (so that a typo still matches).
+
+    Candidates of queries with trigrams are found by the search index, and the ones
+    which contain the most trigrams are ranked first. Shorter n-grams can't use the
+    index, so those candidates (and all candidates if ``use_index`` is ``False``) are
+    found by scanning the table and shorter values are ranked first.
+    """
+    table, column = field.model._meta.table_name, field.column_name
+    primary_key = field.model._meta.primary_key.column_name
+    ngrams = search_ngrams(query)
+    min_matches = len(ngrams) - _search_missing_ngrams(ngrams)
+
+    if use_index and min(len(n) for n in ngrams) >= 3:
+        index = _search_index_name(field)
+        # Each trigram is matched separately so that the matches can be counted.
+        matches = " UNION ALL ".join(
+            f"SELECT rowid FROM {index} WHERE {index} MATCH ?" for _ in ngrams
+        )
+        return SQL(
+            f"(SELECT {primary_key} FROM {table} WHERE rowid IN ("
+            f"SELECT rowid FROM ({matches}) GROUP BY rowid HAVING count(*) >= ? "
+            "ORDER BY count(*) DESC LIMIT ?))",
+            (*('"{}"'.format(n.replace('"', '""')) for n in ngrams), min_matches, limit),
+        )
+
+    patterns = [
+        "%{}%".format(n.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_"))
+        for n in ngrams
+    ]
+    return SQL(
+        f"(SELECT {primary_key} FROM {table} WHERE "
+        + " + ".join(f"({column} LIKE ? ESCAPE '\\')" for _ in patterns)
+        + f" >= ? ORDER BY length({column}) LIMIT ?)",
+        (*patterns, min_matches, limit),
+    )
 
 
 ALL_TABLES = (
@@ -267,5 +577,6 @@ ALL_TABLES = (
     Playlist._songs.get_through_model(),
     SimilarArtist,
     Song,
+    SongPlay,
     Version,
 )
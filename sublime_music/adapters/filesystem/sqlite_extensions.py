@@ -1,7 +1,8 @@
+from bisect import bisect_left
+from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import Any, Optional, Sequence
+from typing import Any, Dict, List, Optional, Sequence, Tuple, cast
 
-from peewee import ensure_tuple  # type: ignore
 from peewee import (  # type: ignore
     DoubleField,
     ForeignKeyField,
@@ -12,6 +13,8 @@ from peewee import (  # type: ignore
     Model,
     SelectQuery,
     TextField,
+    chunked,
+    ensure_tuple,
 )
 
 from sublime_music.adapters.adapter_base import CachingAdapter
@@ -23,8 +26,9 @@ class CacheConstantsField(TextField):
     def db_value(self, value: CachingAdapter.CachedDataKey) -> str:
         return value.value
 
-    def python_value(self, value: str) -> CachingAdapter.CachedDataKey:
-        return CachingAdapter.CachedDataKey(value)
+    def python_value(self, value: Optional[str]) -> Optional[CachingAdapter.CachedDataKey]:
+        # The value can be NULL if the CacheInfo is LEFT OUTER JOINed.
+        return CachingAdapter.CachedDataKey(value) if value else None
 
 
 class DurationField(DoubleField):
@@ -46,26 +50,135 @@ class TzDateTimeField(TextField):
 # Sorted M-N Association Field
 # =============================================================================
 class SortedManyToManyQuery(ManyToManyQuery):
-    def add(self, value: Sequence[Any], clear_existing: bool = False):
-        if clear_existing:
-            self.clear()
+    # Positions are spaced out so that rows can be inserted between existing rows
+    # without renumbering every row after them.
+    position_gap = 1024
 
+    def add(self, value: Sequence[Any], clear_existing: bool = False):
         accessor = self._accessor  # type: ignore
         src_id = getattr(self._instance, self._src_attr)  # type: ignore
         assert not isinstance(value, SelectQuery)
         value = ensure_tuple(value)
-        if not value:
-            return
-
-        inserts = [
-            {
-                accessor.src_fk.name: src_id,
-                accessor.dest_fk.name: rel_id,
-                "position": i,
-            }
-            for i, rel_id in enumerate(self._id_list(value))  # type: ignore
+        rel_ids = self._id_list(value) if value else []  # type: ignore
+
+        through = accessor.through_model
+        src_fk, dest_fk = accessor.src_fk, accessor.dest_fk
+        existing = list(
+            through.select(through._meta.primary_key, dest_fk, through.position)
+            .where(src_fk == src_id)
+            .order_by(through.position)
+            .tuples()
+        )
+
+        if clear_existing:
+            deletes, inserts = self._diff(existing, rel_ids)
+        else:
+            start = existing[-1][2] + self.position_gap if existing else 0
+            deletes = []
+            inserts = [(rel_id, start + i * self.position_gap) for i, rel_id in enumerate(rel_ids)]
+
+        for batch in chunked(deletes, 500):
+            through.delete().where(through._meta.primary_key.in_(batch)).execute()
+        rows = (
+            {src_fk.name: src_id, dest_fk.name: rel_id, "position": position}
+            for rel_id, position in inserts
+        )
+        for batch in chunked(rows, 300):
+            through.insert_many(batch).execute()
+
+    def _diff(
+        self,
+        existing: List[Tuple[Any, Any, int]],
+        rel_ids: Sequence[Any],
+    ) -> Tuple[List[Any], List[Tuple[Any, int]]]:
+        """
+        Compute the changes required to turn the ``existing`` through rows into the
+        ``rel_ids`` list.
+
+        The longest subsequence of the existing rows which is still in the same relative
+        order is kept as-is. Every other existing row is deleted, and every other new
+        item is inserted with a position between the kept rows around it. If there is not
+        enough room between two kept rows, all of the rows are renumbered.
+
+        :returns: a tuple of the through row IDs to delete and the ``(rel_id, position)``
+            pairs to insert.
+        """
+        # Match the nth occurrence of each related ID in the new list with the nth
+        # occurrence of it in the existing rows.
+        occurrences: Dict[Any, List[int]] = defaultdict(list)
+        for i, (_, rel_id, _) in enumerate(existing):
+            occurrences[rel_id].append(i)
+        for indexes in occurrences.values():
+            indexes.reverse()
+        matches = [
+            occurrences[rel_id].pop() if occurrences.get(rel_id) else None for rel_id in rel_ids
         ]
-        accessor.through_model.insert_many(inserts).execute()
+
+        kept = _longest_increasing_subsequence(matches)
+        kept_indexes = {matches[i] for i in kept}
+        deletes = [row[0] for i, row in enumerate(existing) if i not in kept_indexes]
+
+        inserts = []
+        # Add sentinels for the start and end so that every run of new items is between
+        # two kept items.
+        boundaries = [-1, *kept, len(rel_ids)]
+        for lo, hi in zip(boundaries, boundaries[1:]):
+            count = hi - lo - 1
+            if count == 0:
+                continue
+
+            if lo == -1 and hi == len(rel_ids):
+                lo_pos, hi_pos = -self.position_gap, count * self.position_gap
+            elif lo == -1:
+                hi_pos = existing[cast(int, matches[hi])][2]
+                lo_pos = hi_pos - (count + 1) * self.position_gap
+            elif hi == len(rel_ids):
+                lo_pos = existing[cast(int, matches[lo])][2]
+                hi_pos = lo_pos + (count + 1) * self.position_gap
+            else:
+                lo_pos = existing[cast(int, matches[lo])][2]
+                hi_pos = existing[cast(int, matches[hi])][2]
+
+            if hi_pos - lo_pos <= count:
+                # There's no room between the kept rows, so renumber everything.
+                return (
+                    [row[0] for row in existing],
+                    [(rel_id, i * self.position_gap) for i, rel_id in enumerate(rel_ids)],
+                )
+
+            for j in range(count):
+                position = lo_pos + (hi_pos - lo_pos) * (j + 1) // (count + 1)
+                inserts.append((rel_ids[lo + j + 1], position))
+
+        return deletes, inserts
+
+
+def _longest_increasing_subsequence(values: Sequence[Optional[int]]) -> List[int]:
+    """
+    :returns: the indexes of the longest strictly increasing subsequence of the
+        non-``None`` ``values``.
+    """
+    tail_values: List[int] = []
+    tail_indexes: List[int] = []
+    previous: Dict[int, Optional[int]] = {}
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        length = bisect_left(tail_values, value)
+        previous[i] = tail_indexes[length - 1] if length > 0 else None
+        if length == len(tail_values):
+            tail_values.append(value)
+            tail_indexes.append(i)
+        else:
+            tail_values[length] = value
+            tail_indexes[length] = i
+
+    result: List[int] = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        result.append(index)
+        index = previous[index]
+    return result[::-1]
 
 
 class SortedManyToManyFieldAccessor(ManyToManyFieldAccessor):
@@ -109,7 +222,11 @@ class SortedManyToManyField(ManyToManyField):
             database = self.model._meta.database
             schema = self.model._meta.schema
             table_name = "{}_{}_through".format(*tables)
-            indexes = (((lhs._meta.name, rhs._meta.name, "position"), True),)
+            indexes = (
+                ((lhs._meta.name, rhs._meta.name, "position"), True),
+                # Used for retrieving the related rows in order.
+                ((lhs._meta.name, "position"), False),
+            )
 
         params = {"on_delete": self._on_delete, "on_update": self._on_update}  # type: ignore
         attrs = {
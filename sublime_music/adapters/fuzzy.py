@@ -0,0 +1,93 @@
+"""
+Batch fuzzy scoring for search results.
+"""
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from rapidfuzz import fuzz, process
+
+# Candidate sets with more strings than this are split into chunks which are scored on
+# separate threads. RapidFuzz releases the GIL while it scores, so this uses all of the
+# cores.
+PARALLEL_THRESHOLD = 50000
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(thread_name_prefix="fuzzy_scoring")
+    return _executor
+
+
+def _extract(
+    query: str,
+    strings: Sequence[Optional[str]],
+    offset: int,
+    limit: int,
+    score_cutoff: float,
+) -> List[Tuple[int, float]]:
+    matches = process.extract(
+        query,
+        strings,
+        scorer=fuzz.partial_ratio,
+        limit=limit,
+        score_cutoff=score_cutoff,
+    )
+    return [(offset + index, score) for _, score, index in matches]
+
+
+def top_k(
+    query: str,
+    fields: Sequence[Sequence[Optional[str]]],
+    k: int,
+    score_cutoff: float = 60,
+) -> List[Tuple[int, float]]:
+    """
+    Score the ``query`` against all of the choices at once using
+    :class:`rapidfuzz.fuzz.partial_ratio` (case-insensitively), and return the ``k``
+    best choices.
+
+    Each choice has one string in each of the ``fields`` (for example, the titles of the
+    songs and the names of their artists) and its score is the best score of any of
+    them. Choices with the same score are returned in the order that they were given.
+
+    Only the ``k`` best matches of each field are kept while scoring, so the choices are
+    never fully sorted.
+
+    :param query: the query string
+    :param fields: the strings of each field of the choices, in the same order. ``None``
+        strings are never matched.
+    :param k: the maximum number of choices to return
+    :param score_cutoff: the minimum score (out of 100) of the returned choices
+    :returns: a list of ``(index, score)`` tuples of the best choices, best first
+    """
+    query = query.lower()
+    workers = os.cpu_count() or 1
+
+    best: Dict[int, float] = {}
+    for field in fields:
+        strings = [s.lower() if s is not None else None for s in field]
+
+        # The best k of each field always include the best k overall, because every
+        # choice that beats a choice in its best field also beats it overall.
+        if len(strings) <= PARALLEL_THRESHOLD or workers == 1:
+            matches = _extract(query, strings, 0, k, score_cutoff)
+        else:
+            chunk_size = -(-len(strings) // workers)
+            futures = [
+                _get_executor().submit(
+                    _extract, query, strings[i : i + chunk_size], i, k, score_cutoff
+                )
+                for i in range(0, len(strings), chunk_size)
+            ]
+            matches = [m for f in futures for m in f.result()]
+
+        for index, score in matches:
+            if score > best.get(index, -1):
+                best[index] = score
+
+    return heapq.nsmallest(k, best.items(), key=lambda m: (-m[1], m[0]))
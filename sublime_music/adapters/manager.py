@@ -3,15 +3,17 @@ import itertools
 import logging
 import os
 import random
+import shutil
 import tempfile
 import threading
-from concurrent.futures import Future, ThreadPoolExecutor
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import timedelta
 from enum import Enum
 from functools import partial
 from pathlib import Path
-from time import sleep
+from time import monotonic, sleep
 from typing import (
     Any,
     Callable,
@@ -32,16 +34,31 @@ import requests
 
 from sublime_music.config import ProviderConfiguration
 
-from ..util import resolve_path
+from ..util import resolve_path, sort_key
 from .adapter_base import (
     Adapter,
     AlbumSearchQuery,
     CacheMissError,
     CachingAdapter,
     SongCacheStatus,
+    SongFileVariant,
+)
+from .api_objects import (
+    Album,
+    AlbumRecord,
+    AlbumRecordPage,
+    Artist,
+    ArtistRecord,
+    Directory,
+    Genre,
+    Playlist,
+    PlaylistRecord,
+    PlayQueue,
+    SearchResult,
+    Song,
 )
-from .api_objects import Album, Artist, Directory, Genre, Playlist, PlayQueue, SearchResult, Song
 from .filesystem import FilesystemAdapter
+from .prefetch import PrefetchPlan, PrefetchPlanner, ThroughputEstimator, UpcomingSong
 from .subsonic import SubsonicAdapter
 
 REQUEST_DELAY: Optional[Tuple[float, float]] = None
@@ -78,7 +95,7 @@ class Result(Generic[T]):
 
     def __init__(
         self,
-        data_resolver: Union[T, Callable[[], T]],
+        data_resolver: Union[T, Callable[[], T], "Future[T]"],
         *args,
         is_download: bool = False,
         default_value: T | None = None,
@@ -87,12 +104,16 @@ class Result(Generic[T]):
         """
         Creates a :class:`Result` object.
 
-        :param data_resolver: the actual data, or a function that will return the actual
-            data. If the latter, the function will be executed by the thread pool.
+        :param data_resolver: the actual data, a function that will return the actual
+            data, or a future that will resolve to the actual data. If it's a function,
+            it will be executed by the thread pool.
         :param is_download: whether or not this result requires a file download. If it
             does, then it uses a separate executor.
         """
-        if callable(data_resolver):
+        if isinstance(data_resolver, Future):
+            self._future = data_resolver
+            self._future.add_done_callback(self._on_future_complete)
+        elif callable(data_resolver):
             if is_download:
                 self._future = AdapterManager.download_executor.submit(data_resolver, *args)
             else:
@@ -161,6 +182,153 @@ class Result(Generic[T]):
         return self._data is not None
 
 
+class DebounceScheduler:
+    """
+    Runs functions on the :class:`AdapterManager` executor once they haven't been
+    rescheduled for a given delay. All of the pending functions are waited for by a single
+    timer thread, so no worker thread is held while waiting.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending: Dict[str, Tuple[float, Callable[[], Any]]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, key: str, delay: float, fn: Callable[[], Any]):
+        """
+        Run ``fn`` after ``delay`` seconds, replacing any function that is still pending
+        for the same ``key``.
+        """
+        with self._condition:
+            self._pending[key] = (monotonic() + delay, fn)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="DebounceScheduler", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def cancel(self, key: str, fn: Callable[[], Any] | None = None):
+        """
+        Cancel the function pending for ``key`` (if it's still ``fn``, if given).
+        """
+        with self._condition:
+            if key in self._pending and fn in (None, self._pending[key][1]):
+                del self._pending[key]
+                self._condition.notify()
+
+    def shutdown(self):
+        """
+        Cancel all of the pending functions and stop the timer thread. Functions which
+        are scheduled afterwards start a new timer thread.
+        """
+        with self._condition:
+            self._pending.clear()
+            self._thread = None
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._thread is not threading.current_thread():
+                    # The scheduler was shut down.
+                    return
+                now = monotonic()
+                due = [key for key, (deadline, _) in self._pending.items() if deadline <= now]
+                if not due:
+                    deadlines = [deadline for deadline, _ in self._pending.values()]
+                    self._condition.wait(min(deadlines) - now if deadlines else None)
+                    continue
+                functions = [self._pending.pop(key)[1] for key in due]
+
+            for fn in functions:
+                try:
+                    AdapterManager.executor.submit(fn)
+                except RuntimeError:
+                    # The executor was shut down while the function was pending.
+                    logging.debug("Not running a debounced function after shutdown")
+
+
+class ServerSearch:
+    """
+    A search of the ground truth adapter which requests each type of result a page at a
+    time. Each page is requested in parallel and the aggregated results are passed to the
+    ``search_callback`` as soon as each page is returned, so a slow type of result does
+    not hold up the others.
+    """
+
+    result_types = ("artists", "albums", "songs")
+
+    def __init__(
+        self,
+        search_result: SearchResult,
+        search_callback: Callable[[SearchResult], None],
+        on_idle: Callable[[], None],
+    ):
+        self.search_result = search_result
+        self.search_callback = search_callback
+        self.cancelled = False
+        self._on_idle = on_idle
+        self._lock = threading.Lock()
+        # The offset of the next page of each type of result, or None if the server has
+        # returned all of the results of that type.
+        self._offsets: Dict[str, Optional[int]] = dict.fromkeys(self.result_types, 0)
+        self._in_flight: Set[str] = set()
+
+    def fetch_next_pages(self) -> bool:
+        """
+        Request the next page of each type of result that has more results and isn't
+        already being requested.
+
+        :returns: whether or not any pages were requested.
+        """
+        with self._lock:
+            result_types = [
+                t
+                for t, offset in self._offsets.items()
+                if offset is not None and t not in self._in_flight
+            ]
+            self._in_flight.update(result_types)
+
+        for result_type in result_types:
+            AdapterManager.executor.submit(self._fetch_page, result_type)
+        return len(result_types) > 0
+
+    def _fetch_page(self, result_type: str):
+        assert AdapterManager._instance
+        query = cast(str, self.search_result.query)
+        offset = cast(int, self._offsets[result_type])
+        count = AdapterManager.search_page_size
+
+        page: Optional[SearchResult] = None
+        if not self.cancelled:
+            try:
+                start = monotonic()
+                page = AdapterManager._instance.ground_truth_adapter.search_page(
+                    query, result_type, offset, count
+                )
+                AdapterManager._record_search_latency(monotonic() - start)
+            except Exception:
+                logging.exception(f"Failed getting {result_type} from server for '{query}'")
+
+        with self._lock:
+            self._in_flight.discard(result_type)
+            if page:
+                # A short page means that there are no more results of this type.
+                got_full_page = len(getattr(page, f"_{result_type}")) >= count
+                self._offsets[result_type] = offset + count if got_full_page else None
+                self.search_result.update(page)
+            idle = len(self._in_flight) == 0
+
+        if page:
+            if not self.cancelled:
+                self.search_callback(self.search_result)
+            AdapterManager._queue_search_results_ingest(page)
+
+        if idle:
+            self._on_idle()
+
+
 @dataclass
 class DownloadProgress:
     class Type(Enum):
@@ -188,12 +356,25 @@ class AdapterManager:
     download_set_lock = threading.Lock()
     executor: ThreadPoolExecutor = ThreadPoolExecutor()
     download_executor: ThreadPoolExecutor = ThreadPoolExecutor()
+    debounce_scheduler = DebounceScheduler()
     is_shutting_down: bool = False
     _offline_mode: bool = False
 
     _song_download_jobs: Dict[str, Result[str]] = {}
     _cancelled_song_ids: Set[str] = set()
 
+    # Song files that were downloaded while streaming, but which the caching adapter did
+    # not admit into the cache. They stay in the download directory (so that the player
+    # can still use them) until they are pushed out by newer songs.
+    _buffered_song_files: "OrderedDict[str, Tuple[str, SongFileVariant]]" = OrderedDict()
+    _buffered_song_files_lock = threading.Lock()
+    buffered_song_file_limit: int = 10
+    # The song files that players are downloading as they stream them (see
+    # start_song_file_tee).
+    _song_file_tees: Dict[str, Future] = {}
+    # The AppConfiguration, which the app updates in place when the settings change.
+    _app_config: Any = None
+
     @dataclass
     class _AdapterManagerInternal:
         ground_truth_adapter: Adapter
@@ -248,6 +429,12 @@ class AdapterManager:
         for _, job in AdapterManager._song_download_jobs.items():
             job.cancel()
 
+        AdapterManager.debounce_scheduler.shutdown()
+        AdapterManager._ingest_search_results()
+        logging.info(
+            f"Play predictions: {dict(AdapterManager.prediction_stats)} "
+            f"(hit rate: {AdapterManager.prediction_hit_rate()})"
+        )
         AdapterManager.executor.shutdown()
         AdapterManager.download_executor.shutdown()
         if AdapterManager._instance:
@@ -265,10 +452,14 @@ class AdapterManager:
         assert isinstance(config, AppConfiguration)
 
         # First, shutdown the current one...
+        AdapterManager.debounce_scheduler.cancel("search-ingest")
+        AdapterManager._ingest_search_results()
+        AdapterManager._current_server_search = None
         if AdapterManager._instance:
             AdapterManager._instance.shutdown()
 
         AdapterManager._offline_mode = config.offline_mode
+        AdapterManager._app_config = config
 
         assert config.provider is not None
         assert isinstance(config.provider, ProviderConfiguration)
@@ -341,10 +532,14 @@ class AdapterManager:
         *params: Any,
         before_download: Callable[[], None] | None = None,
         partial_data: Any = None,
+        transform_result: Callable[[Any], Any] | None = None,
         **kwargs,
     ) -> Result:
         """
         Creates a Result using the given ``function_name`` on the ground truth adapter.
+
+        :param transform_result: a function to apply to the data returned by the ground
+            truth adapter.
         """
 
         def future_fn() -> Any:
@@ -359,9 +554,10 @@ class AdapterManager:
                 before_download()
             fn = getattr(AdapterManager._instance.ground_truth_adapter, function_name)
             try:
-                return fn(*params, **kwargs)
+                result = fn(*params, **kwargs)
             except Exception as e:
                 raise CacheMissError(partial_data=partial_data) from e
+            return transform_result(result) if transform_result else result
 
         return Result(future_fn)
 
@@ -371,12 +567,17 @@ class AdapterManager:
         id: str,
         before_download: Callable[[], None] | None = None,
         expected_size: int | None = None,
+        report_progress: bool = False,
         **result_args,
     ) -> Result[str]:
         """
         Create a function to download the given URI to a temporary file, and return the
         filename. The returned function will spin-loop if the resource is already being
         downloaded to prevent multiple requests for the same download.
+
+        :param expected_size: the size that the download must have, if it is known.
+        :param report_progress: whether to report the download progress even if the
+            size isn't known ahead of time. It is always reported if it is.
         """
         download_cancelled = False
 
@@ -396,6 +597,7 @@ class AdapterManager:
                 before_download()
 
             expected_size_exists = expected_size is not None
+            should_report_progress = report_progress or expected_size_exists
             if expected_size_exists:
                 AdapterManager._instance.song_download_progress(
                     id,
@@ -445,6 +647,7 @@ class AdapterManager:
 
                     block_size = 1024  # 1 KiB
                     total_consumed = 0
+                    download_start = monotonic()
 
                     with open(download_tmp_filename, "wb+") as f:
                         for i, data in enumerate(request.iter_content(block_size)):
@@ -464,7 +667,7 @@ class AdapterManager:
                                 if DOWNLOAD_BLOCK_DELAY is not None:
                                     sleep(DOWNLOAD_BLOCK_DELAY)
 
-                                if expected_size_exists:
+                                if should_report_progress and total_size:
                                     AdapterManager._instance.song_download_progress(
                                         id,
                                         DownloadProgress(
@@ -475,13 +678,16 @@ class AdapterManager:
                                     )
 
                     # Everything succeeded.
-                    if expected_size_exists:
+                    AdapterManager.download_throughput.record(
+                        total_consumed, monotonic() - download_start
+                    )
+                    if should_report_progress:
                         AdapterManager._instance.song_download_progress(
                             id,
                             DownloadProgress(DownloadProgress.Type.DONE),
                         )
                 except Exception as e:
-                    if expected_size_exists and not download_cancelled:
+                    if should_report_progress and not download_cancelled:
                         # Something failed. Post an error.
                         AdapterManager._instance.song_download_progress(
                             id,
@@ -537,6 +743,7 @@ class AdapterManager:
         use_ground_truth_adapter: bool = False,
         allow_download: bool = True,
         on_result_finished: Callable[[Result], None] | None = None,
+        transform_ground_truth_result: Callable[[Any], Any] | None = None,
         **kwargs: Any,
     ) -> Result:
         """
@@ -552,6 +759,9 @@ class AdapterManager:
         :param on_result_finished: A function to run after the result received from the
             ground truth adapter. (Has no effect if the result is from the caching
             adapter.)
+        :param transform_ground_truth_result: A function to apply to the data returned by
+            the ground truth adapter (for example, to sort it the same way that the
+            caching adapter does).
         :param kwargs: The keyword arguments to pass to the adapter function.
         """
         assert AdapterManager._instance
@@ -589,6 +799,7 @@ class AdapterManager:
             *((param,) if param is not None else ()),
             before_download=before_download,
             partial_data=partial_data,
+            transform_result=transform_ground_truth_result,
             **kwargs,
         )
 
@@ -605,6 +816,53 @@ class AdapterManager:
         logging.debug(result)
         return result
 
+    @staticmethod
+    def _get_records(
+        function_name: str,
+        param: Optional[AlbumSearchQuery],
+        record_type: Any,
+        get_objects: Callable[[], Result],
+        use_ground_truth_adapter: bool = False,
+        **kwargs: Any,
+    ) -> Result:
+        """
+        Get record projections of a list of objects. If the caching adapter has the data,
+        it is read directly as records. Otherwise, the full objects are retrieved via
+        ``get_objects`` and projected to records.
+
+        :param function_name: The record function to call on the caching adapter.
+        :param param: The parameter to pass to the record function.
+        :param record_type: The record type to project the full objects to.
+        :param get_objects: A function which returns a :class:`Result` of the full
+            objects.
+        :param kwargs: The keyword arguments to pass to the record function.
+        """
+        if AdapterManager._can_use_cache(use_ground_truth_adapter, function_name):
+            assert AdapterManager._instance
+            assert (caching_adapter := AdapterManager._instance.caching_adapter)
+            try:
+                args = (param,) if param is not None else ()
+                return Result(getattr(caching_adapter, function_name)(*args, **kwargs))
+            except CacheMissError:
+                # The full objects are retrieved below, and the partial data will be
+                # projected from that.
+                logging.info(f"Cache Miss on {function_name}.")
+            except Exception:
+                logging.exception(f"Error on {function_name} retrieving from cache.")
+
+        def project(objects: Optional[Iterable[Any]]) -> Optional[List[Any]]:
+            if objects is None:
+                return None
+            return [record_type.from_object(o) for o in objects]
+
+        def do_get_records() -> List[Any]:
+            try:
+                return cast(List[Any], project(get_objects().result()))
+            except CacheMissError as e:
+                raise CacheMissError(partial_data=project(e.partial_data))
+
+        return Result(do_get_records)
+
     # Usage and Availability Properties
     # ==================================================================================
     @staticmethod
@@ -697,6 +955,28 @@ class AdapterManager:
             allow_download=allow_download,
         )
 
+    @staticmethod
+    def get_playlist_records(
+        before_download: Callable[[], None] = lambda: None,
+        force: bool = False,
+        allow_download: bool = True,
+    ) -> Result[Sequence[PlaylistRecord]]:
+        """
+        Get the same playlists as :class:`get_playlists` as
+        :class:`sublime_music.adapters.api_objects.PlaylistRecord` objects.
+        """
+        return AdapterManager._get_records(
+            "get_playlist_records",
+            None,
+            PlaylistRecord,
+            lambda: AdapterManager.get_playlists(
+                before_download=before_download,
+                force=force,
+                allow_download=allow_download,
+            ),
+            use_ground_truth_adapter=force,
+        )
+
     @staticmethod
     def get_playlist_details(
         playlist_id: str,
@@ -905,6 +1185,9 @@ class AdapterManager:
             except Exception:
                 logging.exception("Error on get_song_file_uri retrieving from cache.")
 
+        if buffered_filename := AdapterManager._get_buffered_song_file(song.id):
+            return f"file://{buffered_filename}"
+
         ground_truth_adapter = AdapterManager._instance.ground_truth_adapter
         if (
             not AdapterManager._ground_truth_can_do("get_song_file_uri")
@@ -915,12 +1198,133 @@ class AdapterManager:
 
         return ground_truth_adapter.get_song_file_uri(song.id, "file")
 
+    @staticmethod
+    def _buffer_song_file(
+        song_id: str,
+        filename: str,
+        variant: Optional[SongFileVariant] = None,
+    ):
+        with AdapterManager._buffered_song_files_lock:
+            AdapterManager._buffered_song_files[song_id] = (filename, variant or SongFileVariant())
+            AdapterManager._buffered_song_files.move_to_end(song_id)
+            buffered_song_files = AdapterManager._buffered_song_files
+            while len(buffered_song_files) > AdapterManager.buffered_song_file_limit:
+                _, (evicted_filename, _) = buffered_song_files.popitem(last=False)
+                Path(evicted_filename).unlink(missing_ok=True)
+
+    @staticmethod
+    def _get_buffered_song_file_variant(song_id: str) -> Optional[Tuple[str, SongFileVariant]]:
+        """
+        :returns: the filename and variant of the buffered song file, or ``None`` if the
+            song file isn't buffered.
+        """
+        with AdapterManager._buffered_song_files_lock:
+            buffered = AdapterManager._buffered_song_files.get(song_id)
+            if buffered is None or not Path(buffered[0]).exists():
+                AdapterManager._buffered_song_files.pop(song_id, None)
+                return None
+
+            AdapterManager._buffered_song_files.move_to_end(song_id)
+            return buffered
+
+    @staticmethod
+    def _get_buffered_song_file(song_id: str) -> Optional[str]:
+        buffered = AdapterManager._get_buffered_song_file_variant(song_id)
+        return buffered[0] if buffered else None
+
+    @staticmethod
+    def _clear_buffered_song_files(song_ids: Optional[Iterable[str]] = None):
+        with AdapterManager._buffered_song_files_lock:
+            buffered_song_files = AdapterManager._buffered_song_files
+            for song_id in list(song_ids if song_ids is not None else buffered_song_files):
+                if (buffered := buffered_song_files.pop(song_id, None)) is not None:
+                    Path(buffered[0]).unlink(missing_ok=True)
+
+    @staticmethod
+    def _preferred_song_file_variant() -> SongFileVariant:
+        assert AdapterManager._instance
+        return AdapterManager._instance.ground_truth_adapter.preferred_song_file_variant()
+
+    @staticmethod
+    def start_song_file_tee(
+        song_id: str,
+    ) -> Optional[Tuple[str, Path, Callable[[bool], None]]]:
+        """
+        Start downloading a song file as a player streams it, so that it doesn't have to
+        be downloaded again for the cache. This is used by players that proxy the song
+        file themselves (for example, the Chromecast player's local server).
+
+        :returns: ``None`` if the song can't be downloaded (or is already being
+            downloaded). Otherwise, the URI to download the song file from, the filename
+            to download it to, and a function which must be called with whether the
+            download succeeded once it's done.
+        """
+        assert AdapterManager._instance
+        app_config = AdapterManager._app_config
+        if (
+            not AdapterManager._instance.caching_adapter
+            or not AdapterManager._instance.ground_truth_adapter.is_networked
+            or AdapterManager._offline_mode
+            or not AdapterManager._ground_truth_can_do("get_song_file_uri")
+            # The player should only download the song if the app would have.
+            or not (app_config and app_config.allow_song_downloads)
+            or not app_config.download_on_stream
+        ):
+            return None
+
+        variant = AdapterManager._preferred_song_file_variant()
+        uri = AdapterManager._instance.ground_truth_adapter.get_song_file_uri(
+            song_id, AdapterManager._get_networked_scheme(), variant
+        )
+        with AdapterManager.download_set_lock:
+            if song_id in AdapterManager.current_download_ids:
+                return None
+            AdapterManager.current_download_ids.add(song_id)
+
+        uri_hash = hashlib.sha1(bytes(uri, "utf8")).hexdigest()
+        filename = AdapterManager._instance.download_path.joinpath(f"tee-{uri_hash}")
+        tee_done: Future = Future()
+        AdapterManager._song_file_tees[song_id] = tee_done
+        tee_start = monotonic()
+
+        def on_done(succeeded: bool):
+            assert AdapterManager._instance
+            try:
+                if succeeded:
+                    AdapterManager.download_throughput.record(
+                        filename.stat().st_size, monotonic() - tee_start
+                    )
+                if succeeded and (caching_adapter := AdapterManager._instance.caching_adapter):
+                    # The player still needs its file, so keep a copy of it.
+                    if caching_adapter.should_admit_song_file(song_id):
+                        caching_adapter.ingest_new_data(
+                            CachingAdapter.CachedDataKey.SONG_FILE,
+                            song_id,
+                            (None, str(filename), None, variant),
+                        )
+                    else:
+                        buffer_filename = AdapterManager._instance.download_path.joinpath(uri_hash)
+                        shutil.copy(filename, buffer_filename)
+                        AdapterManager._buffer_song_file(song_id, str(buffer_filename), variant)
+                    AdapterManager._instance.song_download_progress(
+                        song_id, DownloadProgress(DownloadProgress.Type.DONE)
+                    )
+            finally:
+                with AdapterManager.download_set_lock:
+                    AdapterManager.current_download_ids.discard(song_id)
+                del AdapterManager._song_file_tees[song_id]
+                tee_done.set_result(succeeded)
+
+        return uri, filename, on_done
+
     @staticmethod
     def get_song_stream_uri(song: Song) -> str:
         assert AdapterManager._instance
         if not AdapterManager._ground_truth_can_do("get_song_stream_uri"):
             raise Exception(f"Can't stream song '{song.title}'.")
-        return AdapterManager._instance.ground_truth_adapter.get_song_stream_uri(song.id)
+        return AdapterManager._instance.ground_truth_adapter.get_song_stream_uri(
+            song.id, AdapterManager._preferred_song_file_variant()
+        )
 
     @staticmethod
     def batch_download_songs(
@@ -929,7 +1333,16 @@ class AdapterManager:
         on_song_download_complete: Callable[[str], None],
         one_at_a_time: bool = False,
         delay: float = 0.0,
+        use_admission_policy: bool = False,
     ) -> Result[None]:
+        """
+        Download the given songs into the cache.
+
+        :param use_admission_policy: if ``True``, only persist the songs that the caching
+            adapter admits (see :class:`CachingAdapter.should_admit_song_file`). The
+            rest are only kept in a short-lived download buffer. This should be used for
+            songs that are downloaded as a side-effect of streaming.
+        """
         assert AdapterManager._instance
         if (
             AdapterManager._offline_mode
@@ -963,52 +1376,100 @@ class AdapterManager:
 
             logging.info(f"Downloading {song_id}")
 
+            if song_file_tee := AdapterManager._song_file_tees.get(song_id):
+                # A player is already downloading the song file as it streams it, so wait
+                # for that instead of downloading it again.
+                song_file_tee.result()
+
             # Download the actual song file.
+            caching_adapter = AdapterManager._instance.caching_adapter
+            variant = AdapterManager._preferred_song_file_variant()
             try:
-                # If the song file is already cached, just indicate done immediately.
-                AdapterManager._instance.caching_adapter.get_song_file_uri(song_id, "file")
+                caching_adapter.get_song_file_uri(song_id, "file")
+                cached_variant = caching_adapter.get_cached_song_file_variant(song_id)
+                if cached_variant and variant.is_better_than(cached_variant):
+                    # Replace the cached variant with a better one.
+                    logging.info(f"Replacing the {cached_variant} variant of {song_id}")
+                else:
+                    # If the song file is already cached, just indicate done immediately.
+                    AdapterManager._instance.download_limiter_semaphore.release()
+                    AdapterManager._instance.song_download_progress(
+                        song_id,
+                        DownloadProgress(DownloadProgress.Type.DONE),
+                    )
+                    return Result("", is_download=True)
+            except CacheMissError:
+                pass
+
+            buffered = AdapterManager._get_buffered_song_file_variant(song_id)
+            if buffered and not variant.is_better_than(buffered[1]):
+                # The song was already downloaded into the buffer, so there is no need to
+                # download it again. Persist it if it has now earned its place in the
+                # cache.
                 AdapterManager._instance.download_limiter_semaphore.release()
-                AdapterManager._instance.song_download_progress(
-                    song_id,
-                    DownloadProgress(DownloadProgress.Type.DONE),
-                )
+                try:
+                    if (
+                        not use_admission_policy
+                        or AdapterManager._instance.caching_adapter.should_admit_song_file(song_id)
+                    ):
+                        AdapterManager._instance.caching_adapter.ingest_new_data(
+                            CachingAdapter.CachedDataKey.SONG_FILE,
+                            song_id,
+                            (None, buffered[0], None, buffered[1]),
+                        )
+                        AdapterManager._clear_buffered_song_files([song_id])
+                finally:
+                    AdapterManager._instance.song_download_progress(
+                        song_id,
+                        DownloadProgress(DownloadProgress.Type.DONE),
+                    )
+                    on_song_download_complete(song_id)
                 return Result("", is_download=True)
-            except CacheMissError:
-                # The song is not already cached.
-                before_download(song_id)
 
-                song = AdapterManager.get_song_details(song_id).result()
+            # The song is not already cached.
+            before_download(song_id)
 
-                # Download the song.
-                song_tmp_filename_result: Result[str] = AdapterManager._create_download_result(
-                    AdapterManager._instance.ground_truth_adapter.get_song_file_uri(
-                        song_id, AdapterManager._get_networked_scheme()
-                    ),
-                    song_id,
-                    lambda: before_download(song_id),
-                    expected_size=song.size,
-                )
+            song = AdapterManager.get_song_details(song_id).result()
 
-                def on_download_done(f: Result):
-                    assert AdapterManager._instance
-                    assert AdapterManager._instance.caching_adapter
-                    AdapterManager._instance.download_limiter_semaphore.release()
+            # Download the song. The size of a transcoded variant isn't known ahead of
+            # time.
+            song_tmp_filename_result: Result[str] = AdapterManager._create_download_result(
+                AdapterManager._instance.ground_truth_adapter.get_song_file_uri(
+                    song_id, AdapterManager._get_networked_scheme(), variant
+                ),
+                song_id,
+                lambda: before_download(song_id),
+                expected_size=song.size if variant.is_original else None,
+                report_progress=True,
+            )
+
+            def on_download_done(f: Result):
+                assert AdapterManager._instance
+                assert AdapterManager._instance.caching_adapter
+                AdapterManager._instance.download_limiter_semaphore.release()
 
-                    try:
+                try:
+                    if (
+                        not use_admission_policy
+                        or AdapterManager._instance.caching_adapter.should_admit_song_file(song_id)
+                    ):
                         AdapterManager._instance.caching_adapter.ingest_new_data(
                             CachingAdapter.CachedDataKey.SONG_FILE,
                             song_id,
-                            (None, f.result(), None),
+                            (None, f.result(), None, variant),
                         )
-                    finally:
-                        if AdapterManager._song_download_jobs.get(song_id):
-                            del AdapterManager._song_download_jobs[song_id]
+                    else:
+                        logging.info(f"Song {song_id} not admitted to the cache. Buffering.")
+                        AdapterManager._buffer_song_file(song_id, f.result(), variant)
+                finally:
+                    if AdapterManager._song_download_jobs.get(song_id):
+                        del AdapterManager._song_download_jobs[song_id]
 
-                        on_song_download_complete(song_id)
+                    on_song_download_complete(song_id)
 
-                song_tmp_filename_result.add_done_callback(on_download_done)
-                AdapterManager._song_download_jobs[song_id] = song_tmp_filename_result
-                return song_tmp_filename_result
+            song_tmp_filename_result.add_done_callback(on_download_done)
+            AdapterManager._song_download_jobs[song_id] = song_tmp_filename_result
+            return song_tmp_filename_result
 
         def do_batch_download_songs():
             sleep(delay)
@@ -1129,20 +1590,35 @@ class AdapterManager:
     def get_artists(
         force: bool = False, before_download: Callable[[], None] = lambda: None
     ) -> Result[Sequence[Artist]]:
-        def do_get_artists() -> Sequence[Artist]:
-            return AdapterManager.sort_by_ignored_articles(
-                AdapterManager._get_from_cache_or_ground_truth(
-                    "get_artists",
-                    None,
-                    use_ground_truth_adapter=force,
-                    before_download=before_download,
-                    cache_key=CachingAdapter.CachedDataKey.ARTISTS,
-                ).result(),
+        # The caching adapter stores the sort keys, so its artists are already sorted.
+        return AdapterManager._get_from_cache_or_ground_truth(
+            "get_artists",
+            None,
+            use_ground_truth_adapter=force,
+            before_download=before_download,
+            cache_key=CachingAdapter.CachedDataKey.ARTISTS,
+            transform_ground_truth_result=partial(
+                AdapterManager.sort_by_ignored_articles,
                 key=lambda a: a.name,
                 use_ground_truth_adapter=force,
-            )
+            ),
+        )
 
-        return Result(do_get_artists)
+    @staticmethod
+    def get_artist_records(
+        force: bool = False, before_download: Callable[[], None] = lambda: None
+    ) -> Result[Sequence[ArtistRecord]]:
+        """
+        Get the same artists as :class:`get_artists` (in the same order) as
+        :class:`sublime_music.adapters.api_objects.ArtistRecord` objects.
+        """
+        return AdapterManager._get_records(
+            "get_artist_records",
+            None,
+            ArtistRecord,
+            lambda: AdapterManager.get_artists(force=force, before_download=before_download),
+            use_ground_truth_adapter=force,
+        )
 
     @staticmethod
     def _get_ignored_articles(use_ground_truth_adapter: bool) -> Set[str]:
@@ -1156,20 +1632,11 @@ class AdapterManager:
                 use_ground_truth_adapter=use_ground_truth_adapter,
                 cache_key=CachingAdapter.CachedDataKey.IGNORED_ARTICLES,
             ).result()
-            return set(map(str.lower, ignored_articles))
+            return set(map(str.casefold, ignored_articles))
         except Exception:
             logging.exception("Failed to retrieve ignored_articles")
             return set()
 
-    @staticmethod
-    def _strip_ignored_articles(
-        use_ground_truth_adapter: bool, ignored_articles: Set[str], string: str
-    ) -> str:
-        parts = string.split(maxsplit=1)
-        if len(parts) > 1 and parts[0] in ignored_articles:
-            return parts[1]
-        return string
-
     _S = TypeVar("_S")
 
     @staticmethod
@@ -1179,12 +1646,7 @@ class AdapterManager:
         use_ground_truth_adapter: bool = False,
     ) -> List[_S]:
         ignored_articles = AdapterManager._get_ignored_articles(use_ground_truth_adapter)
-        strip_fn = partial(
-            AdapterManager._strip_ignored_articles,
-            use_ground_truth_adapter,
-            ignored_articles,
-        )
-        return sorted(it, key=lambda x: strip_fn(key(x).lower()))
+        return sorted(it, key=lambda x: sort_key(key(x), ignored_articles))
 
     @staticmethod
     def get_artist(
@@ -1230,6 +1692,137 @@ class AdapterManager:
             use_ground_truth_adapter=use_ground_truth_adapter,
         )
 
+    @staticmethod
+    def get_album_records(
+        query: AlbumSearchQuery,
+        sort_direction: str = "ascending",
+        before_download: Callable[[], None] = lambda: None,
+        use_ground_truth_adapter: bool = False,
+    ) -> Result[Sequence[AlbumRecord]]:
+        """
+        Get the same albums as :class:`get_albums` as
+        :class:`sublime_music.adapters.api_objects.AlbumRecord` objects.
+        """
+        return AdapterManager._get_records(
+            "get_album_records",
+            query,
+            AlbumRecord,
+            lambda: AdapterManager.get_albums(
+                query,
+                sort_direction=sort_direction,
+                before_download=before_download,
+                use_ground_truth_adapter=use_ground_truth_adapter,
+            ),
+            use_ground_truth_adapter=use_ground_truth_adapter,
+            sort_direction=sort_direction,
+        )
+
+    @staticmethod
+    def get_album_records_page(
+        query: AlbumSearchQuery,
+        page: int,
+        page_size: int,
+        sort_direction: str = "ascending",
+        before_download: Callable[[], None] = lambda: None,
+        use_ground_truth_adapter: bool = False,
+    ) -> Result[AlbumRecordPage]:
+        """
+        Get a single page of the albums of :class:`get_album_records` along with the
+        total number of albums. If the caching adapter can answer the query, only the
+        albums on the page are read.
+        """
+        offset = page * page_size
+        partial_page = None
+        function_name = "get_album_records_page"
+        if AdapterManager._can_use_cache(use_ground_truth_adapter, function_name):
+            assert AdapterManager._instance
+            assert (caching_adapter := AdapterManager._instance.caching_adapter)
+            try:
+                return Result(
+                    caching_adapter.get_album_records_page(
+                        query, offset, page_size, sort_direction=sort_direction
+                    )
+                )
+            except CacheMissError as e:
+                partial_page = e.partial_data
+                logging.info(f"Cache Miss on {function_name}.")
+            except Exception:
+                logging.exception(f"Error on {function_name} retrieving from cache.")
+
+        def to_page(albums: Sequence[Album]) -> AlbumRecordPage:
+            albums = list(albums)
+            # The ground truth adapter doesn't necessarily support sorting.
+            if sort_direction == "descending":
+                albums.reverse()
+            return AlbumRecordPage(
+                [AlbumRecord.from_object(a) for a in albums[offset : offset + page_size]],
+                len(albums),
+            )
+
+        albums_result = AdapterManager.get_albums(
+            query,
+            before_download=before_download,
+            use_ground_truth_adapter=use_ground_truth_adapter,
+        )
+
+        def do_get_album_records_page() -> AlbumRecordPage:
+            try:
+                return to_page(albums_result.result())
+            except CacheMissError as e:
+                if partial_page is None and e.partial_data is not None:
+                    raise CacheMissError(partial_data=to_page(e.partial_data))
+                raise CacheMissError(partial_data=partial_page)
+
+        return Result(do_get_album_records_page)
+
+    @staticmethod
+    def get_album_index(
+        query: AlbumSearchQuery,
+        album_id: str,
+        sort_direction: str = "ascending",
+        before_download: Callable[[], None] = lambda: None,
+        use_ground_truth_adapter: bool = False,
+    ) -> Result[Optional[int]]:
+        """
+        Get the index of the album with the given ID in the albums of
+        :class:`get_album_records_page`, or ``None`` if the query doesn't return it. This
+        is used to find the page that the album is on.
+        """
+        function_name = "get_album_index"
+        if AdapterManager._can_use_cache(use_ground_truth_adapter, function_name):
+            assert AdapterManager._instance
+            assert (caching_adapter := AdapterManager._instance.caching_adapter)
+            try:
+                return Result(
+                    caching_adapter.get_album_index(query, album_id, sort_direction=sort_direction)
+                )
+            except CacheMissError:
+                # The albums are retrieved below, and they are paged the same way.
+                logging.info(f"Cache Miss on {function_name}.")
+            except Exception:
+                logging.exception(f"Error on {function_name} retrieving from cache.")
+
+        def index_of(albums: Optional[Sequence[Album]]) -> Optional[int]:
+            ids = [a.id for a in albums or []]
+            # The ground truth adapter doesn't necessarily support sorting.
+            if sort_direction == "descending":
+                ids.reverse()
+            return ids.index(album_id) if album_id in ids else None
+
+        albums_result = AdapterManager.get_albums(
+            query,
+            before_download=before_download,
+            use_ground_truth_adapter=use_ground_truth_adapter,
+        )
+
+        def do_get_album_index() -> Optional[int]:
+            try:
+                return index_of(albums_result.result())
+            except CacheMissError as e:
+                raise CacheMissError(partial_data=index_of(e.partial_data))
+
+        return Result(do_get_album_index)
+
     @staticmethod
     def get_album(
         album_id: str,
@@ -1251,14 +1844,7 @@ class AdapterManager:
         before_download: Callable[[], None] = lambda: None,
         force: bool = False,
     ) -> Result[Directory]:
-        def do_get_directory() -> Directory:
-            directory: Directory = AdapterManager._get_from_cache_or_ground_truth(
-                "get_directory",
-                directory_id,
-                before_download=before_download,
-                use_ground_truth_adapter=force,
-                cache_key=CachingAdapter.CachedDataKey.DIRECTORY,
-            ).result()
+        def sort_children(directory: Directory) -> Directory:
             directory.children = AdapterManager.sort_by_ignored_articles(
                 directory.children,
                 key=lambda c: cast(Directory, c).name or ""
@@ -1268,7 +1854,15 @@ class AdapterManager:
             )
             return directory
 
-        return Result(do_get_directory)
+        # The caching adapter stores the sort keys, so its children are already sorted.
+        return AdapterManager._get_from_cache_or_ground_truth(
+            "get_directory",
+            directory_id,
+            before_download=before_download,
+            use_ground_truth_adapter=force,
+            cache_key=CachingAdapter.CachedDataKey.DIRECTORY,
+            transform_ground_truth_result=sort_children,
+        )
 
     # Play Queue
     @staticmethod
@@ -1290,12 +1884,94 @@ class AdapterManager:
             position=position,
         )
 
+    # Search
+    # The local search results are returned once the query hasn't changed for this long.
+    search_cache_delay = 0.3
+    # The server search results are requested once the query hasn't changed for this much
+    # longer. For networked adapters, the delay is twice the average time that the server
+    # takes to search (within these bounds), so that a slow server isn't sent a search
+    # for every word the user types.
+    search_server_delay_bounds = (0.3, 1.5)
+    # The number of results of each type to request from the server at a time.
+    search_page_size = 10
+    # Search results are written to the cache once no more have been returned for this
+    # long, so that the cache isn't written to (and its search history cleared) while the
+    # user is still searching.
+    search_ingest_delay = 5.0
+    _search_latency: Optional[float] = None
+    _current_server_search: Optional[ServerSearch] = None
+    _search_results_to_ingest = SearchResult()
+    _search_ingest_lock = threading.Lock()
+
+    @staticmethod
+    def _search_server_delay() -> float:
+        assert AdapterManager._instance
+        low, high = AdapterManager.search_server_delay_bounds
+        if not AdapterManager._instance.ground_truth_adapter.is_networked:
+            return low
+        if AdapterManager._search_latency is None:
+            return 1
+        return min(max(2 * AdapterManager._search_latency, low), high)
+
+    @staticmethod
+    def _record_search_latency(latency: float):
+        if AdapterManager._search_latency is None:
+            AdapterManager._search_latency = latency
+        else:
+            AdapterManager._search_latency += 0.3 * (latency - AdapterManager._search_latency)
+
+    @staticmethod
+    def _queue_search_results_ingest(search_result: SearchResult):
+        with AdapterManager._search_ingest_lock:
+            # Results that are returned by multiple searches are only ingested once.
+            for result_type in ("artists", "albums", "songs", "playlists"):
+                AdapterManager._search_results_to_ingest.add_results(
+                    result_type, getattr(search_result, f"_{result_type}").values()
+                )
+        AdapterManager.debounce_scheduler.schedule(
+            "search-ingest",
+            AdapterManager.search_ingest_delay,
+            AdapterManager._ingest_search_results,
+        )
+
+    @staticmethod
+    def _ingest_search_results():
+        with AdapterManager._search_ingest_lock:
+            search_result = AdapterManager._search_results_to_ingest
+            AdapterManager._search_results_to_ingest = SearchResult()
+
+        if not any(
+            (
+                search_result._artists,
+                search_result._albums,
+                search_result._songs,
+                search_result._playlists,
+            )
+        ):
+            return
+        if AdapterManager._instance and AdapterManager._instance.caching_adapter:
+            AdapterManager._instance.caching_adapter.ingest_new_data(
+                CachingAdapter.CachedDataKey.SEARCH_RESULTS, None, search_result
+            )
+
     @staticmethod
     def search(
         query: str,
         search_callback: Callable[[SearchResult], None],
         before_download: Callable[[], None] = lambda: None,
     ) -> Result[bool]:
+        """
+        Search the caching adapter and then the ground truth adapter for ``query`` once
+        it hasn't changed for a while. The ``search_callback`` is called with the
+        aggregated results after each of the searches.
+
+        If the ground truth adapter can search a page at a time, only the first page of
+        each type of result is requested, and the ``search_callback`` is called as each
+        page is returned. Call :class:`search_more` to request the next pages.
+
+        :returns: a :class:`Result` which resolves to whether or not the search was
+            cancelled.
+        """
         if query == "":
             search_callback(SearchResult(""))
             return Result(True)
@@ -1305,66 +1981,341 @@ class AdapterManager:
         # Keep track of if the result is cancelled and if it is, then don't do anything
         # with any results.
         cancelled = False
+        search_result = SearchResult(query)
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
 
-        # This function actually does the search and calls the search_callback when each
-        # of the futures completes. Returns whether or not it was cancelled.
-        def do_search() -> bool:
-            # Sleep for a little while before returning the local results. They are less
-            # expensive to retrieve (but they still incur some overhead due to the GTK
-            # UI main loop queue).
-            sleep(0.3)
+        def finish(was_cancelled: bool):
+            try:
+                future.set_result(was_cancelled)
+            except InvalidStateError:
+                # The search was cancelled while it was finishing.
+                pass
+
+        def search_cache():
             if cancelled:
-                logging.info(f"Cancelled query {query} before caching adapter")
-                return True
+                return
 
             assert AdapterManager._instance
-
-            # Caching Adapter Results
-            search_result = SearchResult(query)
             if AdapterManager._can_use_cache(False, "search"):
                 assert AdapterManager._instance.caching_adapter
                 try:
                     logging.info(f"Returning caching adapter search results for '{query}'.")
                     search_result.update(AdapterManager._instance.caching_adapter.search(query))
-                    search_callback(search_result)
+                    if not cancelled:
+                        search_callback(search_result)
                 except Exception:
                     logging.exception("Error on caching adapter search")
 
             if not AdapterManager._ground_truth_can_do("search"):
-                return False
+                finish(False)
+                return
+
+            AdapterManager.debounce_scheduler.schedule(
+                "search", AdapterManager._search_server_delay(), search_server
+            )
 
-            # Wait longer to see if the user types anything else so we don't peg the
-            # server with tons of requests.
-            sleep(1 if AdapterManager._instance.ground_truth_adapter.is_networked else 0.3)
+        def search_server():
             if cancelled:
-                logging.info(f"Cancelled query {query} before server results")
-                return True
+                return
+
+            assert AdapterManager._instance
+            if AdapterManager._ground_truth_can_do("search_page"):
+                server_search = ServerSearch(search_result, search_callback, lambda: finish(False))
+                AdapterManager._current_server_search = server_search
+                if cancelled:
+                    # The search was cancelled before it became the current search.
+                    server_search.cancelled = True
+                    return
+                server_search.fetch_next_pages()
+                return
 
+            ground_truth_adapter = AdapterManager._instance.ground_truth_adapter
             try:
-                ground_truth_search_results = AdapterManager._instance.ground_truth_adapter.search(
-                    query
-                )  # noqa: E501
-                search_result.update(ground_truth_search_results)
-                search_callback(search_result)
+                start = monotonic()
+                ground_truth_search_results = ground_truth_adapter.search(query)
+                AdapterManager._record_search_latency(monotonic() - start)
             except Exception:
-                logging.exception("Failed getting search results from server for query '{query}'")
+                logging.exception(f"Failed getting search results from server for '{query}'")
+                finish(False)
+                return
 
-            if AdapterManager._instance.caching_adapter:
-                AdapterManager._instance.caching_adapter.ingest_new_data(
-                    CachingAdapter.CachedDataKey.SEARCH_RESULTS,
-                    None,
-                    ground_truth_search_results,
-                )
+            search_result.update(ground_truth_search_results)
+            if not cancelled:
+                search_callback(search_result)
 
-            return False
+            AdapterManager._queue_search_results_ingest(ground_truth_search_results)
+            finish(False)
 
-        # When the future is cancelled (this will happen if a new search is created),
-        # set cancelled to True so that the search function can abort.
+        # When the result is cancelled (this will happen if a new search is created), set
+        # cancelled to True so that the pending searches don't run.
         def on_cancel():
             nonlocal cancelled
             cancelled = True
+            if (server_search := AdapterManager._current_server_search) and (
+                server_search.search_result is search_result
+            ):
+                server_search.cancelled = True
+            AdapterManager.debounce_scheduler.cancel("search", search_cache)
+            AdapterManager.debounce_scheduler.cancel("search", search_server)
+            finish(True)
+
+        AdapterManager.debounce_scheduler.schedule(
+            "search", AdapterManager.search_cache_delay, search_cache
+        )
+        return Result(future, on_cancel=on_cancel)
+
+    @staticmethod
+    def search_more():
+        """
+        Show more results of the current search (for example, when the user scrolls to the
+        bottom of the search results) and request the next page of each type of result
+        from the ground truth adapter. The ``search_callback`` of the search is called
+        again with the aggregated results.
+        """
+        server_search = AdapterManager._current_server_search
+        if not server_search or server_search.cancelled:
+            return
+
+        server_search.search_result.result_limit += AdapterManager.search_page_size
+        if not server_search.fetch_next_pages():
+            # There are no more results on the server, but there may be more local results
+            # to show.
+            server_search.search_callback(server_search.search_result)
+
+    # Prefetch Methods
+    # ==================================================================================
+    # The throughput of the song file downloads, which the prefetch plans are based on.
+    download_throughput = ThroughputEstimator()
+    prefetch_planner = PrefetchPlanner()
+    # The most recent prefetch plan. This is only kept for debugging.
+    last_prefetch_plan: Optional[PrefetchPlan] = None
+
+    @staticmethod
+    def plan_prefetch(
+        current_song_id: str,
+        current_remaining: timedelta,
+        upcoming_song_ids: Sequence[str],
+    ) -> Result[PrefetchPlan]:
+        """
+        Decide which of the upcoming songs should be downloaded now (see
+        :class:`PrefetchPlanner.plan`).
+
+        :param current_song_id: the ID of the song that is playing.
+        :param current_remaining: how much of the current song is left to play.
+        :param upcoming_song_ids: the IDs of the songs that will be played after the
+            current song, in order.
+        """
+
+        def do_plan_prefetch() -> PrefetchPlan:
+            song_ids = [current_song_id, *upcoming_song_ids]
+            max_bit_rate = AdapterManager._preferred_song_file_variant().max_bit_rate
+            songs = []
+            for song_id, status in zip(song_ids, AdapterManager.get_cached_statuses(song_ids)):
+                try:
+                    song = AdapterManager.get_song_details(song_id).result()
+                    duration, size = song.duration, song.size
+                except Exception:
+                    # The planner falls back to estimates for the unknown details.
+                    logging.exception(f"Failed to get the details of {song_id}")
+                    duration, size = None, None
+                if max_bit_rate and duration:
+                    # The song will be transcoded to at most this bit rate.
+                    transcoded_size = int(duration.total_seconds() * max_bit_rate * 1000 / 8)
+                    size = min(size, transcoded_size) if size else transcoded_size
+                songs.append(
+                    UpcomingSong(
+                        song_id,
+                        duration,
+                        size,
+                        cached=(
+                            status in (SongCacheStatus.CACHED, SongCacheStatus.PERMANENTLY_CACHED)
+                            or AdapterManager._get_buffered_song_file(song_id) is not None
+                        ),
+                        downloading=status == SongCacheStatus.DOWNLOADING,
+                    )
+                )
+
+            current, *upcoming = songs
+            planner = AdapterManager.prefetch_planner
+            bytes_per_second = AdapterManager.download_throughput.bytes_per_second
+            plan = planner.plan(
+                upcoming,
+                bytes_per_second,
+                current_remaining.total_seconds(),
+                # Pessimistically assume that none of the current song has been downloaded.
+                0 if current.cached else planner.estimate_size(current) / bytes_per_second,
+            )
+            logging.info(f"Prefetch plan {plan}")
+            AdapterManager.last_prefetch_plan = plan
+            return plan
+
+        return Result(do_plan_prefetch)
+
+    # Play History Methods
+    # ==================================================================================
+    # The maximum number of predicted songs to download after each play.
+    prediction_count = 3
+    # Predicted songs are only downloaded once no other downloads have been running for
+    # this many seconds, so that they only use otherwise idle bandwidth.
+    prediction_idle_time = 30.0
+    # The number of predicted songs that are remembered for the hit rate.
+    prediction_history = 50
+    prediction_stats: Counter = Counter()
+    _predicted_song_ids: "OrderedDict[str, None]" = OrderedDict()
+    _predictions_lock = threading.Lock()
+    _prediction_token = 0
+
+    @staticmethod
+    def record_song_play(song_id: str, source: Optional[str] = None) -> Result[None]:
+        """
+        Record that the given song was played (see
+        :class:`CachingAdapter.record_song_play`).
+
+        :param source: where the song was played from, for example ``playlist:<id>`` or
+            ``album:<id>``.
+        """
+        assert AdapterManager._instance
+        with AdapterManager._predictions_lock:
+            AdapterManager.prediction_stats["plays"] += 1
+            if song_id in AdapterManager._predicted_song_ids:
+                del AdapterManager._predicted_song_ids[song_id]
+                AdapterManager.prediction_stats["hits"] += 1
+
+        if not (caching_adapter := AdapterManager._instance.caching_adapter):
+            return Result(None)
+        return Result(partial(caching_adapter.record_song_play, song_id, source))
+
+    @staticmethod
+    def prediction_hit_rate() -> Optional[float]:
+        """
+        :returns: the fraction of the predicted songs that were played afterwards, or
+            ``None`` if nothing has been predicted yet.
+        """
+        with AdapterManager._predictions_lock:
+            stats = AdapterManager.prediction_stats
+            return stats["hits"] / stats["predicted"] if stats["predicted"] else None
+
+    @staticmethod
+    def warm_predicted_songs(
+        song_id: Optional[str],
+        exclude: Iterable[str] = (),
+    ) -> Result[None]:
+        """
+        Predict which songs are likely to be played next (see
+        :class:`CachingAdapter.predict_song_plays`), and download them and their cover
+        art once no other downloads are running. Calling this again cancels the previous
+        call's pending downloads.
+
+        The downloads are started by the :class:`debounce_scheduler`, so no thread is held
+        while waiting for the other downloads to finish.
+
+        :param song_id: the ID of the song that is playing, or ``None`` if nothing is.
+        :param exclude: the IDs of songs not to download (for example, the ones which are
+            already in the play queue, since those are prefetched anyway).
+        """
+        assert AdapterManager._instance
+        caching_adapter = AdapterManager._instance.caching_adapter
+        if not caching_adapter or not AdapterManager._instance.ground_truth_adapter.is_networked:
+            return Result(None)
+        predict_song_plays = caching_adapter.predict_song_plays
+
+        AdapterManager._prediction_token += 1
+        token = AdapterManager._prediction_token
+        exclude_ids = set(exclude)
+
+        def is_cancelled() -> bool:
+            return (
+                token != AdapterManager._prediction_token
+                or AdapterManager.is_shutting_down
+                or AdapterManager._offline_mode
+            )
+
+        def schedule_warm(song_ids: List[str]):
+            # Replaces the downloads which are still pending from the previous prediction.
+            AdapterManager.debounce_scheduler.schedule(
+                "warm-predicted-songs",
+                AdapterManager.prediction_idle_time,
+                partial(warm_next_song, song_ids),
+            )
+
+        def warm_next_song(song_ids: List[str]):
+            if is_cancelled():
+                return
+            if AdapterManager.current_download_ids or AdapterManager._song_download_jobs:
+                # Other downloads are still running, so check again later.
+                schedule_warm(song_ids)
+                return
+
+            for i, predicted_song_id in enumerate(song_ids):
+                try:
+                    status = AdapterManager.get_cached_statuses([predicted_song_id])[0]
+                    if status in (
+                        SongCacheStatus.CACHED,
+                        SongCacheStatus.PERMANENTLY_CACHED,
+                    ) or AdapterManager._get_buffered_song_file(predicted_song_id):
+                        warm_cover_art(predicted_song_id)
+                        continue
+
+                    # Download the song, and then wait for the downloads to be idle again
+                    # before downloading the next one.
+                    AdapterManager.batch_download_songs(
+                        [predicted_song_id],
+                        before_download=lambda _: None,
+                        on_song_download_complete=lambda _: None,
+                        one_at_a_time=True,
+                        use_admission_policy=True,
+                    ).add_done_callback(
+                        partial(on_song_warmed, predicted_song_id, song_ids[i + 1 :])
+                    )
+                    return
+                except Exception:
+                    logging.exception(f"Failed to warm the cache with {predicted_song_id}")
+
+        def on_song_warmed(predicted_song_id: str, song_ids: List[str], future: Future):
+            if future.cancelled() or future.exception():
+                return
+            AdapterManager.prediction_stats["warmed"] += 1
+            warm_cover_art(predicted_song_id)
+            if song_ids:
+                schedule_warm(song_ids)
+
+        def warm_cover_art(predicted_song_id: str):
+            def on_song_details(result: Union[Future, Result]):
+                try:
+                    cover_art = result.result().cover_art
+                except Exception:
+                    logging.exception(f"Failed to warm the cover art of {predicted_song_id}")
+                    return
+                AdapterManager.get_cover_art_uri(cover_art, "file")
+
+            AdapterManager.get_song_details(predicted_song_id).add_done_callback(on_song_details)
+
+        def do_warm_predicted_songs():
+            count = AdapterManager.prediction_count
+            song_ids = [
+                s
+                for s in predict_song_plays(song_id, count + len(exclude_ids))
+                if s not in exclude_ids
+            ][:count]
+            if not song_ids:
+                return
+
+            logging.info(f"Predicted plays after {song_id}: {song_ids}")
+            with AdapterManager._predictions_lock:
+                predicted_song_ids = AdapterManager._predicted_song_ids
+                for predicted_song_id in song_ids:
+                    if predicted_song_id not in predicted_song_ids:
+                        AdapterManager.prediction_stats["predicted"] += 1
+                    predicted_song_ids[predicted_song_id] = None
+                    predicted_song_ids.move_to_end(predicted_song_id)
+                while len(predicted_song_ids) > AdapterManager.prediction_history:
+                    predicted_song_ids.popitem(last=False)
+
+            if not is_cancelled():
+                schedule_warm(song_ids)
 
-        return Result(do_search, on_cancel=on_cancel)
+        return Result(do_warm_predicted_songs)
 
     # Cache Status Methods
     # ==================================================================================
@@ -1387,6 +2338,7 @@ class AdapterManager:
 
     @staticmethod
     def clear_song_cache():
+        AdapterManager._clear_buffered_song_files()
         assert AdapterManager._instance
         if not AdapterManager._instance.caching_adapter:
             return
@@ -1396,6 +2348,7 @@ class AdapterManager:
 
     @staticmethod
     def clear_entire_cache():
+        AdapterManager._clear_buffered_song_files()
         assert AdapterManager._instance
         if not AdapterManager._instance.caching_adapter:
             return
@@ -0,0 +1,217 @@
+"""
+Planning of which upcoming songs to download ahead of time.
+
+The :class:`PrefetchPlanner` estimates how long each upcoming song will take to download
+(from its size and the observed download throughput) and when it will start playing, and
+only prefetches the songs that would otherwise risk stalling playback. The plan is
+recomputed whenever a song starts playing and whenever the play queue changes, so songs
+that can safely wait are left for a later plan instead of being downloaded early.
+"""
+
+import threading
+from dataclasses import dataclass, field
+from datetime import timedelta
+from enum import Enum
+from typing import List, Optional, Sequence
+
+
+class ThroughputEstimator:
+    """
+    An exponentially weighted moving average of the download throughput.
+    """
+
+    # The weight of each new sample.
+    smoothing = 0.3
+    # Downloads smaller than this are dominated by the request latency, so they don't say
+    # much about the throughput.
+    min_sample_bytes = 256 * 1024
+    # The throughput to assume before any downloads have completed. This is deliberately
+    # pessimistic (about a 2 Mbps link), so that the first plans err on the side of
+    # prefetching too much.
+    default_bytes_per_second = 256 * 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bytes_per_second: Optional[float] = None
+        self.samples = 0
+
+    def record(self, num_bytes: int, seconds: float):
+        """
+        Record that ``num_bytes`` were downloaded in ``seconds``.
+        """
+        if num_bytes < self.min_sample_bytes or seconds <= 0:
+            return
+        sample = num_bytes / seconds
+        with self._lock:
+            if self._bytes_per_second is None:
+                self._bytes_per_second = sample
+            else:
+                self._bytes_per_second += self.smoothing * (sample - self._bytes_per_second)
+            self.samples += 1
+
+    @property
+    def bytes_per_second(self) -> float:
+        with self._lock:
+            if self._bytes_per_second is None:
+                return self.default_bytes_per_second
+            return self._bytes_per_second
+
+
+@dataclass
+class UpcomingSong:
+    id: str
+    duration: Optional[timedelta]
+    size: Optional[int]
+    cached: bool = False
+    downloading: bool = False
+
+
+@dataclass
+class PrefetchDecision:
+    class Action(Enum):
+        # The song is already cached (or buffered).
+        CACHED = "cached"
+        # The song is already being downloaded, so its download should not be cancelled.
+        DOWNLOADING = "downloading"
+        # The song has to be downloaded now to avoid a stall.
+        PREFETCH = "prefetch"
+        # The song can still be downloaded in time by a later plan.
+        DEFER = "defer"
+
+    song_id: str
+    action: Action
+    # How long until the song starts playing.
+    starts_in: float
+    # The estimated time to download the song.
+    download_seconds: float = 0
+    # How long the download can wait before it has to start. This is negative if the
+    # download is expected to finish after the song starts playing.
+    slack: float = 0
+
+    def __str__(self) -> str:
+        description = f"{self.song_id}: {self.action.value} (starts in {self.starts_in:.0f}s"
+        if self.action in (PrefetchDecision.Action.PREFETCH, PrefetchDecision.Action.DEFER):
+            description += (
+                f", download takes {self.download_seconds:.0f}s, slack {self.slack:.0f}s"
+            )
+        return description + ")"
+
+
+@dataclass
+class PrefetchPlan:
+    bytes_per_second: float
+    decisions: List[PrefetchDecision] = field(default_factory=list)
+    # How long the downloads can be delayed (for example, in case the user skips the
+    # song) without risking a stall.
+    delay: float = 0
+
+    @property
+    def song_ids(self) -> List[str]:
+        """
+        The songs which should be downloading, in play order.
+        """
+        return [
+            d.song_id
+            for d in self.decisions
+            if d.action in (PrefetchDecision.Action.PREFETCH, PrefetchDecision.Action.DOWNLOADING)
+        ]
+
+    def __str__(self) -> str:
+        return f"at {self.bytes_per_second / 1024:.0f} KiB/s, delay {self.delay:.0f}s: " + (
+            "; ".join(map(str, self.decisions)) or "nothing upcoming"
+        )
+
+
+class PrefetchPlanner:
+    # Downloads are expected to take up to this many times their estimated time.
+    safety_factor = 1.5
+    # The bitrate to assume for songs without a known size.
+    default_bit_rate = 320 * 1000
+    # The duration to assume for songs without a known duration.
+    default_duration = timedelta(minutes=4)
+    # The maximum time to delay the downloads.
+    max_delay = 5.0
+
+    def estimate_size(self, song: UpcomingSong) -> int:
+        if song.size:
+            return song.size
+        duration = song.duration or self.default_duration
+        return int(duration.total_seconds() * self.default_bit_rate / 8)
+
+    def plan(
+        self,
+        upcoming: Sequence[UpcomingSong],
+        bytes_per_second: float,
+        current_remaining: float,
+        current_download_seconds: float = 0,
+    ) -> PrefetchPlan:
+        """
+        Decide which of the upcoming songs to download now.
+
+        The songs are downloaded one at a time in play order, so each download has to wait
+        for the ones before it. A song is deferred if it can still be downloaded in time
+        when the next song starts (which is when the next plan is made), even after
+        downloading the prefetched songs and all of the other songs that were deferred
+        before it. Otherwise, it is prefetched. In particular, the next song is always
+        prefetched unless it is cached.
+
+        :param upcoming: the upcoming songs, in the order that they will be played.
+        :param bytes_per_second: the estimated download throughput.
+        :param current_remaining: the number of seconds until the current song ends.
+        :param current_download_seconds: the estimated number of seconds until the current
+            song has finished downloading (if it is being downloaded).
+        """
+        plan = PrefetchPlan(bytes_per_second, delay=self.max_delay)
+        starts_in = current_remaining
+        # When the prefetched songs will have finished downloading.
+        downloads_done = current_download_seconds
+        # How long the deferred songs will take to download after the next plan.
+        deferred_seconds = 0.0
+
+        for song in upcoming:
+            duration = (song.duration or self.default_duration).total_seconds()
+            if song.cached or song.downloading:
+                # It's unknown how much of the song is left to download, so assume that it
+                # will be done in time.
+                action = (
+                    PrefetchDecision.Action.CACHED
+                    if song.cached
+                    else PrefetchDecision.Action.DOWNLOADING
+                )
+                plan.decisions.append(PrefetchDecision(song.id, action, starts_in))
+                starts_in += duration
+                continue
+
+            download_seconds = self.estimate_size(song) / bytes_per_second
+            needed = self.safety_factor * download_seconds
+            next_plan_downloads_start = max(current_remaining, downloads_done)
+            if (
+                next_plan_downloads_start + self.safety_factor * deferred_seconds + needed
+                <= starts_in
+            ):
+                deferred_seconds += download_seconds
+                plan.decisions.append(
+                    PrefetchDecision(
+                        song.id,
+                        PrefetchDecision.Action.DEFER,
+                        starts_in,
+                        download_seconds,
+                        slack=starts_in - needed - downloads_done,
+                    )
+                )
+            else:
+                slack = starts_in - needed - downloads_done
+                plan.delay = max(0, min(plan.delay, slack))
+                downloads_done += download_seconds
+                plan.decisions.append(
+                    PrefetchDecision(
+                        song.id,
+                        PrefetchDecision.Action.PREFETCH,
+                        starts_in,
+                        download_seconds,
+                        slack=slack,
+                    )
+                )
+            starts_in += duration
+
+        return plan
@@ -26,6 +26,7 @@ from .. import (
     ConfigParamDescriptor,
     ConfigurationStore,
     ConfigureServerForm,
+    SongFileVariant,
     UIInfo,
     api_objects as API,
 )
@@ -131,6 +132,18 @@ class SubsonicAdapter(Adapter):
                         "Network SSID, this URL will be used instead of the Server "
                         "address when making network requests.",
                     ),
+                    "metered_max_bit_rate": ConfigParamDescriptor(
+                        int,
+                        "Metered Network Bit Rate",
+                        default=128,
+                        advanced=True,
+                        required=False,
+                        helptext="When the network connection is metered, songs are "
+                        "transcoded by the server to at most this bit rate (in kbps). "
+                        "Set this to 0 to always use the original files.",
+                        numeric_bounds=(0, 320),
+                        numeric_step=32,
+                    ),
                 }
             )
 
@@ -199,18 +212,28 @@ class SubsonicAdapter(Adapter):
     def migrate_configuration(config_store: ConfigurationStore):
         if "salt_auth" not in config_store:
             config_store["salt_auth"] = True
+        if "metered_max_bit_rate" not in config_store:
+            config_store["metered_max_bit_rate"] = 128
 
     def __init__(self, config: ConfigurationStore, data_directory: Path):
         self.data_directory = data_directory
         self.ignored_articles_cache_file = self.data_directory.joinpath("ignored_articles.pickle")
 
         self.hostname = config["server_address"]
+        self.metered_max_bit_rate: int = config.get("metered_max_bit_rate") or 0
+        self._networkmanager_client = None
+        if networkmanager_imported and self.metered_max_bit_rate:
+            try:
+                self._networkmanager_client = NM.Client.new()
+            except Exception:
+                logging.exception("Unable to connect to NetworkManager.")
+
         if (
             (ssid := config.get("local_network_ssid"))
             and (lan_address := config.get("local_network_address"))
             and networkmanager_imported
         ):
-            networkmanager_client = NM.Client.new()
+            networkmanager_client = self._networkmanager_client or NM.Client.new()
 
             # Only look at the active WiFi connections.
             for ac in networkmanager_client.get_active_connections():
@@ -319,6 +342,7 @@ class SubsonicAdapter(Adapter):
     can_get_song_rating = True
     can_scrobble_song = True
     can_search = True
+    can_search_page = True
     can_stream = True
     can_update_playlist = True
 
@@ -624,13 +648,52 @@ class SubsonicAdapter(Adapter):
         params = {"id": cover_art, "size": size, **self._get_params()}
         return self._make_url("getCoverArt") + "?" + urlencode(params)
 
-    def get_song_file_uri(self, song_id: str, schemes: Iterable[str]) -> str:
+    # The format that songs are transcoded to on metered networks.
+    metered_format = "mp3"
+
+    def _is_metered(self) -> bool:
+        if not self._networkmanager_client:
+            return False
+        return self._networkmanager_client.get_metered() in (
+            NM.Metered.YES,
+            NM.Metered.GUESS_YES,
+        )
+
+    def preferred_song_file_variant(self) -> SongFileVariant:
+        if self.metered_max_bit_rate and self._is_metered():
+            return SongFileVariant(self.metered_format, self.metered_max_bit_rate)
+        return SongFileVariant()
+
+    def _get_variant_params(self, variant: Optional[SongFileVariant]) -> Dict[str, Any]:
+        params: Dict[str, Any] = {}
+        if variant and variant.format:
+            params["format"] = variant.format
+        if variant and variant.max_bit_rate:
+            params["maxBitRate"] = variant.max_bit_rate
+        return params
+
+    def get_song_file_uri(
+        self,
+        song_id: str,
+        schemes: Iterable[str],
+        variant: Optional[SongFileVariant] = None,
+    ) -> str:
         assert any(s in schemes for s in self.supported_schemes)
         params = {"id": song_id, **self._get_params()}
-        return self._make_url("download") + "?" + urlencode(params)
+        if not variant or variant.is_original:
+            return self._make_url("download") + "?" + urlencode(params)
 
-    def get_song_stream_uri(self, song_id: str) -> str:
-        params = {"id": song_id, **self._get_params()}
+        # The download endpoint always returns the original file, so transcoded
+        # variants are downloaded from the stream endpoint instead.
+        params.update(self._get_variant_params(variant))
+        return self._make_url("stream") + "?" + urlencode(params)
+
+    def get_song_stream_uri(
+        self,
+        song_id: str,
+        variant: Optional[SongFileVariant] = None,
+    ) -> str:
+        params = {"id": song_id, **self._get_params(), **self._get_variant_params(variant)}
         return self._make_url("stream") + "?" + urlencode(params)
 
     def get_song_details(self, song_id: str) -> API.Song:
@@ -793,3 +856,23 @@ class SubsonicAdapter(Adapter):
         search_result.add_results("artists", result.artist)
         search_result.add_results("songs", result.song)
         return search_result
+
+    def search_page(
+        self,
+        query: str,
+        result_type: str,
+        offset: int,
+        count: int,
+    ) -> API.SearchResult:
+        # The search3 counts and offsets are per type of result, so only request the one
+        # type of result.
+        names = {"artists": "artist", "albums": "album", "songs": "song"}
+        params: Dict[str, Any] = {f"{name}Count": 0 for name in names.values()}
+        params[f"{names[result_type]}Count"] = count
+        params[f"{names[result_type]}Offset"] = offset
+
+        search_result = API.SearchResult(query)
+        result = self._get_json(self._make_url("search3"), query=query, **params).search_result
+        if result:
+            search_result.add_results(result_type, getattr(result, names[result_type]))
+        return search_result
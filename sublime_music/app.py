@@ -43,9 +43,12 @@ from .adapters import (
     SongCacheStatus,
 )
 from .adapters.api_objects import Playlist, PlayQueue, Song
+from .adapters.prefetch import PrefetchPlan
 from .config import AppConfiguration, ProviderConfiguration
 from .dbus import DBusManager, dbus_propagate
 from .players import PlayerDeviceEvent, PlayerEvent, PlayerManager
+from .players.latency import StartLatencyTracker
+from .players.progress import ProgressSampler
 from .ui.configure_provider import ConfigureProviderDialog
 from .ui.main import MainWindow
 from .ui.state import RepeatType, UIState
@@ -61,6 +64,15 @@ class SublimeMusicApp(Gtk.Application):
         self.window: Optional[Gtk.Window] = None
         self.app_config = AppConfiguration.load_from_file(config_file)
         self.dbus_manager: Optional[DBusManager] = None
+        # Times the stages of starting each song, from requesting it to hearing it.
+        self.start_latency = StartLatencyTracker()
+        # Merges the progress reported by the player into at most one update per
+        # interval (see update_progress).
+        self.progress_sampler = ProgressSampler(
+            lambda delay, update: GLib.timeout_add(int(delay * 1000), update),
+            self.update_progress,
+        )
+        self.window_minimized = False
 
         self.connect("shutdown", self.on_app_shutdown)
 
@@ -175,6 +187,9 @@ class SublimeMusicApp(Gtk.Application):
         self.window.connect("notification-closed", self.on_notification_closed)
         self.window.connect("go-to", self.on_window_go_to)
         self.window.connect("key-press-event", self.on_window_key_press)
+        self.window.connect("window-state-event", self.on_window_state_change)
+        self.window.connect("show", lambda _: self.update_progress_rate())
+        self.window.connect("hide", lambda _: self.update_progress_rate())
         self.window.player_controls.connect("song-scrub", self.on_song_scrub)
         self.window.player_controls.connect("device-update", self.on_device_update)
         self.window.player_controls.connect("volume-change", self.on_volume_change)
@@ -186,6 +201,9 @@ class SublimeMusicApp(Gtk.Application):
         self.should_scrobble_song = False
 
         def on_timepos_change(value: Optional[float]):
+            if order_token := self.start_latency.on_time_pos(value):
+                GLib.idle_add(self.run_after_first_audio, order_token)
+
             if self.loading_state or not self.window or not self.app_config.state.current_song:
                 return
 
@@ -194,19 +212,7 @@ class SublimeMusicApp(Gtk.Application):
                 return
 
             self.app_config.state.song_progress = timedelta(seconds=value)
-            GLib.idle_add(
-                self.window.player_controls.update_scrubber,
-                self.app_config.state.song_progress,
-                self.app_config.state.current_song.duration,
-                self.app_config.state.song_stream_cache_progress,
-            )
-
-            if (self.last_play_queue_update + timedelta(15)).total_seconds() <= value:
-                self.save_play_queue()
-
-            if value > 5 and self.should_scrobble_song and AdapterManager.can_scrobble_song():
-                AdapterManager.scrobble_song(self.app_config.state.current_song)
-                self.should_scrobble_song = False
+            self.progress_sampler.notify()
 
         def on_track_end():
             at_end = self.app_config.state.next_song_index is None
@@ -215,6 +221,7 @@ class SublimeMusicApp(Gtk.Application):
                 self.app_config.state.playing = False
                 self.app_config.state.current_song_index = -1
                 self.update_window()
+                self.warm_predicted_songs(None)
                 return
 
             GLib.idle_add(self.on_next_track)
@@ -245,12 +252,7 @@ class SublimeMusicApp(Gtk.Application):
                 self.app_config.state.song_stream_cache_progress = timedelta(
                     seconds=event.stream_cache_duration
                 )
-                GLib.idle_add(
-                    self.window.player_controls.update_scrubber,
-                    self.app_config.state.song_progress,
-                    self.app_config.state.current_song.duration,
-                    self.app_config.state.song_stream_cache_progress,
-                )
+                self.progress_sampler.notify()
 
             elif event.type == PlayerEvent.EventType.DISCONNECT:
                 self.app_config.state.current_device = "this device"
@@ -314,6 +316,10 @@ class SublimeMusicApp(Gtk.Application):
             if AdapterManager.can_get_playlists():
                 AdapterManager.get_playlists()
 
+            # Warm the cache with the songs that are usually played at this time of day.
+            if not self.app_config.state.playing:
+                self.warm_predicted_songs(None)
+
         inital_sync_result = AdapterManager.initial_sync()
         inital_sync_result.add_done_callback(after_initial_sync)
 
@@ -559,6 +565,9 @@ class SublimeMusicApp(Gtk.Application):
 
         for k, v in state_updates.items():
             setattr(self.app_config.state, k, v)
+        if "play_queue" in state_updates:
+            # The play queue was reordered.
+            self.update_prefetch()
         self.update_window(force=force)
 
     def on_notification_closed(self, _):
@@ -685,6 +694,7 @@ class SublimeMusicApp(Gtk.Application):
         # Cycle through the repeat types.
         new_repeat_type = RepeatType((self.app_config.state.repeat_type.value + 1) % 3)
         self.app_config.state.repeat_type = new_repeat_type
+        self.update_prefetch()
         self.update_window()
 
     @dbus_propagate()
@@ -718,6 +728,7 @@ class SublimeMusicApp(Gtk.Application):
             self.app_config.state.current_song_index = 0
 
         self.app_config.state.shuffle_on = not self.app_config.state.shuffle_on
+        self.update_prefetch()
         self.update_window()
 
     @dbus_propagate()
@@ -734,6 +745,7 @@ class SublimeMusicApp(Gtk.Application):
             + self.app_config.state.play_queue[insert_at:]
         )
         self.app_config.state.old_play_queue += song_ids
+        self.update_prefetch()
         self.update_window()
 
     @dbus_propagate()
@@ -741,19 +753,45 @@ class SublimeMusicApp(Gtk.Application):
         song_ids = tuple(song_ids)
         self.app_config.state.play_queue += tuple(song_ids)
         self.app_config.state.old_play_queue += tuple(song_ids)
+        self.update_prefetch()
         self.update_window()
 
     def on_go_to_album(self, action: Any, album_id: GLib.Variant):
         # Switch to the Alphabetical by Name view to guarantee that the album is there.
-        self.app_config.state.current_album_search_query = AlbumSearchQuery(
+        query = AlbumSearchQuery(
             AlbumSearchQuery.Type.ALPHABETICAL_BY_NAME,
             genre=self.app_config.state.current_album_search_query.genre,
             year_range=self.app_config.state.current_album_search_query.year_range,
         )
+        self.app_config.state.current_album_search_query = query
 
         self.app_config.state.current_tab = "albums"
         self.app_config.state.selected_album_id = album_id.get_string()
-        self.update_window()
+
+        # Only one page of albums is loaded at a time, so go to the page that the album
+        # is on.
+        def go_to_album_page(f: Result[Optional[int]]):
+            try:
+                index = f.result()
+            except CacheMissError as e:
+                index = e.partial_data
+            except Exception:
+                logging.exception("Failed to find the page of the album")
+                index = None
+
+            if index is not None:
+                self.app_config.state.album_page = index // self.app_config.state.album_page_size
+            self.update_window()
+
+        index_result = AdapterManager.get_album_index(
+            query,
+            album_id.get_string(),
+            sort_direction=self.app_config.state.album_sort_direction,
+        )
+        if index_result.data_is_available:
+            index_result.add_done_callback(go_to_album_page)
+        else:
+            index_result.add_done_callback(lambda f: GLib.idle_add(go_to_album_page, f))
 
     def on_go_to_artist(self, action: Any, artist_id: GLib.Variant):
         self.app_config.state.current_tab = "artists"
@@ -847,6 +885,7 @@ class SublimeMusicApp(Gtk.Application):
             self.play_song(self.app_config.state.current_song_index, reset=True)
         else:
             self.app_config.state.current_song_index -= len(before_current)
+            self.update_prefetch()
             self.update_window()
             self.save_play_queue()
 
@@ -931,6 +970,16 @@ class SublimeMusicApp(Gtk.Application):
         self.player_manager.set_volume(self.app_config.state.volume)
         self.update_window()
 
+    def on_window_state_change(self, window: Gtk.Window, event: Gdk.EventWindowState) -> bool:
+        self.window_minimized = bool(
+            event.new_window_state & (Gdk.WindowState.ICONIFIED | Gdk.WindowState.WITHDRAWN)
+        )
+        self.update_progress_rate()
+        if not self.window_minimized:
+            # Catch up on the progress updates that were skipped while it was minimized.
+            self.progress_sampler.notify()
+        return False
+
     def on_window_key_press(self, window: Gtk.Window, event: Gdk.EventKey) -> bool:
         # Need to use bitwise & here to see if CTRL is pressed.
         if event.keyval == 102 and event.state & Gdk.ModifierType.CONTROL_MASK:
@@ -985,6 +1034,8 @@ class SublimeMusicApp(Gtk.Application):
             self.player_manager.pause()
             self.player_manager.shutdown()
 
+        logging.info(f"Song start latency: {self.start_latency.summary()}")
+        logging.info(f"Progress updates: {dict(self.progress_sampler.stats)}")
         self.app_config.save()
         if self.dbus_manager:
             self.dbus_manager.shutdown()
@@ -1018,7 +1069,46 @@ class SublimeMusicApp(Gtk.Application):
 
         dialog.destroy()
 
+    def update_progress(self):
+        """
+        Update everything that depends on the playback progress. This is called by the
+        :class:`progress_sampler` at most once per interval, no matter how often the
+        player reports the progress. The scrubber isn't updated while the window is
+        hidden or minimized.
+        """
+        state = self.app_config.state
+        if self.loading_state or not self.window or not (current_song := state.current_song):
+            return
+
+        if self.window.get_visible() and not self.window_minimized:
+            self.window.player_controls.update_scrubber(
+                state.song_progress, current_song.duration, state.song_stream_cache_progress
+            )
+        else:
+            self.progress_sampler.stats["hidden"] += 1
+
+        progress = state.song_progress.total_seconds()
+        if (self.last_play_queue_update + timedelta(15)).total_seconds() <= progress:
+            self.save_play_queue()
+
+        if progress > 5 and self.should_scrobble_song and AdapterManager.can_scrobble_song():
+            AdapterManager.scrobble_song(current_song)
+            self.should_scrobble_song = False
+
+    def update_progress_rate(self):
+        """
+        Slow the progress updates down while the window is hidden or minimized, or while
+        playback is paused, since the scrubber doesn't need to move then.
+        """
+        self.progress_sampler.set_idle(
+            not self.app_config.state.playing
+            or not self.window
+            or not self.window.get_visible()
+            or self.window_minimized
+        )
+
     def update_window(self, force: bool = False):
+        self.update_progress_rate()
         if not self.window:
             return
         logging.info(f"Updating window force={force}")
@@ -1104,7 +1194,16 @@ class SublimeMusicApp(Gtk.Application):
         play_queue_future.add_done_callback(lambda f: GLib.idle_add(do_update, f))
 
     song_playing_order_token = 0
-    batch_download_jobs: Set[Result] = set()
+    # The download jobs of the prefetch plans, and the songs that each of them downloads.
+    batch_download_jobs: Dict[Result, Set[str]] = {}
+    # The songs that have been queued for download by the prefetch plans for the current
+    # song (see update_prefetch).
+    prefetch_song_ids: Set[str] = set()
+    prefetch_plan_token = 0
+    on_prefetch_download_complete: Optional[Callable[[str], None]] = None
+    # How long to wait for the first audio of a song before running the work that was
+    # deferred until it started playing anyway.
+    first_audio_timeout = 10
 
     def play_song(
         self,
@@ -1134,7 +1233,12 @@ class SublimeMusicApp(Gtk.Application):
         def do_play_song(order_token: int, song: Song):
             if order_token != self.song_playing_order_token:
                 return
+            self.start_latency.mark(order_token, "details")
 
+            # Only what is needed to start the audio is done before the song is loaded.
+            # Everything else waits until the first audio has been heard (see
+            # run_after_first_audio), so that it doesn't compete with the song for the
+            # main loop and the network.
             uri = None
             try:
                 if "file" in self.player_manager.supported_schemes:
@@ -1153,6 +1257,7 @@ class SublimeMusicApp(Gtk.Application):
                         icon="dialog-error",
                     )
                     return
+            self.start_latency.mark(order_token, "uri")
 
             # Prevent it from doing the thing where it continually loads
             # songs when it has to download.
@@ -1163,84 +1268,6 @@ class SublimeMusicApp(Gtk.Application):
             if order_token != self.song_playing_order_token:
                 return
 
-            self.player_manager.play_media(
-                uri,
-                timedelta(0) if reset else self.app_config.state.song_progress,
-                song,
-            )
-            self.app_config.state.playing = True
-            self.update_window()
-
-            # Check if the next song is available in the cache
-            if (next_song_index := self.app_config.state.next_song_index) is not None:
-                next_song_details_future = AdapterManager.get_song_details(
-                    self.app_config.state.play_queue[next_song_index]
-                )
-
-                next_song_details_future.add_done_callback(
-                    lambda f: GLib.idle_add(do_notify_next_song, f.result()),
-                )
-
-            # Show a song play notification.
-            if self.app_config.song_play_notification:
-                try:
-                    if glib_notify_exists:
-                        notification_lines = []
-                        if album := song.album:
-                            notification_lines.append(f"<i>{album.name}</i>")
-                        if artist := song.artist:
-                            notification_lines.append(artist.name)
-                        song_notification = Notify.Notification.new(
-                            song.title,
-                            bleach.clean("\n".join(notification_lines)),
-                        )
-                        song_notification.add_action(
-                            "clicked",
-                            "Open Sublime Music",
-                            lambda *a: self.window.present() if self.window else None,
-                        )
-                        song_notification.show()
-
-                        def on_cover_art_download_complete(cover_art_filename: str):
-                            if order_token != self.song_playing_order_token:
-                                return
-
-                            # Add the image to the notification, and re-show
-                            # the notification.
-                            song_notification.set_image_from_pixbuf(
-                                GdkPixbuf.Pixbuf.new_from_file_at_scale(
-                                    cover_art_filename, 70, 70, True
-                                )
-                            )
-                            song_notification.show()
-
-                        cover_art_result = AdapterManager.get_cover_art_uri(song.cover_art, "file")
-                        cover_art_result.add_done_callback(
-                            lambda f: on_cover_art_download_complete(f.result())
-                        )
-
-                    if sys.platform == "darwin":
-                        notification_lines = []
-                        if album := song.album:
-                            notification_lines.append(album.name)
-                        if artist := song.artist:
-                            notification_lines.append(artist.name)
-                        notification_text = "\n".join(notification_lines)
-                        osascript_command = [
-                            "display",
-                            "notification",
-                            f'"{notification_text}"',
-                            "with",
-                            "title",
-                            f'"{song.title}"',
-                        ]
-
-                        os.system(f"osascript -e '{' '.join(osascript_command)}'")
-                except Exception:
-                    logging.warning(
-                        "Unable to display notification. Is a notification daemon running?"  # noqa: E501
-                    )
-
             # Download current song and prefetch songs. Only do this if the adapter can
             # download songs and allow_song_downloads is True and download_on_stream is
             # True.
@@ -1283,38 +1310,110 @@ class SublimeMusicApp(Gtk.Application):
                 # Always update the window
                 self.update_window()
 
-            if (
-                # This only makes sense if the adapter is networked.
-                AdapterManager.ground_truth_adapter_is_networked()
-                # Don't download in offline mode.
-                and not self.app_config.offline_mode
-                and self.app_config.allow_song_downloads
-                and self.app_config.download_on_stream
-                and AdapterManager.can_batch_download_songs()
-            ):
-                song_ids = [song.id]
-
-                # Add the prefetch songs.
-                if (repeat_type := self.app_config.state.repeat_type) != RepeatType.REPEAT_SONG:
-                    song_idx = self.app_config.state.play_queue.index(song.id)
-                    is_repeat_queue = RepeatType.REPEAT_QUEUE == repeat_type
-                    prefetch_idxs = []
-                    for i in range(self.app_config.prefetch_amount):
-                        prefetch_idx: int = song_idx + 1 + i
-                        play_queue_len: int = len(self.app_config.state.play_queue)
-                        if is_repeat_queue or prefetch_idx < play_queue_len:
-                            prefetch_idxs.append(prefetch_idx % play_queue_len)  # noqa: S001
-                    song_ids.extend([self.app_config.state.play_queue[i] for i in prefetch_idxs])
-
-                self.batch_download_jobs.add(
-                    AdapterManager.batch_download_songs(
-                        song_ids,
-                        before_download=lambda _: self.update_window(),
-                        on_song_download_complete=on_song_download_complete,
-                        one_at_a_time=True,
-                        delay=5,
+            def after_first_audio():
+                if order_token != self.song_playing_order_token:
+                    return
+
+                # Check if the next song is available in the cache
+                if (next_song_index := self.app_config.state.next_song_index) is not None:
+                    next_song_details_future = AdapterManager.get_song_details(
+                        self.app_config.state.play_queue[next_song_index]
                     )
-                )
+
+                    next_song_details_future.add_done_callback(
+                        lambda f: GLib.idle_add(do_notify_next_song, f.result()),
+                    )
+
+                # Show a song play notification.
+                if self.app_config.song_play_notification:
+                    try:
+                        if glib_notify_exists:
+                            notification_lines = []
+                            if album := song.album:
+                                notification_lines.append(f"<i>{album.name}</i>")
+                            if artist := song.artist:
+                                notification_lines.append(artist.name)
+                            song_notification = Notify.Notification.new(
+                                song.title,
+                                bleach.clean("\n".join(notification_lines)),
+                            )
+                            song_notification.add_action(
+                                "clicked",
+                                "Open Sublime Music",
+                                lambda *a: self.window.present() if self.window else None,
+                            )
+                            song_notification.show()
+
+                            def on_cover_art_download_complete(cover_art_filename: str):
+                                if order_token != self.song_playing_order_token:
+                                    return
+
+                                # Add the image to the notification, and re-show
+                                # the notification.
+                                song_notification.set_image_from_pixbuf(
+                                    GdkPixbuf.Pixbuf.new_from_file_at_scale(
+                                        cover_art_filename, 70, 70, True
+                                    )
+                                )
+                                song_notification.show()
+
+                            cover_art_result = AdapterManager.get_cover_art_uri(
+                                song.cover_art, "file"
+                            )
+                            cover_art_result.add_done_callback(
+                                lambda f: on_cover_art_download_complete(f.result())
+                            )
+
+                        if sys.platform == "darwin":
+                            notification_lines = []
+                            if album := song.album:
+                                notification_lines.append(album.name)
+                            if artist := song.artist:
+                                notification_lines.append(artist.name)
+                            notification_text = "\n".join(notification_lines)
+                            osascript_command = [
+                                "display",
+                                "notification",
+                                f'"{notification_text}"',
+                                "with",
+                                "title",
+                                f'"{song.title}"',
+                            ]
+
+                            os.system(f"osascript -e '{' '.join(osascript_command)}'")
+                    except Exception:
+                        logging.warning(
+                            "Unable to display notification. Is a notification daemon running?"  # noqa: E501
+                        )
+
+                # Keep track of the play history so that the cache can decide which
+                # streamed songs are worth keeping and which songs are likely to be
+                # played next.
+                source: Optional[str]
+                if active_playlist_id := self.app_config.state.active_playlist_id:
+                    source = f"playlist:{active_playlist_id}"
+                else:
+                    source = f"album:{song.album.id}" if song.album else None
+                AdapterManager.record_song_play(song.id, source)
+                self.warm_predicted_songs(song.id)
+                self.update_prefetch()
+
+            self.on_prefetch_download_complete = on_song_download_complete
+            self.start_latency.defer(order_token, after_first_audio)
+            GLib.timeout_add_seconds(
+                self.first_audio_timeout, self.run_after_first_audio, order_token
+            )
+
+            # This has to be marked before the player is told to load the song, since it
+            # may report the first position straight away.
+            self.start_latency.mark(order_token, "loadfile")
+            self.player_manager.play_media(
+                uri,
+                timedelta(0) if reset else self.app_config.state.song_progress,
+                song,
+            )
+            self.app_config.state.playing = True
+            self.update_window()
 
         if old_play_queue:
             self.app_config.state.old_play_queue = old_play_queue
@@ -1324,10 +1423,8 @@ class SublimeMusicApp(Gtk.Application):
 
         self.app_config.state.current_song_index = song_index
 
-        for job in self.batch_download_jobs:
-            job.cancel()
-
         self.song_playing_order_token += 1
+        self.start_latency.start(self.song_playing_order_token)
 
         if play_queue:
             GLib.timeout_add(
@@ -1422,6 +1519,114 @@ class SublimeMusicApp(Gtk.Application):
                 ),
             )
 
+    def run_after_first_audio(self, order_token: int) -> bool:
+        """
+        Run the work that was deferred until the song with the given order token started
+        playing (see :class:`StartLatencyTracker.defer`). This is called when the player
+        reports the first playback position, or after :class:`first_audio_timeout` if
+        that takes too long. The work is only run once.
+        """
+        for function in self.start_latency.take_deferred(order_token):
+            function()
+        return False
+
+    def can_download_on_stream(self) -> bool:
+        return (
+            # This only makes sense if the adapter is networked.
+            AdapterManager.ground_truth_adapter_is_networked()
+            # Don't download in offline mode.
+            and not self.app_config.offline_mode
+            and self.app_config.allow_song_downloads
+            and self.app_config.download_on_stream
+            and AdapterManager.can_batch_download_songs()
+        )
+
+    def warm_predicted_songs(self, song_id: Optional[str]):
+        """
+        Download the songs that the play history predicts will be played after the given
+        song (or first, if ``song_id`` is ``None``) while the downloads are idle. The
+        songs in the play queue are left to :class:`update_prefetch`.
+        """
+        if self.can_download_on_stream():
+            AdapterManager.warm_predicted_songs(song_id, exclude=self.app_config.state.play_queue)
+
+    def update_prefetch(self):
+        """
+        Download the current song and the upcoming songs that the prefetch planner decides
+        are needed to avoid stalls (see :class:`AdapterManager.plan_prefetch`). This is
+        called whenever a song starts playing and whenever the play queue or the play
+        order changes. Downloads of songs which are no longer needed are cancelled.
+        """
+        state = self.app_config.state
+        self.prefetch_plan_token += 1
+        if not (self.can_download_on_stream() and (current_song := state.current_song)):
+            self.cancel_prefetch_jobs(set())
+            return
+
+        # The planner decides how many of the songs within the prefetch amount are
+        # actually downloaded now.
+        upcoming_song_ids: List[str] = []
+        if (repeat_type := state.repeat_type) != RepeatType.REPEAT_SONG:
+            play_queue_len = len(state.play_queue)
+            for i in range(self.app_config.prefetch_amount):
+                prefetch_idx = state.current_song_index + 1 + i
+                if repeat_type != RepeatType.REPEAT_QUEUE and prefetch_idx >= play_queue_len:
+                    break
+                song_id = state.play_queue[prefetch_idx % play_queue_len]  # noqa: S001
+                if song_id == current_song.id or song_id in upcoming_song_ids:
+                    # The whole play queue is within the prefetch amount.
+                    break
+                upcoming_song_ids.append(song_id)
+
+        plan_token = self.prefetch_plan_token
+        current_song_id = current_song.id
+
+        def on_plan(plan: PrefetchPlan):
+            if plan_token != self.prefetch_plan_token:
+                return
+
+            song_ids = [current_song_id, *plan.song_ids]
+            new_song_ids = [s for s in song_ids if s not in self.prefetch_song_ids]
+            self.cancel_prefetch_jobs(set(song_ids))
+            self.prefetch_song_ids = set(song_ids)
+            if not new_song_ids:
+                return
+
+            def on_song_download_complete(song_id: str):
+                if self.on_prefetch_download_complete:
+                    self.on_prefetch_download_complete(song_id)
+
+            job = AdapterManager.batch_download_songs(
+                new_song_ids,
+                before_download=lambda _: self.update_window(),
+                on_song_download_complete=on_song_download_complete,
+                one_at_a_time=True,
+                delay=plan.delay,
+                use_admission_policy=True,
+            )
+            self.batch_download_jobs[job] = set(new_song_ids)
+            # Forget the job once it's done (or cancelled).
+            job.add_done_callback(lambda _: GLib.idle_add(self.batch_download_jobs.pop, job, None))
+
+        AdapterManager.plan_prefetch(
+            current_song.id,
+            (current_song.duration or timedelta(0)) - state.song_progress,
+            upcoming_song_ids,
+        ).add_done_callback(lambda f: GLib.idle_add(on_plan, f.result()))
+
+    def cancel_prefetch_jobs(self, keep_song_ids: Set[str]):
+        """
+        Cancel the downloads of the previous prefetch plans, except for the songs in
+        ``keep_song_ids``. Jobs which still download some of those songs are kept, because
+        cancelling a job aborts all of its downloads, including ones which are in progress.
+        """
+        AdapterManager.cancel_download_songs(self.prefetch_song_ids - keep_song_ids)
+        self.prefetch_song_ids = self.prefetch_song_ids & keep_song_ids
+        for job, song_ids in list(self.batch_download_jobs.items()):
+            if not song_ids & keep_song_ids:
+                job.cancel()
+                del self.batch_download_jobs[job]
+
     def save_play_queue(self, song_playing_order_token: int | None = None):
         if (
             len(self.app_config.state.play_queue) == 0
@@ -0,0 +1,325 @@
+"""
+Buffering profiles for MPV.
+
+The demuxer cache and network options that work well for a song on a remote server are
+wasteful for a local file, so a :class:`BufferingProfile` is chosen for each song based
+on where it is loaded from. While the song plays, the :class:`BufferMonitor` compares the
+cached position with the playback position. When the buffer runs low or playback stalls,
+the profile for that kind of source is escalated (more read-ahead, and more buffering
+before resuming), and once songs from that kind of source have played without stalling
+for a while, it is relaxed again.
+"""
+
+import ipaddress
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from enum import Enum
+from time import monotonic
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+
+class SourceType(Enum):
+    # A song file on disk.
+    LOCAL = "local"
+    # A server on the loopback interface or the LAN.
+    LAN = "lan"
+    # Any other server.
+    REMOTE = "remote"
+
+
+def classify_source(uri: str) -> SourceType:
+    """
+    Determine what kind of source ``uri`` is loaded from.
+    """
+    parsed = urlparse(uri)
+    if parsed.scheme not in ("http", "https"):
+        return SourceType.LOCAL
+
+    hostname = parsed.hostname or ""
+    try:
+        address = ipaddress.ip_address(hostname)
+    except ValueError:
+        # Unqualified and mDNS host names are only resolvable on the LAN.
+        if hostname == "localhost" or "." not in hostname or hostname.endswith(".local"):
+            return SourceType.LAN
+        return SourceType.REMOTE
+
+    if address.is_loopback or address.is_private or address.is_link_local:
+        return SourceType.LAN
+    return SourceType.REMOTE
+
+
+@dataclass(frozen=True)
+class BufferingProfile:
+    # How many seconds the demuxer reads ahead of the playback position.
+    readahead_secs: float
+    # How many seconds of the stream the cache holds ahead of the playback position.
+    cache_secs: float
+    # The maximum size of the demuxer cache, in MiB.
+    max_mib: int
+    # How many seconds to buffer after a stall before playback resumes.
+    pause_wait: float
+    # How many seconds to wait for network data before giving up.
+    network_timeout: float
+
+    # The highest escalation level. Each level doubles the buffering.
+    max_level = 3
+
+    def escalated(self, level: int) -> "BufferingProfile":
+        """
+        :returns: this profile with its buffering doubled ``level`` times.
+        """
+        factor = 2 ** max(0, min(level, self.max_level))
+        return BufferingProfile(
+            readahead_secs=self.readahead_secs * factor,
+            cache_secs=self.cache_secs * factor,
+            max_mib=self.max_mib * factor,
+            pause_wait=self.pause_wait * factor,
+            network_timeout=self.network_timeout,
+        )
+
+    def mpv_options(self) -> Dict[str, str]:
+        return {
+            "cache": "yes",
+            "demuxer-readahead-secs": f"{self.readahead_secs:g}",
+            "cache-secs": f"{self.cache_secs:g}",
+            "demuxer-max-bytes": f"{self.max_mib}MiB",
+            "cache-pause-wait": f"{self.pause_wait:g}",
+            "network-timeout": f"{self.network_timeout:g}",
+        }
+
+
+BUFFERING_PROFILES: Dict[SourceType, BufferingProfile] = {
+    # The file is read as fast as the disk allows, so there's no point in buffering much.
+    SourceType.LOCAL: BufferingProfile(
+        readahead_secs=5, cache_secs=10, max_mib=16, pause_wait=0.5, network_timeout=5
+    ),
+    # The LAN is fast, but Wi-Fi can drop out for a moment.
+    SourceType.LAN: BufferingProfile(
+        readahead_secs=20, cache_secs=30, max_mib=32, pause_wait=1, network_timeout=10
+    ),
+    # Remote servers have higher latency and less predictable throughput.
+    SourceType.REMOTE: BufferingProfile(
+        readahead_secs=60, cache_secs=120, max_mib=64, pause_wait=3, network_timeout=30
+    ),
+}
+
+
+class BufferMonitor:
+    """
+    Chooses the buffering profile for each song and adjusts it from the observed cache
+    progress and stalls. The buffering and stall events are logged and counted in
+    :class:`stats`, and the time spent in them is totalled in :class:`seconds`.
+
+    :param apply_options: called with the MPV options to apply.
+    :param clock: the clock used to time stalls.
+    """
+
+    # The fraction of the profile's read-ahead below which the buffer is considered low.
+    low_buffer_fraction = 0.25
+    # The number of songs from a source type that have to play without a low buffer or a
+    # stall before its profile is relaxed by a level.
+    songs_to_relax = 5
+
+    def __init__(
+        self,
+        apply_options: Callable[[Dict[str, str]], None],
+        clock: Callable[[], float] = monotonic,
+    ):
+        self._apply_options = apply_options
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._levels: Counter[SourceType] = Counter()
+        self._clean_songs: Counter[SourceType] = Counter()
+        # Total "songs", "stalls", "low_buffers", "escalations" and "relaxations".
+        self.stats: Counter[str] = Counter()
+        # Total seconds spent "buffering" before playback started, "stalled" and "played".
+        self.seconds: Dict[str, float] = dict.fromkeys(("buffering", "stalled", "played"), 0.0)
+
+        self.source_type: Optional[SourceType] = None
+        self.profile: Optional[BufferingProfile] = None
+        self._duration: Optional[float] = None
+        self._loaded_at: Optional[float] = None
+        self._stalled_at: Optional[float] = None
+        self._time_pos: Optional[float] = None
+        self._last_time_pos: Optional[float] = None
+        self._escalated = False
+        self._low_buffer = False
+        self._song_stalls = 0
+
+    @property
+    def level(self) -> int:
+        """
+        The escalation level of the current song's source type.
+        """
+        return self._levels[self.source_type] if self.source_type else 0
+
+    def start(self, uri: str, duration: Optional[float] = None) -> Dict[str, str]:
+        """
+        Start monitoring the song that is loaded from ``uri``.
+
+        :param uri: the URI that the song is loaded from. For songs which are proxied
+            through the loopback server, this should be the original URI.
+        :param duration: the duration of the song in seconds, if it is known.
+        :returns: the MPV options for the song's buffering profile.
+        """
+        with self._lock:
+            self._finish_song()
+            self.source_type = classify_source(uri)
+            self.profile = BUFFERING_PROFILES[self.source_type].escalated(self.level)
+            self._duration = duration
+            self._loaded_at = self._clock()
+            self._stalled_at = None
+            self._time_pos = self._last_time_pos = None
+            self._escalated = self._low_buffer = False
+            self._song_stalls = 0
+            self.stats["songs"] += 1
+
+            logging.debug(
+                f"Buffering {self.source_type.value} song with level {self.level}: "
+                f"{self.profile}"
+            )
+            return self.profile.mpv_options()
+
+    def finish(self):
+        """
+        Stop monitoring the current song and log the totals.
+        """
+        with self._lock:
+            self._finish_song()
+            self.source_type = self.profile = None
+        logging.info(f"Buffering stats: {self.summary()}")
+
+    def summary(self) -> str:
+        hours = self.seconds["played"] / 3600
+        rebuffer_rate = self.stats["stalls"] / hours if hours else 0.0
+        return (
+            f"{self.stats['songs']} songs, {self.stats['stalls']} stalls "
+            f"({rebuffer_rate:.2f}/hour, {self.seconds['stalled']:.1f}s), "
+            f"{self.stats['low_buffers']} low buffers, "
+            f"{self.seconds['buffering']:.1f}s buffering before playback, "
+            f"{self.stats['escalations']} escalations, "
+            f"{self.stats['relaxations']} relaxations"
+        )
+
+    def on_time_pos(self, value: Optional[float]):
+        with self._lock:
+            if value is None or not self.profile:
+                return
+            if self._loaded_at is not None:
+                startup = self._clock() - self._loaded_at
+                self.seconds["buffering"] += startup
+                self._loaded_at = None
+                logging.debug(f"Buffered {startup:.2f}s before playback started")
+            if self._last_time_pos is not None and 0 < value - self._last_time_pos < 5:
+                # Larger jumps are seeks.
+                self.seconds["played"] += value - self._last_time_pos
+            self._time_pos = self._last_time_pos = value
+
+    def on_cache_time(self, value: Optional[float]):
+        options = None
+        with self._lock:
+            if value is None or self._time_pos is None or not self.profile:
+                return
+            if self._duration and value >= self._duration - 1:
+                # The rest of the song is cached.
+                return
+
+            buffered = value - self._time_pos
+            threshold = self.low_buffer_fraction * self.profile.readahead_secs
+            if buffered >= threshold:
+                self._low_buffer = False
+            elif not self._low_buffer and self._stalled_at is None:
+                self._low_buffer = True
+                self.stats["low_buffers"] += 1
+                logging.info(
+                    f"Buffer low: {buffered:.1f}s ahead of {self._time_pos:.1f}s "
+                    f"({self.source_type.value if self.source_type else None} source)"
+                )
+                options = self._escalate()
+        self._apply(options)
+
+    def on_paused_for_cache(self, paused: bool):
+        options = None
+        with self._lock:
+            if not self.profile:
+                return
+            if paused and self._stalled_at is None:
+                if self._loaded_at is not None:
+                    # Buffering before playback starts is counted as startup time.
+                    return
+                self._stalled_at = self._clock()
+                self._song_stalls += 1
+                self.stats["stalls"] += 1
+                logging.info(
+                    f"Playback stalled at {self._time_pos or 0:.1f}s "
+                    f"({self.source_type.value if self.source_type else None} source)"
+                )
+                options = self._escalate()
+            elif not paused and self._stalled_at is not None:
+                stalled = self._clock() - self._stalled_at
+                self._stalled_at = None
+                self.seconds["stalled"] += stalled
+                logging.info(f"Playback resumed after stalling for {stalled:.2f}s")
+        self._apply(options)
+
+    def _escalate(self) -> Optional[Dict[str, str]]:
+        """
+        Escalate the profile of the current song's source type. This must be called with
+        the lock held.
+
+        :returns: the MPV options to apply (see :class:`_apply`), or ``None`` if the
+            profile wasn't escalated.
+        """
+        # Only escalate once per song, since the new options take a while to have an
+        # effect.
+        if self._escalated or not self.source_type:
+            return None
+        self._escalated = True
+        self._clean_songs[self.source_type] = 0
+        if self.level >= BufferingProfile.max_level:
+            return None
+
+        self._levels[self.source_type] += 1
+        self.stats["escalations"] += 1
+        self.profile = BUFFERING_PROFILES[self.source_type].escalated(self.level)
+        logging.info(
+            f"Escalating buffering for {self.source_type.value} sources to level "
+            f"{self.level}: {self.profile}"
+        )
+        return self.profile.mpv_options()
+
+    def _apply(self, options: Optional[Dict[str, str]]):
+        # The options are applied without holding the lock, since this is called from
+        # the MPV property observers and applying them calls into MPV.
+        if options:
+            self._apply_options(options)
+
+    def _finish_song(self):
+        if not self.source_type:
+            return
+        if self._stalled_at is not None:
+            self.seconds["stalled"] += self._clock() - self._stalled_at
+            self._stalled_at = None
+        if self._song_stalls:
+            logging.info(
+                f"Song from {self.source_type.value} source stalled {self._song_stalls} " "times"
+            )
+        if self._escalated or self._time_pos is None:
+            return
+
+        self._clean_songs[self.source_type] += 1
+        if (
+            self._clean_songs[self.source_type] >= self.songs_to_relax
+            and self._levels[self.source_type] > 0
+        ):
+            self._clean_songs[self.source_type] = 0
+            self._levels[self.source_type] -= 1
+            self.stats["relaxations"] += 1
+            logging.info(
+                f"Relaxing buffering for {self.source_type.value} sources to level "
+                f"{self._levels[self.source_type]}"
+            )
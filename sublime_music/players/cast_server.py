@@ -0,0 +1,503 @@
+"""
+The HTTP server which serves local song files to Chromecasts on the LAN. It is also used
+on the loopback interface to proxy streamed songs to MPV.
+"""
+
+import logging
+import mimetypes
+import re
+import secrets
+import threading
+from collections import Counter, OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from time import monotonic
+from typing import Any, BinaryIO, Callable, Dict, Optional, Tuple, Union, cast
+
+import requests
+
+INDEX_PAGE = b"""
+<h1>Sublime Music Local Music Server</h1>
+<p>
+    Sublime Music uses this port as a server for serving music to Chromecasts on the
+    same LAN.
+</p>
+"""
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a ``Range`` header for a file of ``size`` bytes.
+
+    :returns: the ``(start, end)`` (inclusive) of the requested bytes, or ``None`` if the
+        whole file should be returned (there's no ``Range``, or it's a multi-range
+        request, which is ignored as the spec allows).
+    :raises ValueError: if the range can't be satisfied.
+    """
+    if not header or not (match := _RANGE_RE.match(header.strip())):
+        return None
+
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        # A suffix range: the last ``end`` bytes.
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+
+    if start >= size or start > end:
+        raise ValueError(f"Range {header} is not satisfiable for {size} bytes.")
+    return start, end
+
+
+class TeeDownload:
+    """
+    Downloads ``uri`` to ``filename`` on a separate thread so that the file can be read
+    while it is being downloaded. Readers wait (see :class:`wait_for`) for the bytes that
+    haven't been downloaded yet, unless they are far ahead of the download (see
+    :class:`request_range`).
+
+    Once the download finishes, ``on_done`` is called with whether it succeeded. The file
+    is deleted when the download is closed.
+    """
+
+    chunk_size = 64 * 1024
+    # The maximum amount of time that readers wait for more bytes to be downloaded.
+    read_timeout = 60.0
+    # Ranges which start more than this many bytes past the downloaded bytes are requested
+    # from the upstream server, rather than waiting for the download to reach them.
+    seek_ahead_bytes = 1 << 20
+
+    def __init__(self, uri: str, filename: Path, on_done: Callable[[bool], None]):
+        self.uri = uri
+        self.filename = filename
+        self.on_done = on_done
+        self.size: Optional[int] = None
+        self.content_type = "application/octet-stream"
+        self.received = 0
+        self.started = False
+        self.done = False
+        self.succeeded = False
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def start(self):
+        threading.Thread(target=self._download, name="TeeDownload", daemon=True).start()
+
+    def close(self):
+        """Stop the download (if it's still running) and delete the file."""
+        with self._condition:
+            self._closed = True
+            done = self.done
+        if done:
+            self.filename.unlink(missing_ok=True)
+
+    def wait_until_started(self) -> bool:
+        """
+        Wait until the response headers have been received.
+
+        :returns: whether the download started.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.started or self.done, self.read_timeout)
+            return self.started
+
+    def wait_for(self, position: int) -> int:
+        """
+        Wait until the byte at ``position`` has been downloaded, or until the download
+        finishes.
+
+        :returns: the number of bytes that have been downloaded.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.received > position or self.done, self.read_timeout
+            )
+            return self.received
+
+    def is_far_ahead(self, position: int) -> bool:
+        """
+        :returns: whether the byte at ``position`` is too far past the downloaded bytes to
+            wait for.
+        """
+        with self._condition:
+            return not self.done and position > self.received + self.seek_ahead_bytes
+
+    def request_range(self, start: int, end: int) -> Optional[requests.Response]:
+        """
+        Request the bytes from ``start`` to ``end`` (inclusive) from the upstream server.
+        This is used for seeks past the downloaded bytes, which would otherwise have to
+        wait for the download to reach them.
+
+        :returns: the streamed response, or ``None`` if the upstream server didn't return
+            the requested range.
+        """
+        try:
+            response = requests.get(
+                self.uri,
+                stream=True,
+                timeout=(10, 30),
+                headers={"Accept-Encoding": "identity", "Range": f"bytes={start}-{end}"},
+            )
+        except requests.RequestException:
+            logging.exception(f"Failed to request bytes {start}-{end} of {self.uri}")
+            return None
+
+        content_range = response.headers.get("Content-Range", "")
+        if response.status_code != HTTPStatus.PARTIAL_CONTENT or not content_range.startswith(
+            f"bytes {start}-{end}/"
+        ):
+            response.close()
+            return None
+        return response
+
+    def _download(self):
+        try:
+            # The bytes must be identical to the file, so don't let the server compress
+            # them.
+            response = requests.get(
+                self.uri,
+                stream=True,
+                timeout=(10, 30),
+                headers={"Accept-Encoding": "identity"},
+            )
+            with response:
+                response.raise_for_status()
+                if "json" in response.headers.get("Content-Type", ""):
+                    raise Exception("Didn't expect JSON!")
+
+                with open(self.filename, "wb") as f:
+                    with self._condition:
+                        if length := response.headers.get("Content-Length"):
+                            self.size = int(length)
+                        self.content_type = response.headers.get("Content-Type", self.content_type)
+                        self.started = True
+                        self._condition.notify_all()
+
+                    for chunk in response.iter_content(self.chunk_size):
+                        if self._closed:
+                            raise Exception("Download closed")
+                        f.write(chunk)
+                        f.flush()
+
+                        with self._condition:
+                            self.received += len(chunk)
+                            self._condition.notify_all()
+
+            self.succeeded = self.size is None or self.received == self.size
+        except Exception:
+            logging.exception(f"Failed to download {self.uri}")
+
+        with self._condition:
+            self.done = True
+            closed = self._closed
+            self._condition.notify_all()
+
+        try:
+            self.on_done(self.succeeded)
+        except Exception:
+            logging.exception("Error handling the finished download")
+        if closed:
+            self.filename.unlink(missing_ok=True)
+
+
+class CastServer:
+    """
+    A threaded HTTP server which serves the files that have been registered with it. Each
+    file is served at ``/s/<token>``, where the token is returned by :class:`register`.
+
+    Requests are handled concurrently (the Chromecast often opens a new connection for
+    each seek), ``Range`` requests are answered with ``206 Partial Content``, and the file
+    contents are sent with ``sendfile`` so they are never copied into memory.
+    """
+
+    # The number of tokens that stay valid. Older tokens are removed as new files are
+    # registered, but the Chromecast may still request the previous songs for a while.
+    max_tokens = 8
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._tokens: OrderedDict[str, Union[Path, TeeDownload]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+        # Request and throughput metrics. ``send_seconds`` is the total time spent
+        # sending response bodies.
+        self.stats: Counter = Counter()
+        self.active_requests = 0
+
+    def start(self):
+        self._server = _CastHTTPServer((self.host, self.port), self)
+        # If the port is 0, the OS picks a free port.
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="CastServer", daemon=True
+        )
+        self._thread.start()
+
+    def shutdown(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            with self._lock:
+                entries = list(self._tokens.values())
+                self._tokens.clear()
+            for entry in entries:
+                if isinstance(entry, TeeDownload):
+                    entry.close()
+            logging.info(
+                f"Cast server served {self.stats['requests']} requests "
+                f"({self.stats['errors']} errors) at {self.throughput():.0f} bytes/second"
+            )
+
+    def register(self, path: Path) -> str:
+        """
+        Serve the file at ``path``.
+
+        :returns: the token of the URL that the file is served at.
+        """
+        return self._add_entry(path)
+
+    def register_tee(
+        self,
+        uri: str,
+        filename: Path,
+        on_done: Callable[[bool], None],
+    ) -> str:
+        """
+        Download ``uri`` to ``filename`` and serve it as it is downloaded (see
+        :class:`TeeDownload`).
+
+        :returns: the token of the URL that the file is served at.
+        """
+        tee = TeeDownload(uri, filename, on_done)
+        tee.start()
+        return self._add_entry(tee)
+
+    def get_entry(self, token: str) -> Union[Path, "TeeDownload", None]:
+        with self._lock:
+            return self._tokens.get(token)
+
+    def _add_entry(self, entry: Union[Path, "TeeDownload"]) -> str:
+        token = secrets.token_urlsafe(16)
+        with self._lock:
+            self._tokens[token] = entry
+            evicted = []
+            while len(self._tokens) > self.max_tokens:
+                evicted.append(self._tokens.popitem(last=False)[1])
+
+        for old_entry in evicted:
+            if isinstance(old_entry, TeeDownload):
+                old_entry.close()
+        return token
+
+    def throughput(self) -> float:
+        """The average rate (in bytes per second) at which response bodies are sent."""
+        if not self.stats["send_seconds"]:
+            return 0
+        return self.stats["bytes_sent"] / self.stats["send_seconds"]
+
+    def _record(self, **stats: Any):
+        with self._lock:
+            self.stats.update(stats)
+
+
+class _CastHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], cast_server: CastServer):
+        super().__init__(address, _CastRequestHandler)
+        self.cast_server = cast_server
+
+
+class _CastRequestHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests.
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def cast_server(self) -> CastServer:
+        return cast(_CastHTTPServer, self.server).cast_server
+
+    def log_message(self, format: str, *args: Any):
+        logging.debug("Cast server: " + format, *args)
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+    def do_GET(self):
+        self._handle(send_body=True)
+
+    def _handle(self, send_body: bool):
+        cast_server = self.cast_server
+        with cast_server._lock:
+            cast_server.active_requests += 1
+        cast_server._record(requests=1)
+        try:
+            self._route(send_body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The Chromecast closes the connection whenever it seeks.
+            self.close_connection = True
+        except Exception:
+            logging.exception("Cast server failed to handle request")
+            cast_server._record(errors=1)
+            self.close_connection = True
+        finally:
+            with cast_server._lock:
+                cast_server.active_requests -= 1
+
+    def _route(self, send_body: bool):
+        if self.path == "/":
+            self._send_headers(HTTPStatus.OK, "text/html", len(INDEX_PAGE))
+            if send_body:
+                self.wfile.write(INDEX_PAGE)
+            return
+
+        token = self.path[3:] if self.path.startswith("/s/") else None
+        if not token or not (entry := self.cast_server.get_entry(token)):
+            self.send_error(HTTPStatus.UNAUTHORIZED, "Invalid token.")
+            return
+
+        if isinstance(entry, TeeDownload):
+            if not entry.wait_until_started():
+                self.send_error(HTTPStatus.BAD_GATEWAY, "Failed to download the song.")
+                return
+            path, size, content_type = entry.filename, entry.size, entry.content_type
+            wait_for = entry.wait_for
+        else:
+            path, size = entry, entry.stat().st_size
+            content_type = mimetypes.guess_type(entry.name)[0] or "application/octet-stream"
+
+            def wait_for(position: int) -> int:
+                # The whole file is already available.
+                return cast(int, size)
+
+        with open(path, "rb") as f:
+            if size is None:
+                # The size isn't known until the download finishes, so the response can
+                # only be ended by closing the connection.
+                self.send_response(HTTPStatus.OK)
+                self.send_header("Content-Type", content_type)
+                self.end_headers()
+                self.close_connection = True
+                if send_body:
+                    self._send_file(f, 0, None, wait_for)
+                return
+
+            try:
+                byte_range = parse_range(self.headers.get("Range"), size)
+            except ValueError:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            upstream = None
+            if (
+                send_body
+                and byte_range
+                and isinstance(entry, TeeDownload)
+                and entry.is_far_ahead(byte_range[0])
+            ):
+                upstream = entry.request_range(*byte_range)
+
+            if byte_range is None:
+                start, end = 0, size - 1
+                self._send_headers(HTTPStatus.OK, content_type, size)
+            else:
+                start, end = byte_range
+                self.cast_server._record(partial_requests=1)
+                self._send_headers(
+                    HTTPStatus.PARTIAL_CONTENT,
+                    content_type,
+                    end - start + 1,
+                    {"Content-Range": f"bytes {start}-{end}/{size}"},
+                )
+
+            if upstream:
+                self.cast_server._record(upstream_requests=1)
+                with upstream:
+                    sent = self._send_response(upstream, end - start + 1)
+            else:
+                sent = not send_body or size == 0 or self._send_file(f, start, end, wait_for)
+            if not sent:
+                # The download failed before all of the promised bytes were sent.
+                self.close_connection = True
+
+    def _send_response(self, response: requests.Response, length: int) -> bool:
+        """
+        Send the body of the upstream ``response``, which should be ``length`` bytes.
+
+        :returns: whether all of the bytes were sent.
+        """
+        sent = 0
+        begin = monotonic()
+        try:
+            for chunk in response.iter_content(TeeDownload.chunk_size):
+                chunk = chunk[: length - sent]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if sent == length:
+                    break
+        except requests.RequestException:
+            logging.exception("Failed to proxy the requested range")
+        finally:
+            self.cast_server._record(bytes_sent=sent, send_seconds=monotonic() - begin)
+        return sent == length
+
+    def _send_file(
+        self,
+        f: BinaryIO,
+        start: int,
+        end: Optional[int],
+        wait_for: Callable[[int], int],
+    ) -> bool:
+        """
+        Send the bytes from ``start`` to ``end`` (inclusive, or to the end of the file if
+        it's ``None``) of ``f``, waiting for each of them to be available.
+
+        :returns: whether all of the bytes were sent.
+        """
+        position = start
+        while end is None or position <= end:
+            available = wait_for(position)
+            if available <= position:
+                return end is None
+
+            count = available - position if end is None else min(available, end + 1) - position
+            begin = monotonic()
+            sent = 0
+            try:
+                # This uses os.sendfile, so the file is copied to the socket by the kernel
+                # without going through userspace.
+                sent = self.connection.sendfile(f, position, count)
+            finally:
+                self.cast_server._record(bytes_sent=sent, send_seconds=monotonic() - begin)
+            if sent == 0:
+                # The file is shorter than expected (for example, it was truncated after
+                # it was registered), so the remaining bytes can never be sent.
+                return False
+            position += sent
+        return True
+
+    def _send_headers(
+        self,
+        status: HTTPStatus,
+        content_type: str,
+        content_length: int,
+        extra_headers: Optional[Dict[str, str]] = None,
+    ):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(content_length))
+        self.send_header("Accept-Ranges", "bytes")
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
@@ -1,22 +1,18 @@
-import base64
-import io
 import logging
-import mimetypes
-import multiprocessing
-import os
 import socket
 from datetime import timedelta
+from pathlib import Path
 from typing import Any, Callable, Dict, Optional, Set, Tuple, Type, Union, cast
 from urllib.parse import urlparse
 from uuid import UUID
 
-import bottle
 import pychromecast
 from gi.repository import GLib
 
 from ..adapters import AdapterManager
 from ..adapters.api_objects import Song
 from .base import Player, PlayerDeviceEvent, PlayerEvent
+from .cast_server import CastServer
 
 SERVE_FILES_KEY = "Serve Local Files to Chromecasts on the LAN"
 LAN_PORT_KEY = "LAN Server Port Number"
@@ -51,7 +47,7 @@ class ChromecastPlayer(Player):
         player_device_change_callback: Callable[[PlayerDeviceEvent], None],
         config: Dict[str, Union[str, int, bool]],
     ):
-        self.server_process: Optional[multiprocessing.Process] = None
+        self.server: Optional[CastServer] = None
         self.on_timepos_change = on_timepos_change
         self.on_track_end = on_track_end
         self.on_player_event = on_player_event
@@ -79,19 +75,18 @@ class ChromecastPlayer(Player):
 
     def change_settings(self, config: Dict[str, Union[str, int, bool]]):
         self.config = config
-        if self.config.get(SERVE_FILES_KEY):
-            # Try and terminate the existing process if it exists.
-            if self.server_process is not None:
-                try:
-                    self.server_process.terminate()
-                except Exception:
-                    pass
-
-            self.server_process = multiprocessing.Process(
-                target=self._run_server_process,
-                args=("0.0.0.0", self.config.get(LAN_PORT_KEY)),
-            )
-            self.server_process.start()
+        port = cast(int, self.config.get(LAN_PORT_KEY))
+        if self.server and (not self.config.get(SERVE_FILES_KEY) or self.server.port != port):
+            self.server.shutdown()
+            self.server = None
+
+        if self.config.get(SERVE_FILES_KEY) and not self.server:
+            server = CastServer("0.0.0.0", port)
+            try:
+                server.start()
+                self.server = server
+            except OSError:
+                logging.exception(f"Failed to start the local music server on port {port}")
 
     def refresh_players(self):
         for id_, chromecast in self._chromecasts.items():
@@ -172,8 +167,8 @@ class ChromecastPlayer(Player):
         pass
 
     def shutdown(self):
-        if self.server_process:
-            self.server_process.terminate()
+        if self.server:
+            self.server.shutdown()
 
         try:
             assert self._current_chromecast
@@ -181,42 +176,6 @@ class ChromecastPlayer(Player):
         except Exception:
             pass
 
-    _serving_song_id = multiprocessing.Array("c", 1024)  # huge buffer, just in case
-    _serving_token = multiprocessing.Array("c", 16)
-
-    def _run_server_process(self, host: str, port: int):
-        app = bottle.Bottle()
-
-        @app.route("/")
-        def index() -> str:
-            return """
-            <h1>Sublime Music Local Music Server</h1>
-            <p>
-                Sublime Music uses this port as a server for serving music to
-                Chromecasts on the same LAN.
-            </p>
-            """
-
-        @app.route("/s/<token>")
-        def stream_song(token: str) -> bytes:
-            # typing doesn't support multiprocessing.Value very well
-            if token != self._serving_token.value.decode():  # type: ignore
-                raise bottle.HTTPError(status=401, body="Invalid token.")
-
-            song = AdapterManager.get_song_details(
-                self._serving_song_id.value.decode()  # type: ignore
-            ).result()
-            filename = AdapterManager.get_song_file_uri(song)
-            with open(filename[7:], "rb") as fin:
-                song_buffer = io.BytesIO(fin.read())
-
-            content_type = mimetypes.guess_type(filename)[0]
-            bottle.response.set_header("Content-Type", content_type)
-            bottle.response.set_header("Accept-Ranges", "bytes")
-            return song_buffer.read()
-
-        bottle.run(app, host=host, port=port)
-
     @property
     def playing(self) -> bool:
         if not self._current_chromecast or not self._current_chromecast.media_controller:
@@ -248,12 +207,16 @@ class ChromecastPlayer(Player):
     def play_media(self, uri: str, progress: timedelta, song: Song):
         assert self._current_chromecast
         scheme = urlparse(uri).scheme
-        if scheme == "file":
-            token = base64.b16encode(os.urandom(8))
-            # typing doesn't support multiprocessing.Value very well
-            self._serving_token.value = token  # type: ignore
-            self._serving_song_id.value = song.id.encode()  # type: ignore
-
+        token = None
+        if scheme == "file" and self.server:
+            token = self.server.register(Path(uri[7:]))
+        elif self.server and (song_file_tee := AdapterManager.start_song_file_tee(song.id)):
+            # Proxy the song through the local server so that it is only downloaded once
+            # for both the Chromecast and the cache.
+            token = self.server.register_tee(*song_file_tee)
+
+        if token:
+            assert self.server
             # If this fails, then we are basically screwed, so don't care if it blows
             # up.
             # TODO (#129): this does not work properly when on VPNs when the DNS is
@@ -263,7 +226,7 @@ class ChromecastPlayer(Player):
             host_ip = s.getsockname()[0]
             s.close()
 
-            uri = f"http://{host_ip}:{self.config.get(LAN_PORT_KEY)}/s/{token.decode()}"
+            uri = f"http://{host_ip}:{self.server.port}/s/{token}"
             logging.info(f"Serving {song.title} at {uri}")
 
         assert AdapterManager._instance
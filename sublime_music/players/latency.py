@@ -0,0 +1,174 @@
+"""
+Instrumentation of the time from requesting a song to hearing it.
+
+A trace is started when a song is requested (for example, when it's clicked), and each
+stage of starting it is marked on the trace: when the song details are available, when
+the URI to play has been chosen, when the player has been told to load it, and when the
+player reports the first playback position. The time spent in each span is recorded in a
+:class:`RollingHistogram`, so that the recent distribution can be logged.
+
+Work which isn't needed to start the audio can be deferred (see
+:class:`StartLatencyTracker.defer`) until the first audio has been heard.
+"""
+
+import bisect
+import logging
+import threading
+from collections import deque
+from time import monotonic
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+
+class RollingHistogram:
+    """
+    A histogram of the last ``window`` samples.
+
+    :param bounds: the upper bounds of the buckets, in seconds. Samples which are larger
+        than the last bound are counted in an extra bucket.
+    :param window: the number of samples to keep.
+    """
+
+    default_bounds = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+
+    def __init__(self, bounds: Sequence[float] = default_bounds, window: int = 100):
+        self.bounds = tuple(bounds)
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def counts(self) -> List[int]:
+        """
+        :returns: the number of samples in each bucket.
+        """
+        counts = [0] * (len(self.bounds) + 1)
+        with self._lock:
+            for sample in self._samples:
+                counts[bisect.bisect_left(self.bounds, sample)] += 1
+        return counts
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        :returns: the given percentile (between 0 and 100) of the samples, or ``None`` if
+            there are no samples.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = round(percentile / 100 * (len(samples) - 1))
+        return samples[max(0, min(index, len(samples) - 1))]
+
+    def __str__(self) -> str:
+        if not self._samples:
+            return "no samples"
+        labels = [f"<{b:g}s" for b in self.bounds] + [f">={self.bounds[-1]:g}s"]
+        buckets = ", ".join(
+            f"{label}: {count}" for label, count in zip(labels, self.counts()) if count
+        )
+        return (
+            f"p50 {self.percentile(50):.2f}s, p90 {self.percentile(90):.2f}s, "
+            f"n={len(self)} ({buckets})"
+        )
+
+
+class StartLatencyTracker:
+    """
+    Traces the start of each requested song. Traces are identified by a token (the song
+    playing order token), so marks for songs which were superseded before they started
+    playing are ignored.
+
+    :param clock: the clock used to time the spans.
+    """
+
+    # The stages of starting a song, in order. Each span is named after the stage that
+    # ends it.
+    stages = ("details", "uri", "loadfile", "first_audio")
+
+    def __init__(self, clock: Callable[[], float] = monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._token: Optional[int] = None
+        self._marks: List[Tuple[str, float]] = []
+        self._deferred: Dict[int, List[Callable[[], None]]] = {}
+        # Whether the player has no file loaded. Positions reported while it still has the
+        # previous file loaded don't count as the first audio of the next song.
+        self._unloaded = True
+        self.histograms: Dict[str, RollingHistogram] = {
+            span: RollingHistogram() for span in (*self.stages, "total")
+        }
+
+    def start(self, token: int):
+        """
+        Start the trace for the song with the given token. This supersedes any previous
+        trace, and drops the work that was deferred for it.
+        """
+        with self._lock:
+            self._token = token
+            self._marks = [("requested", self._clock())]
+            self._deferred = {t: d for t, d in self._deferred.items() if t == token}
+
+    def mark(self, token: int, stage: str):
+        """
+        Mark that the given ``stage`` of starting the song with ``token`` is done.
+        """
+        with self._lock:
+            if token != self._token or not self._marks:
+                return
+            self._marks.append((stage, self._clock()))
+
+    def on_time_pos(self, value: Optional[float]) -> Optional[int]:
+        """
+        Handle a playback position reported by the player. The first position after the
+        player has unloaded the previous file (reported as ``None``) and loaded the song
+        that it was last told to load is the first audio of that song. This finishes the
+        trace.
+
+        :returns: the token of the finished trace, or ``None`` if there's no trace waiting
+            for its first audio.
+        """
+        with self._lock:
+            if value is None:
+                self._unloaded = True
+                return None
+            unloaded, self._unloaded = self._unloaded, False
+            if not unloaded or not self._marks or self._marks[-1][0] != "loadfile":
+                return None
+            self._marks.append(("first_audio", self._clock()))
+            marks, self._marks = self._marks, []
+            token = self._token
+
+        spans = []
+        for (_, start), (stage, end) in zip(marks, marks[1:]):
+            self.histograms[stage].record(end - start)
+            spans.append(f"{stage.replace('_', ' ')} {end - start:.2f}s")
+        total = marks[-1][1] - marks[0][1]
+        self.histograms["total"].record(total)
+        logging.info(f"Song started in {total:.2f}s ({', '.join(spans)})")
+        return token
+
+    def defer(self, token: int, function: Callable[[], None]):
+        """
+        Defer ``function`` until the song with ``token`` has started playing. The deferred
+        functions are returned by :class:`take_deferred`.
+        """
+        with self._lock:
+            self._deferred.setdefault(token, []).append(function)
+
+    def take_deferred(self, token: int) -> List[Callable[[], None]]:
+        """
+        :returns: the functions which were deferred for the song with ``token``. Each
+            function is only returned once.
+        """
+        with self._lock:
+            return self._deferred.pop(token, [])
+
+    def summary(self) -> str:
+        return "; ".join(
+            f"{span.replace('_', ' ')}: {histogram}" for span, histogram in self.histograms.items()
+        )
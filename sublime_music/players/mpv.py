@@ -1,11 +1,16 @@
+import logging
 import threading
 from datetime import timedelta
 from typing import Callable, Dict, Optional, Tuple, Type, Union, cast
+from urllib.parse import urlparse
 
 import mpv
 
+from ..adapters import AdapterManager
 from ..adapters.api_objects import Song
 from .base import Player, PlayerDeviceEvent, PlayerEvent
+from .buffering import BufferMonitor
+from .cast_server import CastServer
 
 REPLAY_GAIN_KEY = "Replay Gain"
 GAPLESS_PLAYBACK_KEY = "Gapless Playback"
@@ -45,11 +50,18 @@ class MPVPlayer(Player):
         if MPVPlayer._is_mock:
             self.mpv.audio_device = "null"
         self.mpv.audio_client_name = "sublime-music"
+        # A loopback server which proxies streamed songs so that they are downloaded
+        # once for both playback and the cache. It's started when it's first needed.
+        self.stream_proxy: Optional[CastServer] = None
+        # Chooses the buffering options for each song, and adjusts them when the buffer
+        # runs low or playback stalls.
+        self.buffer_monitor = BufferMonitor(self._apply_buffering_options)
         self.change_settings(config)
 
         @self.mpv.property_observer("time-pos")
         def time_observer(_, value: Optional[float]):
             on_timepos_change(value)
+            self.buffer_monitor.on_time_pos(value)
             if value is None and self._progress_value_count > 1:
                 on_track_end()
                 with self._progress_value_lock:
@@ -61,6 +73,7 @@ class MPVPlayer(Player):
 
         @self.mpv.property_observer("demuxer-cache-time")
         def cache_size_observer(_, value: Optional[float]):
+            self.buffer_monitor.on_cache_time(value)
             on_player_event(
                 PlayerEvent(
                     PlayerEvent.EventType.STREAM_CACHE_PROGRESS_CHANGE,
@@ -69,6 +82,10 @@ class MPVPlayer(Player):
                 )
             )
 
+        @self.mpv.property_observer("paused-for-cache")
+        def paused_for_cache_observer(_, value: Optional[bool]):
+            self.buffer_monitor.on_paused_for_cache(bool(value))
+
         # Indicate to the UI that we exist.
         player_device_change_callback(
             PlayerDeviceEvent(
@@ -84,6 +101,13 @@ class MPVPlayer(Player):
             "Album": "album",
         }.get(cast(str, config.get(REPLAY_GAIN_KEY, "Disabled")), "no")
 
+    def _apply_buffering_options(self, options: Dict[str, str]):
+        for name, value in options.items():
+            try:
+                self.mpv[name] = value
+            except Exception:
+                logging.exception(f"Failed to set MPV option {name}={value}")
+
     def refresh_players(self):
         # Don't do anything
         pass
@@ -93,7 +117,9 @@ class MPVPlayer(Player):
         pass
 
     def shutdown(self):
-        pass
+        self.buffer_monitor.finish()
+        if self.stream_proxy:
+            self.stream_proxy.shutdown()
 
     def reset(self):
         self.song_loaded = False
@@ -130,6 +156,15 @@ class MPVPlayer(Player):
         # Clears everything except the currently-playing song
         self.mpv.command("playlist-clear")
 
+        # The buffering profile depends on where the song is actually coming from, so
+        # this has to be chosen before the URI is replaced with the proxy's.
+        duration = getattr(song, "duration", None)
+        self._apply_buffering_options(
+            self.buffer_monitor.start(uri, duration.total_seconds() if duration else None)
+        )
+
+        uri = self._proxy_stream(uri, song)
+
         options = {
             "force-seekable": "yes",
             "start": str(progress.total_seconds()),
@@ -140,6 +175,33 @@ class MPVPlayer(Player):
         self.mpv.pause = False
         self.song_loaded = True
 
+    def _proxy_stream(self, uri: str, song: Song) -> str:
+        """
+        Stream the song through the proxy, which downloads it into the cache at the same
+        time. Playback starts as soon as the first bytes arrive, and seeks are served from
+        the partially downloaded file.
+
+        :returns: the URI to play. This is ``uri`` itself if the song isn't streamed, or
+            if it can't be proxied.
+        """
+        if urlparse(uri).scheme not in ("http", "https") or not (
+            song_file_tee := AdapterManager.start_song_file_tee(song.id)
+        ):
+            return uri
+
+        try:
+            if not self.stream_proxy:
+                proxy = CastServer("127.0.0.1", 0)
+                proxy.start()
+                self.stream_proxy = proxy
+            token = self.stream_proxy.register_tee(*song_file_tee)
+        except Exception:
+            logging.exception("Failed to proxy the stream. Playing it directly instead.")
+            # Release the download so that the song can be downloaded some other way.
+            song_file_tee[2](False)
+            return uri
+        return f"http://127.0.0.1:{self.stream_proxy.port}/s/{token}"
+
     def pause(self):
         self.mpv.pause = True
 
@@ -0,0 +1,95 @@
+"""
+Rate limiting of the playback progress updates.
+
+Players report the playback position (and, for streams, the cache progress) many times
+per second, but the UI only changes about once a second. The :class:`ProgressSampler`
+merges all of the progress changes within an interval into a single update, so that the
+main loop is only woken up once per interval while a song is playing, and not at all
+while nothing changes. While nothing shows the progress (see
+:class:`ProgressSampler.set_idle`), the updates are spaced out further.
+"""
+
+import threading
+from collections import Counter
+from functools import partial
+from time import monotonic
+from typing import Callable
+
+
+class ProgressSampler:
+    """
+    Coalesces progress notifications into updates which are emitted at most once per
+    ``interval``. The first notification after a quiet period is emitted immediately.
+
+    :param schedule: called with a delay (in seconds) and a function to call after that
+        delay. This should call the function on the main loop.
+    :param emit: called to emit an update. It should read the latest progress itself.
+    :param interval: the minimum number of seconds between updates.
+    :param idle_interval: the minimum number of seconds between updates while the sampler
+        is idle.
+    :param clock: the clock used to space out the updates.
+    """
+
+    def __init__(
+        self,
+        schedule: Callable[[float, Callable[[], None]], None],
+        emit: Callable[[], None],
+        interval: float = 0.5,
+        idle_interval: float = 5.0,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self._schedule = schedule
+        self._emit = emit
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.idle = False
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pending = False
+        # Incremented to drop the pending update when it's rescheduled.
+        self._generation = 0
+        self._last_update = -max(interval, idle_interval)
+        # The number of "notifications" received and "updates" emitted. The app also counts
+        # the updates which weren't shown because the window was "hidden".
+        self.stats: Counter[str] = Counter()
+
+    def notify(self):
+        """
+        Notify the sampler that the progress has changed. This is safe to call from any
+        thread.
+        """
+        with self._lock:
+            self.stats["notifications"] += 1
+            if self._pending:
+                return
+            self._pending = True
+            interval = self.idle_interval if self.idle else self.interval
+            delay = max(0.0, self._last_update + interval - self._clock())
+            update = partial(self._update, self._generation)
+        self._schedule(delay, update)
+
+    def set_idle(self, idle: bool):
+        """
+        Space the updates out to ``idle_interval`` while nothing shows the progress (for
+        example, while the window is hidden or playback is paused). When the sampler stops
+        being idle, an update is emitted within ``interval``.
+        """
+        with self._lock:
+            if idle == self.idle:
+                return
+            self.idle = idle
+            if idle or not self._pending:
+                return
+            # Replace the pending update, which may be up to idle_interval away.
+            self._generation += 1
+            self._pending = False
+        self.notify()
+
+    def _update(self, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._pending = False
+            self._last_update = self._clock()
+            self.stats["updates"] += 1
+        self._emit()
@@ -1,5 +1,4 @@
 import datetime
-import itertools
 import logging
 import math
 from typing import Any, Callable, Iterable, List, Optional, Tuple, cast
@@ -490,7 +489,7 @@ class AlbumsGrid(Gtk.Overlay):
     }
 
     class _AlbumModel(GObject.Object):
-        def __init__(self, album: API.Album):
+        def __init__(self, album: API.AlbumRecord):
             self.album = album
             super().__init__()
 
@@ -503,7 +502,9 @@ class AlbumsGrid(Gtk.Overlay):
             return f"<AlbumsGrid._AlbumModel {self.album}>"
 
     current_query: AlbumSearchQuery = AlbumSearchQuery(AlbumSearchQuery.Type.RANDOM)
+    # The models of the albums on the current page.
     current_models: List[_AlbumModel] = []
+    total_albums: int = 0
     latest_applied_order_ratchet: int = 0
     order_ratchet: int = 0
     offline_mode: bool = False
@@ -651,9 +652,6 @@ class AlbumsGrid(Gtk.Overlay):
         )
 
         def do_update_grid(selected_index: Optional[int]):
-            if self.sort_dir == "descending" and selected_index:
-                selected_index = len(self.current_models) - selected_index - 1
-
             self.reflow_grids(
                 force_reload_from_master=force_grid_reload_from_master,
                 selected_index=selected_index,
@@ -661,7 +659,7 @@ class AlbumsGrid(Gtk.Overlay):
             )
             self.spinner.hide()
 
-        def reload_store(f: Result[Iterable[API.Album]]):
+        def reload_store(f: Result[API.AlbumRecordPage]):
             # Don't override more recent results
             if order_token < self.latest_applied_order_ratchet:
                 return
@@ -669,9 +667,10 @@ class AlbumsGrid(Gtk.Overlay):
 
             is_partial = False
             try:
-                albums = list(f.result())
+                page = f.result()
             except CacheMissError as e:
-                albums = cast(Optional[List[API.Album]], e.partial_data) or []
+                partial_page = cast(Optional[API.AlbumRecordPage], e.partial_data)
+                page = partial_page or API.AlbumRecordPage([], 0)
                 is_partial = True
             except Exception as e:
                 if self.error_dialog:
@@ -696,6 +695,7 @@ class AlbumsGrid(Gtk.Overlay):
                 self.spinner.hide()
                 return
 
+            albums = list(page.albums)
             for c in self.error_container.get_children():
                 self.error_container.remove(c)
             if is_partial and (
@@ -714,23 +714,26 @@ class AlbumsGrid(Gtk.Overlay):
 
             selected_index = None
             self.current_models = []
+            self.total_albums = page.total
             for i, album in enumerate(albums):
                 model = AlbumsGrid._AlbumModel(album)
 
                 if model.id == self.currently_selected_id:
-                    selected_index = i
+                    selected_index = self.page_size * self.page + i
 
                 self.current_models.append(model)
 
-            self.emit(
-                "num-pages-changed",
-                math.ceil(len(self.current_models) / self.page_size),
-            )
+            self.emit("num-pages-changed", math.ceil(self.total_albums / self.page_size))
             do_update_grid(selected_index)
 
         if force_grid_reload_from_master:
-            albums_result = AdapterManager.get_albums(
-                self.current_query, use_ground_truth_adapter=use_ground_truth_adapter
+            # Only the albums on the current page are retrieved.
+            albums_result = AdapterManager.get_album_records_page(
+                self.current_query,
+                self.page,
+                self.page_size,
+                sort_direction=self.sort_dir,
+                use_ground_truth_adapter=use_ground_truth_adapter,
             )
             if albums_result.data_is_available:
                 # Don't idle add if the data is already available.
@@ -742,11 +745,8 @@ class AlbumsGrid(Gtk.Overlay):
             selected_index = None
             for i, album in enumerate(self.current_models):
                 if album.id == self.currently_selected_id:
-                    selected_index = i
-            self.emit(
-                "num-pages-changed",
-                math.ceil(len(self.current_models) / self.page_size),
-            )
+                    selected_index = self.page_size * self.page + i
+            self.emit("num-pages-changed", math.ceil(self.total_albums / self.page_size))
             do_update_grid(selected_index)
 
     # Event Handlers
@@ -849,16 +849,10 @@ class AlbumsGrid(Gtk.Overlay):
                 return
         page_offset = self.page_size * self.page
 
-        # Calculate the look-at window.
+        # Calculate the look-at window. The models are already just the current page (in
+        # the sort direction).
         if models:
-            if self.sort_dir == "ascending":
-                window = models[page_offset : (page_offset + self.page_size)]
-            else:
-                reverse_sorted_models = reversed(models)
-                # remove to the offset
-                for _ in range(page_offset):
-                    next(reverse_sorted_models, page_offset)
-                window = list(itertools.islice(reverse_sorted_models, self.page_size))
+            window = models
         else:
             window = list(self.list_store_top) + list(self.list_store_bottom)
 
@@ -55,7 +55,7 @@ class _ArtistModel(GObject.GObject):
     name = GObject.Property(type=str)
     album_count = GObject.Property(type=int)
 
-    def __init__(self, artist: API.Artist):
+    def __init__(self, artist: API.ArtistRecord):
         GObject.GObject.__init__(self)
         self.artist_id = artist.id
         self.name = artist.name
@@ -120,13 +120,13 @@ class ArtistList(Gtk.Box):
     _app_config = None
 
     @util.async_callback(
-        AdapterManager.get_artists,
+        AdapterManager.get_artist_records,
         before_download=lambda self: self.loading_indicator.show_all(),
         on_failure=lambda self, e: self.loading_indicator.hide(),
     )
     def update(
         self,
-        artists: Sequence[API.Artist],
+        artists: Sequence[API.ArtistRecord],
         app_config: AppConfiguration | None = None,
         is_partial: bool = False,
         **kwargs,
@@ -27,7 +27,7 @@ class AlbumWithSongs(Gtk.Box):
 
     def __init__(
         self,
-        album: API.Album,
+        album: API.Album | API.AlbumRecord,
         cover_art_size: int = 200,
         show_artist_name: bool = True,
     ):
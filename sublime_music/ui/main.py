@@ -824,6 +824,7 @@ class MainWindow(Gtk.ApplicationWindow):
             min_content_width=500,
             min_content_height=700,
         )
+        results_scrollbox.connect("edge-reached", self._on_search_results_edge_reached)
 
         def make_search_result_header(text: str) -> Gtk.Label:
             label = self._create_label(text)
@@ -979,6 +980,10 @@ class MainWindow(Gtk.ApplicationWindow):
     def _on_search_entry_stop_search(self, entry: Any):
         self.search_popup.popdown()
 
+    def _on_search_results_edge_reached(self, scrollbox: Any, position: Gtk.PositionType):
+        if position == Gtk.PositionType.BOTTOM:
+            AdapterManager.search_more()
+
     # Helper Functions
     # =========================================================================
     def _emit_settings_change(self, changed_settings: Dict[str, Any]):
@@ -4,7 +4,7 @@ from random import randint
 from typing import Any, Dict, List, Tuple, cast
 
 from gi.repository import Gdk, Gio, GLib, GObject, Gtk, Pango
-from thefuzz import fuzz
+from rapidfuzz import fuzz
 
 from ..adapters import AdapterManager, api_objects as API
 from ..config import AppConfiguration
@@ -224,13 +224,13 @@ class PlaylistList(Gtk.Box):
         self.update_list(app_config=app_config, force=force)
 
     @util.async_callback(
-        AdapterManager.get_playlists,
+        AdapterManager.get_playlist_records,
         before_download=lambda self: self.loading_indicator.show_all(),
         on_failure=lambda self, e: self.loading_indicator.hide(),
     )
     def update_list(
         self,
-        playlists: List[API.Playlist],
+        playlists: List[API.PlaylistRecord],
         app_config: AppConfiguration | None = None,
         force: bool = False,
         order_token: int | None = None,
@@ -427,7 +427,7 @@ class PlaylistDetailPanel(Gtk.Overlay):
 
         @lru_cache(maxsize=1024)
         def row_score(key: str, row_items: Tuple[str]) -> int:
-            return fuzz.partial_ratio(key, " ".join(row_items).lower())
+            return round(fuzz.partial_ratio(key, " ".join(row_items).lower()))
 
         def playlist_song_list_search_fn(
             store: Gtk.ListStore,
@@ -1,6 +1,6 @@
 from datetime import datetime
 from pathlib import Path
-from typing import Tuple, Union
+from typing import Optional, Set, Tuple, Union
 
 
 def resolve_path(*joinpath_args: Union[str, Path]) -> Path:
@@ -20,3 +20,23 @@ def this_decade() -> Tuple[int, int]:
     now = datetime.now()
     decade_start = now.year // 10 * 10
     return (decade_start, decade_start + 10)
+
+
+def sort_key(string: Optional[str], ignored_articles: Set[str]) -> str:
+    """
+    Returns the key to sort the given string by. The key is case-folded, and if the
+    string starts with one of the ``ignored_articles`` (which must be case-folded), it
+    is removed.
+
+    >>> sort_key("The Beatles", {"the", "a"})
+    'beatles'
+    >>> sort_key("The", {"the", "a"})
+    'the'
+    >>> sort_key("ABBA", {"the", "a"})
+    'abba'
+    """
+    string = (string or "").casefold()
+    parts = string.split(maxsplit=1)
+    if len(parts) > 1 and parts[0] in ignored_articles:
+        return parts[1]
+    return string
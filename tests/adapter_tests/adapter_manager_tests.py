@@ -1,10 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from time import sleep
+from types import SimpleNamespace
+from typing import Any, List, Sequence
 
 import pytest
 
-from sublime_music.adapters import AdapterManager, ConfigurationStore, Result, SearchResult
+from sublime_music.adapters import (
+    AdapterManager,
+    AlbumSearchQuery,
+    CacheMissError,
+    ConfigurationStore,
+    Result,
+    SearchResult,
+    SongCacheStatus,
+)
 from sublime_music.adapters.filesystem import FilesystemAdapter
+from sublime_music.adapters.manager import DebounceScheduler
 from sublime_music.adapters.subsonic import SubsonicAdapter, api_objects as SubsonicAPI
 from sublime_music.config import AppConfiguration, ProviderConfiguration
 
@@ -196,3 +209,163 @@ def test_search(adapter_manager: AdapterManager):
         sleep(0.1)
 
     assert len(results) == 1
+
+
+def test_debounce_scheduler(monkeypatch: pytest.MonkeyPatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(AdapterManager, "executor", executor)
+    scheduler = DebounceScheduler()
+    calls: List[str] = []
+
+    # Only the last function scheduled for a key runs, and only once it's quiet.
+    for query in ("r", "ra", "rad"):
+        scheduler.schedule("search", 0.1, partial(calls.append, query))
+        sleep(0.02)
+    scheduler.schedule("other", 0.05, lambda: calls.append("other"))
+    assert calls == []
+
+    sleep(0.3)
+    assert calls == ["other", "rad"]
+
+    # Cancelled functions never run.
+    def cancelled():
+        calls.append("cancelled")
+
+    scheduler.schedule("search", 0.05, cancelled)
+    scheduler.cancel("search", lambda: None)
+    scheduler.cancel("search", cancelled)
+    sleep(0.2)
+    assert calls == ["other", "rad"]
+    executor.shutdown()
+
+
+def test_debounce_scheduler_shutdown(monkeypatch: pytest.MonkeyPatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(AdapterManager, "executor", executor)
+    scheduler = DebounceScheduler()
+    calls: List[str] = []
+
+    # Pending functions are cancelled and the timer thread stops.
+    scheduler.schedule("search", 0.05, lambda: calls.append("search"))
+    timer_thread = scheduler._thread
+    assert timer_thread
+    scheduler.shutdown()
+    timer_thread.join(1)
+    assert not timer_thread.is_alive()
+    sleep(0.1)
+    assert calls == []
+
+    # A function which comes due after the executor has been shut down is dropped
+    # instead of raising on the timer thread.
+    scheduler.schedule("search", 0.05, lambda: calls.append("late"))
+    executor.shutdown()
+    sleep(0.2)
+    assert calls == []
+    assert scheduler._thread and scheduler._thread.is_alive()
+    scheduler.shutdown()
+
+
+def test_warm_predicted_songs(monkeypatch: pytest.MonkeyPatch):
+    def get_cached_statuses(song_ids: Sequence[str]) -> List[SongCacheStatus]:
+        return [
+            SongCacheStatus.CACHED if s == "2" else SongCacheStatus.NOT_CACHED for s in song_ids
+        ]
+
+    def batch_download_songs(song_ids: Sequence[str], **kwargs: Any) -> Result[None]:
+        def download() -> None:
+            downloads.extend(song_ids)
+
+        return Result(download, is_download=True)
+
+    downloads: List[str] = []
+    cover_art: List[str] = []
+    # Other tests shut down the class-level executors, so run on fresh ones.
+    executor, download_executor = ThreadPoolExecutor(), ThreadPoolExecutor()
+    monkeypatch.setattr(AdapterManager, "executor", executor)
+    monkeypatch.setattr(AdapterManager, "download_executor", download_executor)
+    monkeypatch.setattr(
+        AdapterManager,
+        "_instance",
+        SimpleNamespace(
+            caching_adapter=SimpleNamespace(
+                predict_song_plays=lambda song_id, count: ["x", "1", "2", "3", "4"][:count]
+            ),
+            ground_truth_adapter=SimpleNamespace(is_networked=True),
+        ),
+    )
+    monkeypatch.setattr(AdapterManager, "debounce_scheduler", DebounceScheduler())
+    monkeypatch.setattr(AdapterManager, "prediction_idle_time", 0.05)
+    monkeypatch.setattr(AdapterManager, "current_download_ids", {"other"})
+    monkeypatch.setattr(AdapterManager, "get_cached_statuses", get_cached_statuses)
+    monkeypatch.setattr(AdapterManager, "_get_buffered_song_file", lambda song_id: None)
+    monkeypatch.setattr(AdapterManager, "batch_download_songs", batch_download_songs)
+    monkeypatch.setattr(
+        AdapterManager,
+        "get_song_details",
+        lambda song_id: Result(SimpleNamespace(cover_art=f"cover{song_id}")),
+    )
+    monkeypatch.setattr(
+        AdapterManager,
+        "get_cover_art_uri",
+        lambda cover_art_id, scheme: cover_art.append(cover_art_id),
+    )
+
+    AdapterManager.warm_predicted_songs("0", exclude=["x"]).result()
+
+    # Nothing is downloaded while other downloads are running.
+    sleep(0.2)
+    assert downloads == []
+
+    # Once the downloads are idle, the predicted songs which aren't cached are downloaded
+    # one at a time, along with the cover art of all of them.
+    AdapterManager.current_download_ids.clear()
+    for _ in range(50):
+        if len(cover_art) == 3:
+            break
+        sleep(0.05)
+    assert downloads == ["1", "3"]
+    assert sorted(cover_art) == ["cover1", "cover2", "cover3"]
+    AdapterManager.debounce_scheduler.shutdown()
+    executor.shutdown()
+    download_executor.shutdown()
+
+
+def test_get_album_index(monkeypatch: pytest.MonkeyPatch):
+    def get_album_index(query: AlbumSearchQuery, album_id: str, **kwargs: Any) -> int:
+        # Only the index of al2 is cached.
+        if album_id != "al2":
+            raise CacheMissError(partial_data=None)
+        return 42
+
+    # Other tests shut down the class-level executor, so run on a fresh one.
+    executor = ThreadPoolExecutor()
+    monkeypatch.setattr(AdapterManager, "executor", executor)
+    monkeypatch.setattr(
+        AdapterManager,
+        "_instance",
+        SimpleNamespace(
+            caching_adapter=SimpleNamespace(
+                can_get_album_index=True, get_album_index=get_album_index
+            ),
+            ground_truth_adapter=SimpleNamespace(),
+        ),
+    )
+    monkeypatch.setattr(
+        AdapterManager,
+        "get_albums",
+        lambda query, **kwargs: Result([SimpleNamespace(id=f"al{i}") for i in range(5)]),
+    )
+    query = AlbumSearchQuery(AlbumSearchQuery.Type.ALPHABETICAL_BY_NAME)
+
+    # The caching adapter finds the album without loading the albums.
+    assert AdapterManager.get_album_index(query, "al2").result() == 42
+
+    # Otherwise, the album is found in the albums of the ground truth adapter.
+    assert AdapterManager.get_album_index(query, "missing").result() is None
+    for album_id, sort_direction, index in (
+        ("al1", "ascending", 1),
+        ("al1", "descending", 3),
+        ("al4", "descending", 0),
+    ):
+        assert AdapterManager.get_album_index(query, album_id, sort_direction).result() == index
+    executor.shutdown()
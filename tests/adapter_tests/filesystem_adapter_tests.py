@@ -1,9 +1,11 @@
 import json
+import os
 import shutil
+from contextlib import contextmanager
 from dataclasses import asdict
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Generator, Iterable, Tuple, cast
+from typing import Any, Callable, Generator, Iterable, List, Tuple, cast
 
 import pytest
 from peewee import SelectQuery
@@ -12,9 +14,10 @@ from sublime_music.adapters import (
     AlbumSearchQuery,
     CacheMissError,
     SongCacheStatus,
+    SongFileVariant,
     api_objects as SublimeAPI,
 )
-from sublime_music.adapters.filesystem import FilesystemAdapter
+from sublime_music.adapters.filesystem import FilesystemAdapter, migrations, models
 from sublime_music.adapters.filesystem.models import Directory
 from sublime_music.adapters.subsonic import api_objects as SubsonicAPI
 
@@ -399,6 +402,51 @@ def test_malformed_song_path(cache_adapter: FilesystemAdapter):
     assert song_uri2.endswith("fine/path/song2.mp3")
 
 
+def test_song_file_variants(cache_adapter: FilesystemAdapter, tmp_path: Path):
+    low, high = SongFileVariant("mp3", 64), SongFileVariant("mp3", 128)
+    assert high.is_better_than(low)
+    assert SongFileVariant().is_better_than(high)
+    assert not high.is_better_than(SongFileVariant())
+
+    files = {}
+    for name in ("low", "high", "original"):
+        files[name] = tmp_path.joinpath(name)
+        files[name].write_text(name)
+
+    cache_adapter.ingest_new_data(
+        KEYS.SONG, "2", SubsonicAPI.Song("2", title="Song 2", path="fine/path/song2.flac")
+    )
+    assert cache_adapter.get_cached_song_file_variant("2") is None
+
+    cache_adapter.ingest_new_data(KEYS.SONG_FILE, "2", (None, files["high"], None, high))
+    song_uri = cache_adapter.get_song_file_uri("2", "file")
+    assert song_uri.endswith("fine/path/song2.128k.mp3")
+    assert cache_adapter.get_cached_song_file_variant("2") == high
+
+    # A worse variant doesn't replace the cached one.
+    cache_adapter.ingest_new_data(KEYS.SONG_FILE, "2", (None, files["low"], None, low))
+    assert cache_adapter.get_song_file_uri("2", "file") == song_uri
+    assert Path(song_uri[7:]).read_text() == "high"
+
+    # Requesting a better variant than the cached one is a cache miss, but the cached file
+    # is returned as the partial data.
+    assert cache_adapter.get_song_file_uri("2", "file", high) == song_uri
+    assert cache_adapter.get_song_file_uri("2", "file", low) == song_uri
+    try:
+        cache_adapter.get_song_file_uri("2", "file", SongFileVariant())
+        assert 0, "DID NOT raise CacheMissError"
+    except CacheMissError as e:
+        assert e.partial_data == song_uri
+
+    # The original does, and the transcoded file is deleted.
+    cache_adapter.ingest_new_data(KEYS.SONG_FILE, "2", (None, files["original"], None))
+    original_uri = cache_adapter.get_song_file_uri("2", "file")
+    assert original_uri.endswith("fine/path/song2.flac")
+    assert Path(original_uri[7:]).read_text() == "original"
+    assert cache_adapter.get_cached_song_file_variant("2") == SongFileVariant()
+    assert not Path(song_uri[7:]).exists()
+
+
 def test_get_cached_statuses(cache_adapter: FilesystemAdapter):
     cache_adapter.ingest_new_data(KEYS.SONG, "1", MOCK_SUBSONIC_SONGS[1])
     assert cache_adapter.get_cached_statuses(["1"]) == {"1": SongCacheStatus.NOT_CACHED}
@@ -416,6 +464,78 @@ def test_get_cached_statuses(cache_adapter: FilesystemAdapter):
     assert cache_adapter.get_cached_statuses(["1"]) == {"1": SongCacheStatus.NOT_CACHED}
 
 
+def test_song_file_admission(cache_adapter: FilesystemAdapter):
+    cache_adapter.ingest_new_data(KEYS.SONG, "1", MOCK_SUBSONIC_SONGS[1])
+
+    # Songs are only admitted on their second play.
+    assert not cache_adapter.should_admit_song_file("1")
+    cache_adapter.record_song_play("1")
+    assert not cache_adapter.should_admit_song_file("1")
+    cache_adapter.record_song_play("1")
+    assert cache_adapter.should_admit_song_file("1")
+
+    # Plays outside of the admission window don't count.
+    cache_adapter.admission_window = timedelta(0)
+    assert not cache_adapter.should_admit_song_file("1")
+
+    # Starred songs are always admitted.
+    starred_song = SubsonicAPI.Song(
+        "3", title="Song 3", starred=datetime(2020, 1, 1, tzinfo=timezone.utc)
+    )
+    cache_adapter.ingest_new_data(KEYS.SONG, "3", starred_song)
+    assert cache_adapter.should_admit_song_file("3")
+
+
+def test_predict_song_plays(cache_adapter: FilesystemAdapter):
+    assert cache_adapter.predict_song_plays("1", 3) == []
+
+    now = datetime.now()
+    sessions = [
+        # (days ago, song IDs)
+        (1, ["1", "2", "3"]),
+        (2, ["1", "2", "4"]),
+        (3, ["5", "1", "4"]),
+        (4, ["1", "4"]),
+        (5, ["5", "1", "4"]),
+    ]
+    for days_ago, song_ids in sessions:
+        for i, song_id in enumerate(song_ids):
+            models.SongPlay.create(
+                song_id=song_id,
+                played_at=now - timedelta(days=days_ago) + timedelta(minutes=4 * i),
+                source="playlist:1",
+            )
+
+    # The songs that most often followed the song.
+    assert cache_adapter.predict_song_plays("1", 2) == ["4", "2"]
+    assert sorted(cache_adapter.predict_song_plays("2", 3)) == ["3", "4"]
+    # The songs that most often started a session at this time of day.
+    assert cache_adapter.predict_song_plays(None, 1) == ["1"]
+
+    # Plays outside of the prediction window don't count.
+    cache_adapter.prediction_window = timedelta(days=2, hours=1)
+    assert cache_adapter.predict_song_plays("1", 2) == ["2"]
+
+
+def test_prune_song_plays(cache_adapter: FilesystemAdapter):
+    now = datetime.now()
+    for days_ago in (1, 89, 91, 365):
+        models.SongPlay.create(song_id="1", played_at=now - timedelta(days=days_ago))
+
+    # Only the plays outside of both windows are deleted.
+    assert cache_adapter.prune_song_plays() == 2
+    assert models.SongPlay.select().count() == 2
+    assert cache_adapter.prune_song_plays() == 0
+
+    cache_adapter.prediction_window = timedelta(days=180)
+    cache_adapter.admission_window = timedelta(days=30)
+    models.SongPlay.create(song_id="1", played_at=now - timedelta(days=120))
+    assert cache_adapter.prune_song_plays() == 0
+    cache_adapter.prediction_window = timedelta(days=30)
+    assert cache_adapter.prune_song_plays() == 2
+    assert models.SongPlay.select().count() == 1
+
+
 def test_delete_playlists(cache_adapter: FilesystemAdapter):
     cache_adapter.ingest_new_data(
         KEYS.PLAYLIST_DETAILS,
@@ -972,8 +1092,9 @@ def test_get_music_directory(cache_adapter: FilesystemAdapter):
     assert directory.name == "foo"
     assert directory.parent_id == "root"
 
+    # The children are sorted by name.
     dir_child, *song_children = directory.children
-    verify_songs(song_children, MOCK_SUBSONIC_SONGS[:2])
+    verify_songs(song_children, MOCK_SUBSONIC_SONGS[1::-1])
     assert isinstance(dir_child, Directory)
     dir_child = cast(Directory, dir_child)
     assert dir_child.id == "542"
@@ -1044,3 +1165,631 @@ def test_search(cache_adapter: FilesystemAdapter):
     ]
     assert [a.name for a in search_result.artists] == ["foo", "better boo"]
     assert [a.name for a in search_result.albums] == ["Foo", "Boo"]
+
+
+def query_plan(query: SelectQuery) -> List[str]:
+    sql, params = query.sql()
+    cursor = models.database.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params)
+    return [row[-1] for row in cursor.fetchall()]
+
+
+HOT_QUERIES = {
+    "songs by album": lambda: models.Song.select().where(models.Song.album == "a1"),
+    "songs by artist": lambda: models.Song.select().where(models.Song.artist == "art1"),
+    "songs by parent": lambda: models.Song.select().where(models.Song.parent_id == "d1"),
+    "directories by parent": lambda: (
+        models.Directory.select().where(models.Directory.parent_id == "d1")
+    ),
+    "albums by artist": lambda: models.Album.select().where(models.Album.artist == "art1"),
+    "albums by genre": lambda: models.Album.select().where(models.Album.genre == "Foo"),
+    "albums by year": lambda: (models.Album.select().where(models.Album.year.between(1990, 2000))),
+    "albums by name": lambda: models.Album.select().order_by(models.Album.sort_key).limit(30),
+    "albums by newest": lambda: (
+        models.Album.select().order_by(models.Album.created.desc()).limit(30)
+    ),
+    "albums by genre and name": lambda: (
+        models.Album.select().where(models.Album.genre == "Foo").order_by(models.Album.sort_key)
+    ),
+    "artists by name": lambda: models.Artist.select().order_by(models.Artist.sort_key),
+    "directory children": lambda: (
+        models.Song.select().where(models.Song.parent_id == "d1").order_by(models.Song.sort_key)
+    ),
+    "cache info by key": lambda: (
+        models.CacheInfo.select().where(models.CacheInfo.cache_key == KEYS.PLAYLISTS)
+    ),
+    "playlist songs": lambda: models.Playlist(id="p1")._songs,
+}
+
+
+def test_hot_queries_use_indexes(cache_adapter: FilesystemAdapter):
+    for name, query in HOT_QUERIES.items():
+        for detail in query_plan(query()):
+            # Every table access must either be a lookup via an index or a scan of an
+            # index (which is what happens for ORDER BY).
+            assert "INDEX" in detail or "PRIMARY KEY" in detail, (name, detail)
+
+
+def test_migrate_db(tmp_path: Path):
+    adapter = FilesystemAdapter({}, tmp_path, is_cache=True)
+    adapter._migration_thread.join()
+    assert not models.Version.is_less_than(migrations.SCHEMA_VERSION)
+    adapter.shutdown()
+
+    # Simulate a database from before the indexes existed.
+    for index in models.database.get_indexes("song"):
+        if index.name == "song_parent_id":
+            models.database.execute_sql(f"DROP INDEX {index.name}")
+    models.Version.delete().execute()
+    models.database.close()
+
+    adapter = FilesystemAdapter({}, tmp_path, is_cache=True)
+    adapter._migration_thread.join()
+    assert "song_parent_id" in {i.name for i in models.database.get_indexes("song")}
+    assert not models.Version.is_less_than(migrations.SCHEMA_VERSION)
+    assert models.Version.is_less_than("999.0.0")
+    adapter.shutdown()
+
+
+@contextmanager
+def record_queries() -> Generator[List[str], None, None]:
+    queries: List[str] = []
+    connection = models.database.connection()
+    connection.set_trace_callback(queries.append)
+    try:
+        yield queries
+    finally:
+        connection.set_trace_callback(None)
+
+
+@pytest.mark.parametrize("n", (10, 200))
+def test_render_lists_constant_queries(cache_adapter: FilesystemAdapter, n: int):
+    for i in range(n):
+        cache_adapter.ingest_new_data(
+            KEYS.ALBUM,
+            f"al{i}",
+            SubsonicAPI.Album(
+                f"Album {i}",
+                id=f"al{i}",
+                cover_art=f"alc{i}",
+                _artist=f"Artist {i}",
+                artist_id=f"ar{i}",
+                _genre="Foo",
+            ),
+        )
+        cache_adapter.ingest_new_data(
+            KEYS.SONG,
+            f"s{i}",
+            SubsonicAPI.Song(
+                f"s{i}",
+                title=f"Song {i}",
+                album_id=f"al{i}",
+                _album=f"Album {i}",
+                artist_id=f"ar{i}",
+                _artist=f"Artist {i}",
+                cover_art=f"sc{i}",
+                path=f"foo/s{i}.mp3",
+                size=100,
+            ),
+        )
+    cache_adapter.ingest_new_data(
+        KEYS.ARTISTS,
+        None,
+        [
+            SubsonicAPI.ArtistAndArtistInfo(f"Artist {i}", f"ar{i}", cover_art=f"arc{i}")
+            for i in range(n)
+        ],
+    )
+    cache_adapter.ingest_new_data(
+        KEYS.PLAYLISTS,
+        None,
+        [SubsonicAPI.Playlist(f"p{i}", f"Playlist {i}", cover_art=f"pc{i}") for i in range(n)],
+    )
+
+    with record_queries() as queries:
+        albums = [
+            (a.name, a.cover_art, a.artist and a.artist.name, a.genre and a.genre.name)
+            for a in cache_adapter.get_all_albums()
+        ]
+    assert len(albums) == n
+    assert all(a[1] and a[2] and a[3] == "Foo" for a in albums)
+    assert len(queries) == 1
+
+    with record_queries() as queries:
+        artists = [(a.name, a.artist_image_url) for a in cache_adapter.get_artists()]
+    assert len(artists) == n
+    assert all(a[1] for a in artists)
+    assert len(queries) == 2  # cache info lookup + list
+
+    with record_queries() as queries:
+        playlists = [(p.name, p.cover_art) for p in cache_adapter.get_playlists()]
+    assert len(playlists) == n
+    assert all(p[1] for p in playlists)
+    assert len(queries) == 2  # cache info lookup + list
+
+    with record_queries() as queries:
+        songs = [
+            (s.title, s.cover_art, s.path, s.size, s.album.name, s.artist.name)
+            for s in models.Song.select_joined()
+        ]
+    assert len(songs) == n
+    assert all(s[1] and s[2] for s in songs)
+    assert len(queries) == 1
+
+    with record_queries() as queries:
+        statuses = cache_adapter.get_cached_statuses([f"s{i}" for i in range(n)])
+    assert set(statuses.values()) == {SongCacheStatus.NOT_CACHED}
+    assert len(queries) == 1
+
+
+def test_records_match_objects(cache_adapter: FilesystemAdapter):
+    for i in range(3):
+        cache_adapter.ingest_new_data(
+            KEYS.ALBUM,
+            f"al{i}",
+            SubsonicAPI.Album(
+                f"Album {i}",
+                id=f"al{i}",
+                cover_art=f"alc{i}" if i else None,
+                _artist=f"Artist {2 - i}",
+                artist_id=f"ar{2 - i}",
+                _genre="Foo" if i else None,
+                year=2000 + i,
+            ),
+        )
+    cache_adapter.ingest_new_data(
+        KEYS.ARTISTS,
+        None,
+        [
+            SubsonicAPI.ArtistAndArtistInfo(f"Artist {i}", f"ar{i}", cover_art=f"arc{i}")
+            for i in range(3)
+        ],
+    )
+    cache_adapter.ingest_new_data(
+        KEYS.PLAYLISTS,
+        None,
+        [SubsonicAPI.Playlist(f"p{i}", f"Playlist {i}", cover_art=f"pc{i}") for i in range(3)],
+    )
+
+    with record_queries() as queries:
+        artists = cache_adapter.get_artist_records()
+    assert len(queries) == 2  # cache info lookup + list
+    assert sorted(artists) == sorted(
+        SublimeAPI.ArtistRecord.from_object(a) for a in cache_adapter.get_artists()
+    )
+
+    with record_queries() as queries:
+        playlists = cache_adapter.get_playlist_records()
+    assert len(queries) == 2  # cache info lookup + list
+    assert playlists == [
+        SublimeAPI.PlaylistRecord.from_object(p) for p in cache_adapter.get_playlists()
+    ]
+
+    query = AlbumSearchQuery(AlbumSearchQuery.Type.ALPHABETICAL_BY_ARTIST)
+    try:
+        cache_adapter.get_albums(query)
+        assert 0, "DID NOT raise CacheMissError"
+    except CacheMissError as e:
+        expected = [SublimeAPI.AlbumRecord.from_object(a) for a in e.partial_data]
+    assert [a.id for a in expected] == ["al2", "al1", "al0"]
+
+    with record_queries() as queries:
+        try:
+            cache_adapter.get_album_records(query)
+            assert 0, "DID NOT raise CacheMissError"
+        except CacheMissError as e:
+            records = e.partial_data
+    assert len(queries) == 2  # query result lookup + list
+    assert records == expected
+
+
+def test_song_loaders(cache_adapter: FilesystemAdapter):
+    songs = [
+        SubsonicAPI.Song(
+            f"s{i}",
+            title=f"Song {i}",
+            album_id="al1",
+            _album="Album 1",
+            artist_id="ar1",
+            _artist="Artist 1",
+            disc_number=(i % 2) + 1 if i else None,
+            track=10 - i,
+            path=f"foo/s{i}.mp3",
+            cover_art=f"c{i}",
+        )
+        for i in range(10)
+    ]
+    cache_adapter.ingest_new_data(
+        KEYS.ALBUM,
+        "al1",
+        SubsonicAPI.Album("Album 1", id="al1", artist_id="ar1", _artist="Artist 1", songs=songs),
+    )
+    cache_adapter.ingest_new_data(
+        KEYS.PLAYLIST_DETAILS,
+        "p1",
+        SubsonicAPI.Playlist("p1", "Playlist 1", songs=songs[::-1] + songs[:2]),
+    )
+    album = cache_adapter.get_album("al1")
+    playlist = cache_adapter.get_playlist_details("p1")
+
+    def load(songs: Iterable[SublimeAPI.Song]) -> List[Tuple]:
+        return [
+            (
+                s.id,
+                s.album and s.album.name,
+                s.artist and s.artist.name,
+                s.cover_art,
+                s.path,
+                s.size,
+            )
+            for s in songs
+        ]
+
+    assert album.songs is not None
+    with record_queries() as queries:
+        album_songs = load(album.songs)
+    assert len(queries) == 2  # songs + artists
+    # Disc 1 (and no disc) songs by track, then disc 2 songs by track.
+    assert [s[0] for s in album_songs] == [
+        *("s8", "s6", "s4", "s2", "s0"),
+        *("s9", "s7", "s5", "s3", "s1"),
+    ]
+    assert all(
+        s[1:] == ("Album 1", "Artist 1", f"c{s[0][1:]}", f"foo/{s[0]}.mp3", None)
+        for s in album_songs
+    )
+
+    with record_queries() as queries:
+        playlist_songs = load(playlist.songs)
+    assert len(queries) == 3  # songs + artists + albums
+    assert [s[0] for s in playlist_songs] == [f"s{i}" for i in range(9, -1, -1)] + ["s0", "s1"]
+    assert all(s[3:5] == (f"c{s[0][1:]}", f"foo/{s[0]}.mp3") for s in playlist_songs)
+
+    # The number of queries doesn't depend on the number of songs.
+    cache_adapter.ingest_new_data(
+        KEYS.PLAYLIST_DETAILS,
+        "p1",
+        SubsonicAPI.Playlist("p1", "Playlist 1", songs=songs * 5),
+    )
+    playlist = cache_adapter.get_playlist_details("p1")
+    with record_queries() as queries:
+        assert len(load(playlist.songs)) == 50
+    assert len(queries) == 3
+
+
+@pytest.mark.parametrize(
+    "name, edit, max_changes",
+    [
+        ("append", lambda ids: ids + ["s0"], 1),
+        ("remove", lambda ids: ids[:500] + ids[501:], 1),
+        ("move", lambda ids: ids[:10] + ids[11:900] + ids[10:11] + ids[900:], 2),
+        ("prepend", lambda ids: ["new"] + ids, 1),
+        ("reverse", lambda ids: ids[::-1], 2 * 5000),
+        ("clear", lambda ids: [], 5000),
+    ],
+)
+def test_sorted_many_to_many_diff(
+    cache_adapter: FilesystemAdapter,
+    name: str,
+    edit: Callable[[List[str]], List[str]],
+    max_changes: int,
+):
+    n = 5000
+    ids = [f"s{i}" for i in range(n)]
+    models.Song.insert_many([{"id": id, "title": id} for id in ids + ["new"]]).execute()
+    playlist = cast(
+        models.Playlist, models.Playlist.create(id="p1", name="Playlist 1", _songs=ids)
+    )
+    assert [s.id for s in playlist.songs] == ids
+
+    connection = models.database.connection()
+    changes = connection.total_changes
+    new_ids = edit(ids)
+    playlist._songs = new_ids
+    assert [s.id for s in playlist.songs] == new_ids
+    # Only the through rows which actually changed should be written.
+    assert connection.total_changes - changes <= max_changes, name
+
+    # Editing again should still be a minimal diff (even if the positions had to be
+    # renumbered the first time).
+    changes = connection.total_changes
+    playlist._songs = new_ids + ["s2"]
+    assert [s.id for s in playlist.songs] == new_ids + ["s2"]
+    assert connection.total_changes - changes == 1
+
+
+def test_album_query_planner(cache_adapter: FilesystemAdapter):
+    n = 25
+    for i in range(n):
+        cache_adapter.ingest_new_data(
+            KEYS.ALBUM,
+            f"al{i}",
+            SubsonicAPI.Album(
+                f"Album {i:02}",
+                id=f"al{i}",
+                artist_id=f"ar{i % 3}",
+                _artist=f"Artist {i % 3}",
+                _genre="Foo" if i % 2 else "Bar",
+                year=1990 + i,
+                play_count=i % 4,
+                created=datetime(2020, 1, 1, tzinfo=timezone.utc) + timedelta(days=i % 5),
+                starred=datetime.now() if i % 5 == 0 else None,
+                songs=[
+                    SubsonicAPI.Song(
+                        f"s{i}", title=f"Song {i}", album_id=f"al{i}", _album=f"Album {i:02}"
+                    )
+                ],
+            ),
+        )
+    for i in (3, 7, 3, 11):
+        cache_adapter.record_song_play(f"s{i}")
+
+    Type = AlbumSearchQuery.Type
+    expected_ids = {
+        Type.NEWEST: [f"al{i}" for i in sorted(range(n), key=lambda i: (-(i % 5), f"al{i}"))],
+        Type.FREQUENT: [f"al{i}" for i in sorted(range(n), key=lambda i: (-(i % 4), f"al{i}"))],
+        Type.RECENT: ["al11", "al3", "al7"],
+        Type.STARRED: ["al0", "al5", "al10", "al15", "al20"],
+        Type.ALPHABETICAL_BY_NAME: [f"al{i}" for i in range(n)],
+        Type.ALPHABETICAL_BY_ARTIST: [
+            f"al{i}" for i in sorted(range(n), key=lambda i: (i % 3, f"al{i}"))
+        ],
+        Type.YEAR_RANGE: ["al10", "al11", "al12"],
+        Type.GENRE: [f"al{i}" for i in range(1, n, 2)],
+    }
+    for type_ in Type:
+        query = AlbumSearchQuery(
+            type_, year_range=(2000, 2002), genre=AlbumSearchQuery._Genre("Foo")
+        )
+        try:
+            cache_adapter.get_album_records(query)
+            assert 0, "DID NOT raise CacheMissError"
+        except CacheMissError as e:
+            all_ids = [a.id for a in e.partial_data]
+        if type_ in expected_ids:
+            assert all_ids == expected_ids[type_], type_
+        else:
+            assert sorted(all_ids) == sorted(f"al{i}" for i in range(n))
+
+        # Paging through the albums should give the same albums in the same order.
+        for sort_direction, ids in (("ascending", all_ids), ("descending", all_ids[::-1])):
+            paged_ids: List[str] = []
+            for offset in range(0, len(ids), 10):
+                try:
+                    cache_adapter.get_album_records_page(query, offset, 10, sort_direction)
+                    assert 0, "DID NOT raise CacheMissError"
+                except CacheMissError as e:
+                    page = e.partial_data
+                assert page.total == len(ids)
+                paged_ids.extend(a.id for a in page.albums)
+            assert paged_ids == ids, (type_, sort_direction)
+
+            # The index of each album is its position in the paged albums.
+            for album_id in (*ids, "nonexistent"):
+                try:
+                    cache_adapter.get_album_index(query, album_id, sort_direction)
+                    assert 0, "DID NOT raise CacheMissError"
+                except CacheMissError as e:
+                    index = e.partial_data
+                assert index == (ids.index(album_id) if album_id in ids else None)
+
+    # Once the query result is cached, it should be paged in the cached order.
+    query = AlbumSearchQuery(Type.NEWEST)
+    cache_adapter.ingest_new_data(
+        KEYS.ALBUMS,
+        query.strhash(),
+        [SubsonicAPI.Album(f"Album {i:02}", id=f"al{i}") for i in (4, 2, 9)],
+    )
+    page = cache_adapter.get_album_records_page(query, 1, 10, "descending")
+    assert page.total == 3
+    assert [a.id for a in page.albums] == ["al2", "al4"]
+    assert cache_adapter.get_album_index(query, "al4", "descending") == 2
+    assert cache_adapter.get_album_index(query, "al1") is None
+
+
+def test_sort_keys(cache_adapter: FilesystemAdapter):
+    cache_adapter.ingest_new_data(KEYS.IGNORED_ARTICLES, None, {"The"})
+    names = ["The Beatles", "abba", "A Tribe Called Quest", "the the", "Björk"]
+    cache_adapter.ingest_new_data(
+        KEYS.ARTISTS,
+        None,
+        [SubsonicAPI.ArtistAndArtistInfo(name, f"ar{i}") for i, name in enumerate(names)],
+    )
+    expected = ["A Tribe Called Quest", "abba", "The Beatles", "Björk", "the the"]
+    assert [a.name for a in cache_adapter.get_artists()] == expected
+    assert [a.name for a in cache_adapter.get_artist_records()] == expected
+
+    # Changing the ignored articles should re-sort the artists.
+    cache_adapter.ingest_new_data(KEYS.IGNORED_ARTICLES, None, {"The", "A"})
+    expected = ["abba", "The Beatles", "Björk", "the the", "A Tribe Called Quest"]
+    assert [a.name for a in cache_adapter.get_artists()] == expected
+
+
+def test_capability_snapshot(cache_adapter: FilesystemAdapter):
+    assert not cache_adapter.can_get_playlists
+    assert not cache_adapter.can_get_artists
+
+    cache_adapter.ingest_new_data(KEYS.PLAYLISTS, None, [])
+    cache_adapter.invalidate_data(KEYS.PLAYLISTS, None)
+
+    # Checking the capabilities shouldn't hit the database.
+    with record_queries() as queries:
+        for _ in range(100):
+            assert cache_adapter.can_get_playlists
+            assert not cache_adapter.can_get_artists
+            assert not cache_adapter.can_get_genres
+    assert queries == []
+
+    stats = cache_adapter.capability_snapshot_stats
+    assert stats["refreshes"] == 1
+    assert stats["updates"] == 1
+    assert stats["checks"] == 302
+
+    cache_adapter.delete_data(KEYS.EVERYTHING, None)
+    assert not cache_adapter.can_get_playlists
+    assert stats["refreshes"] == 2
+
+
+def test_search_index(cache_adapter: FilesystemAdapter):
+    titles = ["Yesterday", "Let It Be", "Hey Jude", "Something", "Here Comes the Sun"]
+    for i in range(200):
+        cache_adapter.ingest_new_data(
+            KEYS.SONG,
+            f"s{i}",
+            SubsonicAPI.Song(
+                f"s{i}",
+                title=titles[i] if i < len(titles) else f"Filler {i}",
+                _artist="The Beatles" if i < len(titles) else "Someone Else",
+                artist_id="ar1" if i < len(titles) else "ar2",
+            ),
+        )
+
+    # Typos should still find the song, and only the candidates should be scored.
+    with record_queries() as queries:
+        search_result = cache_adapter.search("yesturday")
+    assert any(" MATCH " in q for q in queries)
+    assert [s.title for s in search_result.songs] == ["Yesterday"]
+    assert len(search_result._songs) < 10
+
+    # Songs are also found by their artist's name.
+    search_result = cache_adapter.search("beatles")
+    assert {s.title for s in search_result.songs} == set(titles)
+    assert [a.name for a in search_result.artists] == ["The Beatles"]
+
+    # The index is kept up-to-date when rows change.
+    cache_adapter.ingest_new_data(KEYS.SONG, "s0", SubsonicAPI.Song("s0", title="Blackbird"))
+    assert [s.id for s in cache_adapter.search("blackbird").songs] == ["s0"]
+    assert cache_adapter.search("yesterday").songs == []
+
+    cache_adapter.delete_data(KEYS.EVERYTHING, None)
+    assert cache_adapter.search("blackbird").songs == []
+
+
+def test_search_refinement(cache_adapter: FilesystemAdapter):
+    cache_adapter.ingest_new_data(
+        KEYS.ARTISTS,
+        None,
+        [
+            SubsonicAPI.ArtistAndArtistInfo("Radiohead", "ar1"),
+            SubsonicAPI.ArtistAndArtistInfo("Radio Dept.", "ar2"),
+            SubsonicAPI.ArtistAndArtistInfo("Portishead", "ar3"),
+        ],
+    )
+
+    assert [a.name for a in cache_adapter.search("radi").artists] == [
+        "Radio Dept.",
+        "Radiohead",
+    ]
+    assert cache_adapter.search_stats["index_searches"] == 1
+
+    # A candidate for "radi" can miss one of its two trigrams, but a candidate for
+    # "radioh" can miss three of its four, so the candidates of "radioh" aren't all
+    # among the candidates of "radi" and the index is searched.
+    radioh = [a.name for a in cache_adapter.search("radioh").artists]
+    assert cache_adapter.search_stats["index_searches"] == 2
+
+    # But a candidate for any extension of "radioh" can only miss three of its trigrams
+    # as well, so only the previous candidates are checked and scored from then on.
+    with record_queries() as queries:
+        radiohe = [a.name for a in cache_adapter.search("radiohe").artists]
+        radiohead = [a.name for a in cache_adapter.search("radiohead").artists]
+        # Going back to a previous query uses its results.
+        assert [a.name for a in cache_adapter.search("radioh").artists] == radioh
+    assert queries == []
+    assert radioh == radiohe == ["Radiohead", "Radio Dept."]
+    # "Radio Dept." only has three of the seven trigrams of "radiohead".
+    assert radiohead == ["Radiohead"]
+    assert cache_adapter.search_stats["narrowed"] == 2
+    assert cache_adapter.search_stats["history_hits"] == 1
+
+    # Other queries search the index again.
+    assert [a.name for a in cache_adapter.search("portis").artists] == ["Portishead"]
+    assert cache_adapter.search_stats["index_searches"] == 3
+
+    # New data has to be searched for.
+    cache_adapter.ingest_new_data(
+        KEYS.ARTIST, "ar4", SubsonicAPI.ArtistAndArtistInfo("Radiohead Tribute", "ar4")
+    )
+    assert [a.name for a in cache_adapter.search("radiohead").artists] == [
+        "Radiohead",
+        "Radiohead Tribute",
+    ]
+    assert cache_adapter.search_stats["index_searches"] == 4
+
+
+def test_search_refinement_chain(cache_adapter: FilesystemAdapter):
+    names = ["Radiohead", "Radiohaed", "Radio Dept.", "Bad Ohead", "Studio Head"]
+    cache_adapter.ingest_new_data(
+        KEYS.ARTISTS,
+        None,
+        [SubsonicAPI.ArtistAndArtistInfo(name, f"ar{i}") for i, name in enumerate(names)],
+    )
+
+    queries = ["radioh", "radiohe", "radiohea", "radiohead"]
+    narrowed = [cache_adapter.search(q) for q in queries]
+    assert cache_adapter.search_stats["index_searches"] == 1
+    assert cache_adapter.search_stats["narrowed"] == 3
+
+    # Each narrowed result has the same candidates (and therefore results) as a fresh
+    # search of the index would.
+    for query, search_result in zip(queries, narrowed):
+        cache_adapter._clear_search_history()
+        expected = cache_adapter.search(query)
+        assert set(search_result._artists) == set(expected._artists), query
+        assert search_result.artists == expected.artists, query
+
+    # The candidates shrink as the query gets longer, but a typo is still a candidate.
+    assert {a.name for a in narrowed[0]._artists.values()} == set(names) - {"Bad Ohead"}
+    assert {a.name for a in narrowed[-1]._artists.values()} == {"Radiohead", "Radiohaed"}
+
+
+def test_verify_cache(cache_adapter: FilesystemAdapter, tmp_path: Path):
+    hashes = {}
+    for cover_art_id in ("s1", "s2", "s3"):
+        filename = tmp_path.joinpath(f"{cover_art_id}.png")
+        filename.write_bytes(cover_art_id.encode())
+        cache_adapter.ingest_new_data(KEYS.COVER_ART_FILE, cover_art_id, filename)
+        hashes[cover_art_id] = Path(cache_adapter.get_cover_art_uri(cover_art_id, "file", 300))
+    an_hour_ago = (datetime.now() - timedelta(hours=1)).timestamp()
+
+    # Nothing is wrong with a fresh cache.
+    report = cache_adapter.verify_cache(full=True)
+    assert (report.checked_files, report.hashed_files) == (3, 3)
+    assert report.missing_files == report.orphaned_files == 0
+    assert report.quarantined_files == []
+
+    # Corrupt one file, delete another, and leave some orphans behind.
+    hashes["s1"].write_bytes(b"corrupt")
+    hashes["s2"].unlink()
+    orphan = cache_adapter.music_dir.joinpath("foo", "orphan.mp3")
+    orphan.parent.mkdir()
+    orphan.write_bytes(b"orphan")
+    os.utime(orphan, (an_hour_ago, an_hour_ago))
+    # Files which may still be being ingested are not orphans.
+    new_file = cache_adapter.music_dir.joinpath("new.mp3")
+    new_file.write_bytes(b"new")
+
+    report = cache_adapter.verify_cache(full=True)
+    assert cache_adapter.last_verification_report is report
+    assert (report.checked_files, report.hashed_files) == (3, 2)
+    assert report.missing_files == 1
+    assert (report.orphaned_files, report.reclaimed_bytes) == (1, 6)
+    assert len(report.quarantined_files) == 1
+    assert report.quarantined_files[0].read_bytes() == b"corrupt"
+    assert not hashes["s1"].exists() and not orphan.exists() and new_file.exists()
+
+    for cover_art_id in ("s1", "s2"):
+        with pytest.raises(CacheMissError):
+            cache_adapter.get_cover_art_uri(cover_art_id, "file", 300)
+    assert cache_adapter.get_cover_art_uri("s3", "file", 300) == str(hashes["s3"])
+
+    # Only the files which have been modified since they were ingested are re-hashed.
+    cache_adapter._verifier.sample_fraction = 0
+    hashes["s3"].write_bytes(b"corrupt")
+    report = cache_adapter.verify_cache()
+    assert report.hashed_files == 0
+
+    an_hour_from_now = (datetime.now() + timedelta(hours=1)).timestamp()
+    os.utime(hashes["s3"], (an_hour_from_now, an_hour_from_now))
+    report = cache_adapter.verify_cache()
+    assert report.hashed_files == 1
+    assert len(report.quarantined_files) == 1
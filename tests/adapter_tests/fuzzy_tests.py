@@ -0,0 +1,34 @@
+import random
+from typing import List, Optional, Sequence, Tuple
+
+import pytest
+from rapidfuzz import fuzz
+
+from sublime_music.adapters import fuzzy
+
+
+def brute_force_top_k(
+    query: str, choices: Sequence[Sequence[Optional[str]]], k: int
+) -> List[Tuple[int, float]]:
+    scores = []
+    for i, choice in enumerate(choices):
+        choice_scores = [fuzz.partial_ratio(query.lower(), s.lower()) for s in choice if s]
+        if choice_scores and max(choice_scores) >= 60:
+            scores.append((i, max(choice_scores)))
+    return sorted(scores, key=lambda m: -m[1])[:k]
+
+
+@pytest.mark.parametrize("parallel", (False, True))
+def test_top_k(monkeypatch: pytest.MonkeyPatch, parallel: bool):
+    if parallel:
+        monkeypatch.setattr(fuzzy, "PARALLEL_THRESHOLD", 10)
+        monkeypatch.setattr(fuzzy.os, "cpu_count", lambda: 4)
+
+    rng = random.Random(0)
+    words = ["foo", "bar", "baz", "boo", "fool", "food", "radio", "head"]
+    choices = [
+        (" ".join(rng.choices(words, k=3)).title(), rng.choice([None, *words])) for _ in range(500)
+    ]
+    for query in ("foo", "Radiohead", "zzz"):
+        result = fuzzy.top_k(query, list(zip(*choices)), 20)
+        assert result == brute_force_top_k(query, choices, 20)
@@ -0,0 +1,75 @@
+from datetime import timedelta
+from typing import List
+
+from sublime_music.adapters.prefetch import (
+    PrefetchDecision,
+    PrefetchPlanner,
+    ThroughputEstimator,
+    UpcomingSong,
+)
+
+MB = 1000 * 1000
+
+
+def upcoming_songs(count: int, **kwargs) -> List[UpcomingSong]:
+    return [UpcomingSong(f"song{i}", timedelta(minutes=4), 8 * MB, **kwargs) for i in range(count)]
+
+
+def test_throughput_estimator():
+    estimator = ThroughputEstimator()
+    assert estimator.bytes_per_second == ThroughputEstimator.default_bytes_per_second
+
+    # Small downloads are ignored.
+    estimator.record(1000, 0.001)
+    assert estimator.samples == 0
+
+    estimator.record(10 * MB, 1)
+    assert estimator.bytes_per_second == 10 * MB
+    estimator.record(10 * MB, 2)
+    assert estimator.bytes_per_second == 10 * MB + estimator.smoothing * (5 * MB - 10 * MB)
+    assert estimator.samples == 2
+
+
+def test_plan_fast_link():
+    plan = PrefetchPlanner().plan(upcoming_songs(3), 10 * MB, current_remaining=60)
+
+    # Only the next song is needed before the next plan.
+    assert plan.song_ids == ["song0"]
+    assert [d.action for d in plan.decisions] == [
+        PrefetchDecision.Action.PREFETCH,
+        PrefetchDecision.Action.DEFER,
+        PrefetchDecision.Action.DEFER,
+    ]
+    assert [d.starts_in for d in plan.decisions] == [60, 300, 540]
+    assert plan.decisions[0].download_seconds == 0.8
+    # There is plenty of time, so the download can be delayed.
+    assert plan.delay == PrefetchPlanner.max_delay
+
+
+def test_plan_slow_link():
+    plan = PrefetchPlanner().plan(upcoming_songs(3), 30 * 1000, current_remaining=60)
+
+    # Each song takes longer to download than to play, so all of them are needed now.
+    assert plan.song_ids == ["song0", "song1", "song2"]
+    assert plan.decisions[0].slack < 0
+    assert plan.delay == 0
+
+
+def test_plan_skips_cached_songs():
+    upcoming = [
+        UpcomingSong("cached", timedelta(minutes=4), 8 * MB, cached=True),
+        UpcomingSong("downloading", timedelta(minutes=4), 8 * MB, downloading=True),
+        # Songs without a size are estimated from their duration.
+        UpcomingSong("unknown size", timedelta(minutes=4), None),
+    ]
+    plan = PrefetchPlanner().plan(upcoming, 100 * 1000, current_remaining=10)
+
+    assert [d.action for d in plan.decisions] == [
+        PrefetchDecision.Action.CACHED,
+        PrefetchDecision.Action.DOWNLOADING,
+        PrefetchDecision.Action.DEFER,
+    ]
+    # Downloading songs are kept so that their downloads aren't cancelled.
+    assert plan.song_ids == ["downloading"]
+    assert plan.decisions[2].download_seconds == 96
+    assert "unknown size: defer (starts in 490s" in str(plan)
@@ -9,7 +9,7 @@ from typing import Any, Generator, List, Tuple
 import pytest
 from dateutil.tz import tzutc
 
-from sublime_music.adapters import ConfigurationStore
+from sublime_music.adapters import ConfigurationStore, SongFileVariant
 from sublime_music.adapters.subsonic import SubsonicAdapter, api_objects as SubsonicAPI
 
 MOCK_DATA_FILES = Path(__file__).parent.joinpath("mock_data")
@@ -556,3 +556,51 @@ def test_search(adapter: SubsonicAdapter):
         assert len(search_results._songs) == 7
         assert len(search_results._artists) == 2
         assert len(search_results._albums) == 4
+
+
+def test_search_page(adapter: SubsonicAdapter, monkeypatch: pytest.MonkeyPatch):
+    requests: List[Any] = []
+    get = adapter._get
+
+    def recording_get(url: str, **params: Any) -> Any:
+        requests.append(params)
+        return get(url, **params)
+
+    monkeypatch.setattr(adapter, "_get", recording_get)
+
+    for filename, data in mock_data_files("search3"):
+        logging.info(filename)
+        logging.debug(data)
+        adapter._set_mock_data(data)
+
+        search_results = adapter.search_page("3", "songs", 10, 5)
+        assert len(search_results._songs) == 7
+        assert len(search_results._artists) == 0
+        assert len(search_results._albums) == 0
+
+        # Only the requested page of the requested type of result is requested.
+        params = requests.pop()
+        assert params["query"] == "3"
+        assert (params["songCount"], params["songOffset"]) == (5, 10)
+        assert params["artistCount"] == params["albumCount"] == 0
+        assert "artistOffset" not in params and "albumOffset" not in params
+
+
+def test_song_file_variants(adapter: SubsonicAdapter):
+    assert "/rest/download.view?" in adapter.get_song_file_uri("1", ["https"])
+    assert adapter.preferred_song_file_variant() == SongFileVariant()
+
+    # Transcoded variants are downloaded from the stream endpoint.
+    variant = SongFileVariant("mp3", 128)
+    song_uri = adapter.get_song_file_uri("1", ["https"], variant)
+    assert "/rest/stream.view?" in song_uri
+    assert "format=mp3" in song_uri and "maxBitRate=128" in song_uri
+    assert "maxBitRate=128" in adapter.get_song_stream_uri("1", variant)
+    assert "maxBitRate" not in adapter.get_song_stream_uri("1")
+
+    # On metered networks, songs are transcoded to the configured bit rate.
+    adapter.metered_max_bit_rate = 96
+    adapter._is_metered = lambda: True  # type: ignore
+    assert adapter.preferred_song_file_variant() == SongFileVariant("mp3", 96)
+    adapter.metered_max_bit_rate = 0
+    assert adapter.preferred_song_file_variant() == SongFileVariant()
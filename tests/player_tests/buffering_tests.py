@@ -0,0 +1,136 @@
+from typing import Dict, List
+
+from conftest import FakeClock
+
+from sublime_music.players.buffering import (
+    BUFFERING_PROFILES,
+    BufferMonitor,
+    SourceType,
+    classify_source,
+)
+
+
+def test_classify_source():
+    assert classify_source("/home/user/song.mp3") == SourceType.LOCAL
+    assert classify_source("file:///home/user/song.mp3") == SourceType.LOCAL
+    assert classify_source("http://127.0.0.1:4040/rest/stream") == SourceType.LAN
+    assert classify_source("http://192.168.1.10:4533/rest/stream") == SourceType.LAN
+    assert classify_source("http://[fe80::1]:4533/rest/stream") == SourceType.LAN
+    assert classify_source("http://nas.local/rest/stream") == SourceType.LAN
+    assert classify_source("http://nas:4533/rest/stream") == SourceType.LAN
+    assert classify_source("https://music.example.com/rest/stream") == SourceType.REMOTE
+    assert classify_source("https://8.8.8.8/rest/stream") == SourceType.REMOTE
+
+
+def test_profile_options():
+    options = BUFFERING_PROFILES[SourceType.REMOTE].mpv_options()
+    assert options["demuxer-readahead-secs"] == "60"
+    assert options["demuxer-max-bytes"] == "64MiB"
+    assert options["network-timeout"] == "30"
+
+    escalated = BUFFERING_PROFILES[SourceType.REMOTE].escalated(1).mpv_options()
+    assert escalated["demuxer-readahead-secs"] == "120"
+    assert escalated["cache-pause-wait"] == "6"
+    # The network timeout isn't escalated.
+    assert escalated["network-timeout"] == "30"
+    # The escalation is capped.
+    assert BUFFERING_PROFILES[SourceType.LAN].escalated(10).readahead_secs == 160
+
+
+def test_buffer_monitor_stalls(clock: FakeClock):
+    applied: List[Dict[str, str]] = []
+    monitor = BufferMonitor(applied.append, clock)
+
+    options = monitor.start("https://music.example.com/rest/stream", duration=240)
+    assert options == BUFFERING_PROFILES[SourceType.REMOTE].mpv_options()
+
+    # Buffering before playback starts is not a stall.
+    monitor.on_paused_for_cache(True)
+    clock.now = 1.5
+    monitor.on_paused_for_cache(False)
+    monitor.on_time_pos(0)
+    assert monitor.stats["stalls"] == 0
+    assert monitor.seconds["buffering"] == 1.5
+
+    for i in range(1, 11):
+        monitor.on_time_pos(i)
+    assert monitor.seconds["played"] == 10
+
+    monitor.on_paused_for_cache(True)
+    clock.now = 4
+    monitor.on_paused_for_cache(False)
+    assert monitor.stats["stalls"] == 1
+    assert monitor.seconds["stalled"] == 2.5
+
+    # The stall escalates the profile straight away.
+    assert monitor.level == 1
+    assert applied == [BUFFERING_PROFILES[SourceType.REMOTE].escalated(1).mpv_options()]
+
+    # Only one escalation per song.
+    monitor.on_paused_for_cache(True)
+    monitor.on_paused_for_cache(False)
+    assert monitor.stats["stalls"] == 2
+    assert monitor.level == 1
+
+    # The next song from the same kind of source uses the escalated profile.
+    options = monitor.start("https://music.example.com/rest/stream2")
+    assert options == BUFFERING_PROFILES[SourceType.REMOTE].escalated(1).mpv_options()
+    # But other kinds of source don't.
+    options = monitor.start("/home/user/song.mp3")
+    assert options == BUFFERING_PROFILES[SourceType.LOCAL].mpv_options()
+
+
+def test_buffer_monitor_low_buffer(clock: FakeClock):
+    applied: List[Dict[str, str]] = []
+    monitor = BufferMonitor(applied.append, clock)
+
+    monitor.start("http://192.168.1.10/rest/stream", duration=240)
+    monitor.on_time_pos(10)
+    monitor.on_cache_time(30)
+    assert monitor.stats["low_buffers"] == 0
+
+    monitor.on_time_pos(28)
+    monitor.on_cache_time(30)
+    assert monitor.stats["low_buffers"] == 1
+    assert monitor.level == 1
+    assert len(applied) == 1
+
+    # The buffer being low at the end of the song is expected.
+    monitor.start("http://192.168.1.10/rest/stream", duration=240)
+    monitor.on_time_pos(238)
+    monitor.on_cache_time(240)
+    assert monitor.stats["low_buffers"] == 1
+
+
+def test_buffer_monitor_relaxes(clock: FakeClock):
+    monitor = BufferMonitor(lambda _: None, clock)
+
+    monitor.start("https://music.example.com/rest/stream")
+    monitor.on_time_pos(1)
+    monitor.on_paused_for_cache(True)
+    monitor.on_paused_for_cache(False)
+    assert monitor.level == 1
+
+    for _ in range(BufferMonitor.songs_to_relax):
+        monitor.start("https://music.example.com/rest/stream")
+        assert monitor.level == 1
+        monitor.on_time_pos(1)
+
+    monitor.finish()
+    assert monitor.stats["relaxations"] == 1
+    assert "1 stalls" in monitor.summary()
+
+    monitor.start("https://music.example.com/rest/stream")
+    assert monitor.level == 0
+
+
+def test_buffer_monitor_applies_options_without_lock(clock: FakeClock):
+    locked: List[bool] = []
+    monitor = BufferMonitor(lambda _: locked.append(monitor._lock.locked()), clock)
+
+    # The options are applied from the MPV observers, so the lock must have been released
+    # by then.
+    monitor.start("https://music.example.com/rest/stream")
+    monitor.on_time_pos(1)
+    monitor.on_paused_for_cache(True)
+    assert locked == [False]
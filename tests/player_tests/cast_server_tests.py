@@ -0,0 +1,289 @@
+import http.client
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+import pytest
+
+from sublime_music.players.cast_server import CastServer, TeeDownload, parse_range
+
+
+@pytest.fixture
+def server():
+    server = CastServer("127.0.0.1", 0)
+    server.start()
+    yield server
+    server.shutdown()
+
+
+def request(
+    server: CastServer,
+    path: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> Tuple[int, Dict[str, str], bytes]:
+    connection = http.client.HTTPConnection("127.0.0.1", server.port)
+    connection.request("GET", path, headers=headers or {})
+    response = connection.getresponse()
+    result = response.status, dict(response.getheaders()), response.read()
+    connection.close()
+    return result
+
+
+def wait_until(condition: Callable[[], bool], timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=10-19", 100) == (10, 19)
+    assert parse_range("bytes=10-", 100) == (10, 99)
+    assert parse_range("bytes=90-200", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=-200", 100) == (0, 99)
+    # Multi-range requests are ignored.
+    assert parse_range("bytes=0-1,5-6", 100) is None
+
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+    with pytest.raises(ValueError):
+        parse_range("bytes=20-10", 100)
+
+
+def test_serve_file(server: CastServer, tmp_path: Path):
+    content = os.urandom(100000)
+    song = tmp_path.joinpath("song.flac")
+    song.write_bytes(content)
+    token = server.register(song)
+
+    status, headers, body = request(server, f"/s/{token}")
+    assert status == 200
+    assert body == content
+    assert headers["Content-Length"] == "100000"
+    assert headers["Content-Type"] == "audio/flac"
+    assert headers["Accept-Ranges"] == "bytes"
+
+    status, headers, body = request(server, f"/s/{token}", {"Range": "bytes=1000-1999"})
+    assert status == 206
+    assert body == content[1000:2000]
+    assert headers["Content-Range"] == "bytes 1000-1999/100000"
+
+    status, headers, _ = request(server, f"/s/{token}", {"Range": "bytes=200000-"})
+    assert status == 416
+    assert headers["Content-Range"] == "bytes */100000"
+
+    status, _, _ = request(server, "/s/invalid")
+    assert status == 401
+
+    # The metrics are recorded after the responses are sent.
+    wait_until(lambda: server.active_requests == 0)
+    assert server.stats["requests"] == 4
+    assert server.stats["partial_requests"] == 1
+    assert server.stats["bytes_sent"] == 101000
+
+
+def test_concurrent_range_requests(server: CastServer, tmp_path: Path):
+    content = os.urandom(1 << 20)
+    song = tmp_path.joinpath("song.mp3")
+    song.write_bytes(content)
+    token = server.register(song)
+
+    def get_chunk(i: int) -> bytes:
+        headers = {"Range": f"bytes={i << 16}-{((i + 1) << 16) - 1}"}
+        status, _, body = request(server, f"/s/{token}", headers)
+        assert status == 206
+        return body
+
+    with ThreadPoolExecutor(8) as executor:
+        assert b"".join(executor.map(get_chunk, range(16))) == content
+    wait_until(lambda: server.active_requests == 0)
+    assert server.stats["bytes_sent"] == len(content)
+    assert server.throughput() > 0
+
+
+def test_token_registry(server: CastServer, tmp_path: Path):
+    song = tmp_path.joinpath("song.mp3")
+    song.write_bytes(b"song")
+
+    tokens = [server.register(song) for _ in range(server.max_tokens + 1)]
+    assert len(set(tokens)) == len(tokens)
+    # The oldest token is no longer valid.
+    assert request(server, f"/s/{tokens[0]}")[0] == 401
+    assert request(server, f"/s/{tokens[-1]}")[2] == b"song"
+
+
+def test_tee_download(server: CastServer, tmp_path: Path):
+    content = os.urandom(1 << 20)
+    song = tmp_path.joinpath("song.flac")
+    song.write_bytes(content)
+    upstream = CastServer("127.0.0.1", 0)
+    upstream.start()
+    uri = f"http://127.0.0.1:{upstream.port}/s/{upstream.register(song)}"
+
+    results: List[bool] = []
+    filename = tmp_path.joinpath("tee")
+    token = server.register_tee(uri, filename, results.append)
+
+    # Ranges are served even if they haven't been downloaded when they're requested.
+    status, headers, body = request(server, f"/s/{token}", {"Range": "bytes=-1000"})
+    assert status == 206
+    assert body == content[-1000:]
+    assert headers["Content-Type"] == "audio/flac"
+
+    status, _, body = request(server, f"/s/{token}")
+    assert status == 200
+    assert body == content
+
+    # The file was only downloaded once.
+    assert upstream.stats["requests"] == 1
+    wait_until(lambda: results == [True])
+    assert filename.read_bytes() == content
+    upstream.shutdown()
+
+    # The file is deleted once its token expires.
+    for _ in range(server.max_tokens):
+        server.register(song)
+    assert not filename.exists()
+
+    # Failed downloads are reported.
+    token = server.register_tee(uri, tmp_path.joinpath("tee2"), results.append)
+    assert request(server, f"/s/{token}")[0] == 502
+    wait_until(lambda: results == [True, False])
+
+
+def test_range_requests_use_sendfile(
+    server: CastServer, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    content = os.urandom(100000)
+    song = tmp_path.joinpath("song.mp3")
+    song.write_bytes(content)
+    token = server.register(song)
+
+    calls: List[Tuple[int, Optional[int]]] = []
+    original_sendfile = socket.socket.sendfile
+
+    def sendfile(
+        self: socket.socket,
+        file: BinaryIO,
+        offset: int = 0,
+        count: Optional[int] = None,
+    ) -> int:
+        calls.append((offset, count))
+        return original_sendfile(self, file, offset, count)
+
+    monkeypatch.setattr(socket.socket, "sendfile", sendfile)
+
+    # Each range is sent straight from the file, without reading it into memory first.
+    for header, expected in (
+        ("bytes=0-", content),
+        ("bytes=5000-5999", content[5000:6000]),
+        ("bytes=-100", content[-100:]),
+    ):
+        status, headers, body = request(server, f"/s/{token}", {"Range": header})
+        assert status == 206
+        assert body == expected
+        assert headers["Content-Length"] == str(len(expected))
+    assert calls == [(0, 100000), (5000, 1000), (99900, 100)]
+
+
+def test_truncated_file(server: CastServer, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    song = tmp_path.joinpath("song.mp3")
+    song.write_bytes(os.urandom(100000))
+    token = server.register(song)
+
+    original_sendfile = socket.socket.sendfile
+
+    def sendfile(
+        self: socket.socket,
+        file: BinaryIO,
+        offset: int = 0,
+        count: Optional[int] = None,
+    ) -> int:
+        # The file is truncated after the headers were sent.
+        os.truncate(song, 50000)
+        return original_sendfile(self, file, offset, count)
+
+    monkeypatch.setattr(socket.socket, "sendfile", sendfile)
+
+    # The response ends early instead of waiting forever for the missing bytes.
+    connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+    connection.request("GET", f"/s/{token}")
+    response = connection.getresponse()
+    assert response.status == 200
+    try:
+        response.read()
+        assert 0, "DID NOT raise IncompleteRead"
+    except http.client.IncompleteRead as e:
+        assert len(e.partial) == 50000
+    connection.close()
+    wait_until(lambda: server.active_requests == 0)
+    assert server.stats["bytes_sent"] == 50000
+
+
+class SlowUpstreamHandler(BaseHTTPRequestHandler):
+    """
+    Serves ``content``. Full requests stall after the first chunk until ``release`` is
+    set, but ``Range`` requests are answered straight away.
+    """
+
+    content = os.urandom(4 << 20)
+    release = threading.Event()
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def do_GET(self):
+        byte_range = parse_range(self.headers.get("Range"), len(self.content))
+        if byte_range:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(self.content)}")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            self.wfile.write(self.content[start : end + 1])
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.content)))
+        self.end_headers()
+        self.wfile.write(self.content[: TeeDownload.chunk_size])
+        self.wfile.flush()
+        self.release.wait(10)
+        self.wfile.write(self.content[TeeDownload.chunk_size :])
+
+
+def test_tee_download_seek_ahead(server: CastServer, tmp_path: Path):
+    upstream = ThreadingHTTPServer(("127.0.0.1", 0), SlowUpstreamHandler)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    content = SlowUpstreamHandler.content
+    SlowUpstreamHandler.release.clear()
+
+    results: List[bool] = []
+    token = server.register_tee(
+        f"http://127.0.0.1:{upstream.server_address[1]}/song",
+        tmp_path.joinpath("tee"),
+        results.append,
+    )
+
+    # A range far past the downloaded bytes is requested from the upstream server
+    # instead of waiting for the download to reach it.
+    status, _, body = request(server, f"/s/{token}", {"Range": "bytes=3000000-3099999"})
+    assert status == 206
+    assert body == content[3000000:3100000]
+    assert server.stats["upstream_requests"] == 1
+
+    # Ranges close to the downloaded bytes wait for the download.
+    SlowUpstreamHandler.release.set()
+    status, _, body = request(server, f"/s/{token}", {"Range": "bytes=1000-1999"})
+    assert body == content[1000:2000]
+    wait_until(lambda: results == [True])
+    assert server.stats["upstream_requests"] == 1
+    upstream.shutdown()
+    upstream.server_close()
@@ -0,0 +1,16 @@
+import pytest
+
+
+class FakeClock:
+    """A clock for the player helpers which only moves when ``now`` is set."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
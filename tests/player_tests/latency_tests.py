@@ -0,0 +1,80 @@
+from typing import List
+
+from conftest import FakeClock
+
+from sublime_music.players.latency import RollingHistogram, StartLatencyTracker
+
+
+def test_rolling_histogram():
+    histogram = RollingHistogram(bounds=(1, 2), window=4)
+    assert histogram.percentile(50) is None
+    assert str(histogram) == "no samples"
+
+    for sample in (0.5, 1.5, 1.5, 3):
+        histogram.record(sample)
+    assert histogram.counts() == [1, 2, 1]
+    assert histogram.percentile(50) == 1.5
+    assert histogram.percentile(100) == 3
+
+    # Only the most recent samples are kept.
+    histogram.record(0.1)
+    assert len(histogram) == 4
+    assert histogram.counts() == [1, 2, 1]
+    assert "n=4" in str(histogram)
+
+
+def test_start_latency_tracker(clock: FakeClock):
+    tracker = StartLatencyTracker(clock)
+
+    # There is no trace waiting for its first audio.
+    assert tracker.on_time_pos(None) is None
+
+    tracker.start(1)
+    for stage, now in (("details", 0.5), ("uri", 0.75), ("loadfile", 1.0)):
+        clock.now = now
+        tracker.mark(1, stage)
+    # Marks for superseded songs are ignored.
+    tracker.mark(0, "uri")
+
+    clock.now = 3.0
+    assert tracker.on_time_pos(0) == 1
+    assert tracker.histograms["details"].percentile(50) == 0.5
+    assert tracker.histograms["uri"].percentile(50) == 0.25
+    assert tracker.histograms["first_audio"].percentile(50) == 2
+    assert tracker.histograms["total"].percentile(50) == 3
+
+    # The trace is finished, so later positions aren't counted.
+    assert tracker.on_time_pos(1) is None
+    assert len(tracker.histograms["total"]) == 1
+
+    # Positions reported before the song is loaded belong to the previous song.
+    tracker.start(2)
+    assert tracker.on_time_pos(2) is None
+    tracker.mark(2, "details")
+    tracker.mark(2, "loadfile")
+    # So do the positions which are reported until the player unloads the previous song.
+    assert tracker.on_time_pos(3) is None
+    assert tracker.on_time_pos(None) is None
+    clock.now = 4.0
+    assert tracker.on_time_pos(0) == 2
+    assert tracker.histograms["total"].percentile(0) == 1
+    assert "total: p50 1.00s" in tracker.summary()
+
+
+def test_deferred_work(clock: FakeClock):
+    tracker = StartLatencyTracker(clock)
+    calls: List[str] = []
+
+    tracker.start(1)
+    tracker.defer(1, lambda: calls.append("one"))
+    tracker.defer(1, lambda: calls.append("two"))
+    for function in tracker.take_deferred(1):
+        function()
+    assert calls == ["one", "two"]
+    # Deferred work is only returned once.
+    assert tracker.take_deferred(1) == []
+
+    # Starting a new song drops the work deferred for the previous one.
+    tracker.defer(1, lambda: calls.append("three"))
+    tracker.start(2)
+    assert tracker.take_deferred(1) == []
@@ -1,7 +1,16 @@
+import http.client
+import os
+import time
 from datetime import timedelta
 from pathlib import Path
+from typing import List, Tuple
+from urllib.parse import urlparse
 
+import pytest
+
+from sublime_music.adapters import AdapterManager
 from sublime_music.adapters.api_objects import Song
+from sublime_music.players.cast_server import CastServer
 from sublime_music.players.mpv import MPVPlayer
 
 # from time import sleep
@@ -79,3 +88,97 @@ def test_play():
     # Pause so that it doesn't keep playing while testing
     mpv_player.pause()
     mpv_player.shutdown()
+
+
+def test_play_song_without_duration(tmp_path: Path):
+    empty_fn = lambda *_, **__: None
+    mpv_player = MPVPlayer(empty_fn, empty_fn, empty_fn, empty_fn, {"Replay Gain": "Disabled"})
+
+    # Songs don't have to have a duration.
+    song_path = tmp_path.joinpath("song.mp3")
+    song_path.write_bytes(b"")
+    mpv_player.play_media(str(song_path), timedelta(0), Song())
+    assert mpv_player.song_loaded
+    mpv_player.shutdown()
+
+
+@pytest.fixture
+def upstream(tmp_path: Path):
+    song_path = tmp_path.joinpath("song.mp3")
+    song_path.write_bytes(os.urandom(100000))
+    server = CastServer("127.0.0.1", 0)
+    server.start()
+    yield f"http://127.0.0.1:{server.port}/s/{server.register(song_path)}", song_path
+    server.shutdown()
+
+
+def streamed_song() -> Song:
+    song = Song()
+    song.id = "1"
+    return song
+
+
+def test_stream_proxy(upstream: Tuple[str, Path], tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    uri, song_path = upstream
+    results: List[bool] = []
+    monkeypatch.setattr(
+        AdapterManager,
+        "start_song_file_tee",
+        lambda song_id: (uri, tmp_path.joinpath(f"tee-{song_id}"), results.append),
+    )
+    empty_fn = lambda *_, **__: None
+    mpv_player = MPVPlayer(empty_fn, empty_fn, empty_fn, empty_fn, {"Replay Gain": "Disabled"})
+
+    # Local files aren't proxied, and the proxy isn't started until it's needed.
+    assert mpv_player._proxy_stream(str(song_path), streamed_song()) == str(song_path)
+    assert mpv_player.stream_proxy is None
+
+    # Streams are registered with the proxy, which downloads them into the cache.
+    proxied_uri = mpv_player._proxy_stream(uri, streamed_song())
+    proxy = mpv_player.stream_proxy
+    assert proxy is not None
+    assert urlparse(proxied_uri).netloc == f"127.0.0.1:{proxy.port}"
+
+    connection = http.client.HTTPConnection("127.0.0.1", proxy.port)
+    connection.request("GET", urlparse(proxied_uri).path)
+    assert connection.getresponse().read() == song_path.read_bytes()
+    connection.close()
+    for _ in range(50):
+        if results:
+            break
+        time.sleep(0.1)
+    assert results == [True]
+
+    # The proxy is reused for the next stream.
+    mpv_player._proxy_stream(uri, streamed_song())
+    assert mpv_player.stream_proxy is proxy
+    mpv_player.shutdown()
+
+
+def test_stream_proxy_fallback(
+    upstream: Tuple[str, Path], tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    uri, _ = upstream
+    empty_fn = lambda *_, **__: None
+    mpv_player = MPVPlayer(empty_fn, empty_fn, empty_fn, empty_fn, {"Replay Gain": "Disabled"})
+
+    # The stream is played directly if the song can't be downloaded.
+    monkeypatch.setattr(AdapterManager, "start_song_file_tee", lambda song_id: None)
+    assert mpv_player._proxy_stream(uri, streamed_song()) == uri
+    assert mpv_player.stream_proxy is None
+
+    # Or if the proxy fails, in which case the download is released.
+    results: List[bool] = []
+    monkeypatch.setattr(
+        AdapterManager,
+        "start_song_file_tee",
+        lambda song_id: (uri, tmp_path.joinpath("tee"), results.append),
+    )
+
+    def register_tee(*args):
+        raise OSError("No more files")
+
+    monkeypatch.setattr(CastServer, "register_tee", register_tee)
+    assert mpv_player._proxy_stream(uri, streamed_song()) == uri
+    assert results == [False]
+    mpv_player.shutdown()
@@ -0,0 +1,82 @@
+from typing import Callable, List, Tuple
+
+from conftest import FakeClock
+
+from sublime_music.players.progress import ProgressSampler
+
+
+def test_progress_sampler(clock: FakeClock):
+    scheduled: List[Tuple[float, Callable[[], None]]] = []
+    updates: List[float] = []
+    sampler = ProgressSampler(
+        lambda delay, update: scheduled.append((clock.now + delay, update)),
+        lambda: updates.append(clock.now),
+        interval=0.5,
+        clock=clock,
+    )
+
+    def run_scheduled():
+        clock.now, update = scheduled.pop(0)
+        update()
+
+    # The first notification is emitted straight away.
+    sampler.notify()
+    assert [due for due, _ in scheduled] == [0]
+    run_scheduled()
+    assert updates == [0]
+
+    # Notifications within the interval are merged into one update at the end of it.
+    for _ in range(10):
+        clock.now += 0.01
+        sampler.notify()
+    assert len(scheduled) == 1
+    assert scheduled[0][0] == 0.5
+    run_scheduled()
+    assert updates == [0, 0.5]
+
+    # After a quiet period, the next notification is emitted straight away again.
+    clock.now = 10
+    sampler.notify()
+    assert scheduled[0][0] == 10
+    run_scheduled()
+    assert updates == [0, 0.5, 10]
+
+    assert sampler.stats["notifications"] == 12
+    assert sampler.stats["updates"] == 3
+
+
+def test_progress_sampler_idle(clock: FakeClock):
+    scheduled: List[Tuple[float, Callable[[], None]]] = []
+    updates: List[float] = []
+    sampler = ProgressSampler(
+        lambda delay, update: scheduled.append((clock.now + delay, update)),
+        lambda: updates.append(clock.now),
+        interval=0.5,
+        idle_interval=5,
+        clock=clock,
+    )
+
+    def run_scheduled():
+        clock.now, update = scheduled.pop(0)
+        update()
+
+    sampler.notify()
+    run_scheduled()
+
+    # While idle, the updates are spaced out further.
+    sampler.set_idle(True)
+    clock.now = 0.1
+    sampler.notify()
+    assert [due for due, _ in scheduled] == [5]
+
+    # Leaving the idle state replaces the pending update with one within the interval.
+    clock.now = 1
+    sampler.set_idle(False)
+    assert [due for due, _ in scheduled] == [5, 1]
+    scheduled.reverse()
+    run_scheduled()
+    assert updates == [0, 1]
+    # The replaced update doesn't emit anything.
+    run_scheduled()
+    assert updates == [0, 1]
+    assert sampler.stats["updates"] == 2